@@ -0,0 +1,292 @@
+"""Micro-benchmarks for the pure functions that run on every event or config refresh.
+
+    python bench/micro_bench.py                  # run and compare against bench/baseline.json
+    python bench/micro_bench.py --save           # refresh bench/baseline.json
+    python bench/micro_bench.py --only usernotes # run the benchmarks whose name contains "usernotes"
+
+Fixtures are generated from a fixed seed so runs are reproducible. Timings are per call, in seconds;
+the best of several repeats is reported alongside the median.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+
+import yaml
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+sys.path.insert(0, REPO_DIR)
+
+
+# --- Fixture generators -------------------------------------------------------------------------
+
+def random_text(rng, words):
+    return " ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(words))
+
+
+def template_id(rng):
+    return "-".join("".join(rng.choices("0123456789abcdef", k=length)) for length in (8, 4, 4, 4, 12))
+
+
+def make_yaml_config(num_flairs, seed=1):
+    # A flair_helper wiki page in the original bot's YAML format with every action section populated
+    rng = random.Random(seed)
+    flair_ids = [template_id(rng) for _ in range(num_flairs)]
+    config = {
+        'header': "Hi /u/{{author}}, thanks for posting to /r/{{subreddit}}.\\nUnfortunately your post was removed:",
+        'footer': "Please read the rules before posting again. Mod: {{mod}}",
+        'usernote_type_name': 'abusewarn',
+        'removal_comment_type': 'public_as_subreddit',
+        'ignore_same_flair_seconds': 60,
+        'flairs': {flair_id: f"Rule {index}: {random_text(rng, 60)}\\n\\nPosted {{{{created_iso}}}}" for index, flair_id in enumerate(flair_ids)},
+        'approve': {}, 'remove': {}, 'lock_post': {}, 'comment': {}, 'usernote': {}, 'bans': {}, 'ban_message': {}, 'ban_note': {}, 'ban': {},
+        'set_author_flair_text': {}, 'send_to_webhook': [],
+    }
+    for index, flair_id in enumerate(flair_ids):
+        if index % 5 == 0:
+            config['approve'][flair_id] = True
+            continue
+        config['remove'][flair_id] = True
+        config['lock_post'][flair_id] = True
+        config['comment'][flair_id] = True
+        config['usernote'][flair_id] = f"Rule {index} removal by {{{{mod}}}}"
+        config['ban'][flair_id] = f"Rule {index} violation: {random_text(rng, 8)}"
+        if index % 3 == 0:
+            config['bans'][flair_id] = "1,3,7,30,perm" if index % 2 else 7
+            config['ban_message'][flair_id] = f"You have been {{{{ban_duration}}}} for rule {index}."
+            config['ban_note'][flair_id] = f"Rule {index} ban #{index}"
+        if index % 4 == 0:
+            config['set_author_flair_text'][flair_id] = "Warned {{time_iso}}"
+        if index % 7 == 0:
+            config['send_to_webhook'].append(flair_id)
+    return yaml.safe_dump(config, width=1000), flair_ids
+
+
+def make_usernotes(num_users, notes_per_user=3, seed=1):
+    # Decompressed Toolbox usernotes ("ver": 6 blob contents)
+    rng = random.Random(seed)
+    now = int(time.time())
+    notes = {}
+    for user in range(num_users):
+        notes[f"user_{user}_{rng.randint(0, 10 ** 6)}"] = {"ns": [
+            {"n": random_text(rng, rng.randint(2, 12)), "t": now - rng.randint(0, 10 ** 8), "m": rng.randint(0, 40),
+             "l": f"l,{rng.randint(0, 36 ** 6):x}", "w": rng.randint(0, 6)}
+            for _ in range(rng.randint(1, notes_per_user * 2 - 1))
+        ]}
+    return notes
+
+
+def make_placeholders():
+    return {
+        'time_unix': 1700000000, 'time_iso': '2023-11-14T22:13:20', 'time_custom': '',
+        'created_unix': 1699990000, 'created_iso': '2023-11-14T19:26:40', 'created_custom': '',
+        'author': 'some_author', 'subreddit': 'example', 'body': random_text(random.Random(1), 200), 'title': 'A post title',
+        'id': 'abc123', 'permalink': '/r/example/comments/abc123/a_post_title/', 'url': '/r/example/comments/abc123/a_post_title/',
+        'domain': 'self.example', 'link': 'https://www.reddit.com/r/example/comments/abc123/', 'kind': 'submission', 'mod': 'ExampleMod',
+        'author_flair_text': '', 'author_flair_css_class': '', 'author_flair_template_id': '', 'link_flair_text': 'Rule 1',
+        'link_flair_css_class': '', 'link_flair_template_id': 'abcd', 'author_id': 't2_abc', 'subreddit_id': 't5_abc',
+    }
+
+
+# --- Benchmarks ---------------------------------------------------------------------------------
+# Each entry builds its fixture once and returns the zero-argument callable that is timed.
+
+def bench_convert_yaml_to_json(fh, num_flairs):
+    yaml_text, _ = make_yaml_config(num_flairs)
+    yaml_config = yaml.safe_load(yaml_text)
+    return lambda: fh.convert_yaml_to_json(yaml_config)
+
+
+def bench_yaml_load(fh, num_flairs):
+    yaml_text, _ = make_yaml_config(num_flairs)
+    return lambda: fh.load_yaml(yaml_text)
+
+
+def bench_correct_config(fh, num_flairs):
+    yaml_text, _ = make_yaml_config(num_flairs)
+    with contextlib.redirect_stdout(io.StringIO()):
+        config = fh.convert_yaml_to_json(yaml.safe_load(yaml_text))
+    return lambda: fh.correct_config(config)
+
+
+def bench_decompress_notes(fh, num_users):
+    blob = fh.compress_notes(make_usernotes(num_users))
+    return lambda: fh.decompress_notes(blob)
+
+
+def bench_compress_notes(fh, num_users):
+    notes = make_usernotes(num_users)
+    return lambda: fh.compress_notes(notes)
+
+
+def bench_add_usernote_round_trip(fh, num_users):
+    # What update_usernotes does per note: decompress, append, recompress
+    blob = fh.compress_notes(make_usernotes(num_users))
+
+    def run():
+        notes = fh.decompress_notes(blob)
+        fh.add_usernote(notes, 'some_author', 'Rule 1 removal', '/r/example/comments/abc123/a_post_title/', 0, 0)
+        return fh.compress_notes(notes)
+    return run
+
+
+def bench_usernote_lookup(fh, num_users):
+    # What get_usernotes does for an escalating ban: one user's FH-Ban- notes from the usernotes page (user halfway in)
+    notes = make_usernotes(num_users)
+    username = list(notes)[num_users // 2]
+    notes[username]["ns"].append({"n": "[FH] FH-Ban-7", "t": 0, "m": 0, "l": "l,abc123", "w": 0})
+    content = json.dumps({"ver": 6, "constants": {"users": [], "warnings": []}, "blob": fh.compress_notes(notes)})
+    return lambda: fh.read_usernote_ban_values(content, username)
+
+
+def bench_replace_placeholders(fh, num_flairs):
+    yaml_text, _ = make_yaml_config(num_flairs)
+    with contextlib.redirect_stdout(io.StringIO()):
+        config = fh.convert_yaml_to_json(yaml.safe_load(yaml_text))
+    general = config[0]['GeneralConfiguration']
+    body = config[1]['comment']['body']
+    placeholders = make_placeholders()
+
+    def run():
+        fh.replace_placeholders(general['header'], placeholders)
+        fh.replace_placeholders(general['footer'], placeholders)
+        return fh.replace_placeholders(body, placeholders)
+    return run
+
+
+def bench_ban_duration(fh, previous_notes):
+    durations = [str(days) for days in (1, 3, 7, 14, 30)] * (previous_notes // 5 + 1)
+
+    def run():
+        return fh.select_next_ban_duration(durations[:previous_notes], fh.parse_ban_duration_list("1,3,7,14,30,60,perm"))
+    return run
+
+
+def bench_find_flair_details(fh, num_flairs):
+    # Worst case: the flaired template is the last entry of the config
+    yaml_text, flair_ids = make_yaml_config(num_flairs)
+    with contextlib.redirect_stdout(io.StringIO()):
+        config = fh.convert_yaml_to_json(yaml.safe_load(yaml_text))
+    return lambda: fh.find_flair_details(config, flair_ids[-1])
+
+
+def bench_plan_flair_actions(fh, num_flairs):
+    # The CPU side of deciding a flair's actions: template lookup, placeholders, rendering and ban escalation
+    yaml_text, flair_ids = make_yaml_config(num_flairs)
+    with contextlib.redirect_stdout(io.StringIO()):
+        config = fh.correct_config(fh.convert_yaml_to_json(yaml.safe_load(yaml_text)))
+    placeholders = make_placeholders()
+    submission = {field: placeholders.get(field) for field in fh.SUBMISSION_SNAPSHOT_FIELDS}
+    submission.update(subreddit='example', selftext=placeholders['body'], created_utc=placeholders['created_unix'],
+                      removed=False, locked=False, spoiler=False, link_flair_template_id=flair_ids[-3])
+    author = {'name': 'some_author', 'id': 't2_abc', 'is_suspended': False, 'previous_ban_durations': ['1', '3']}
+    return lambda: fh.plan_flair_actions(config, submission, author, 'ExampleMod')
+
+
+BENCHMARKS = {
+    'yaml_load[50 flairs]': (bench_yaml_load, 50),
+    'yaml_load[500 flairs]': (bench_yaml_load, 500),
+    'convert_yaml_to_json[50 flairs]': (bench_convert_yaml_to_json, 50),
+    'convert_yaml_to_json[500 flairs]': (bench_convert_yaml_to_json, 500),
+    'correct_config[500 flairs]': (bench_correct_config, 500),
+    'decompress_notes[10k users]': (bench_decompress_notes, 10000),
+    'decompress_notes[100k users]': (bench_decompress_notes, 100000),
+    'compress_notes[100k users]': (bench_compress_notes, 100000),
+    'add_usernote_round_trip[100k users]': (bench_add_usernote_round_trip, 100000),
+    'usernote_lookup[100k users]': (bench_usernote_lookup, 100000),
+    'replace_placeholders': (bench_replace_placeholders, 5),
+    'select_next_ban_duration[20 notes]': (bench_ban_duration, 20),
+    'find_flair_details[50 flairs]': (bench_find_flair_details, 50),
+    'find_flair_details[500 flairs]': (bench_find_flair_details, 500),
+    'plan_flair_actions[50 flairs]': (bench_plan_flair_actions, 50),
+    'plan_flair_actions[500 flairs]': (bench_plan_flair_actions, 500),
+}
+
+
+def time_callable(func, repeat, min_time):
+    # Calibrate the loop count so each repeat takes at least min_time, then keep per-call timings
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+
+    timings = [elapsed / number]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - started) / number)
+    return {'best': min(timings), 'median': statistics.median(timings), 'loops': number, 'repeat': repeat}
+
+
+def run_benchmarks(fh, names, repeat, min_time):
+    results = {}
+    for name in names:
+        setup, size = BENCHMARKS[name]
+        func = setup(fh, size)
+        with contextlib.redirect_stdout(io.StringIO()):  # convert_yaml_to_json prints on every call
+            results[name] = time_callable(func, repeat, min_time)
+        print(f"{name:<40} best {results[name]['best'] * 1000:10.4f} ms  median {results[name]['median'] * 1000:10.4f} ms", file=sys.stderr)
+    return results
+
+
+def compare_results(results, baseline):
+    for name, result in results.items():
+        previous = baseline['benchmarks'].get(name)
+        if previous is None:
+            continue
+        change = (result['best'] - previous['best']) / previous['best'] * 100
+        print(f"{name:<40} {previous['best'] * 1000:10.4f} ms -> {result['best'] * 1000:10.4f} ms ({change:+.1f}%)", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for Flair Helper 2's pure hot functions")
+    parser.add_argument('--only', action='append', help="Run benchmarks whose name contains this text (repeatable)")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help="Minimum seconds per repeat")
+    parser.add_argument('--save', action='store_true', help=f"Write the results to {os.path.relpath(BASELINE_FILENAME, REPO_DIR)}")
+    parser.add_argument('--baseline', default=BASELINE_FILENAME, help="Baseline file to compare against")
+    parser.add_argument('--output', help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    # Import from a scratch directory so the module's logs/ directory is not created in the checkout
+    os.chdir(tempfile.gettempdir())
+    import flair_helper2_async as fh
+    os.chdir(REPO_DIR)
+
+    names = [name for name in BENCHMARKS if not args.only or any(text in name for text in args.only)]
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'benchmarks': run_benchmarks(fh, names, args.repeat, args.min_time),
+    }
+
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline) as f:
+            compare_results(results['benchmarks'], json.load(f))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save:
+        with open(BASELINE_FILENAME, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
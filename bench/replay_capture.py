@@ -0,0 +1,218 @@
+"""Replay a mod log capture recorded with `flair_helper2_async.py --record FILE` against the current code.
+
+    python bench/replay_capture.py weekend.ndjson.gz --speed 10
+    python bench/replay_capture.py weekend.ndjson.gz --speed max --output replay.json
+
+Captured mod log entries are fed through handle_mod_log_entry on a virtual clock (1x, 10x, ... or "max" for no
+waiting) while process_flair_actions works the queue as it does in production. Every Reddit request is answered
+from the captured responses by a local server, so nothing leaves the machine. The mutating calls made per
+submission (the action plan) are compared with the ones captured in production; the exit status is 1 if any
+plan differs.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import asyncpraw
+from aiohttp import web
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# Request fields that identify what an action did, as opposed to free text that legitimately changes between runs
+PLAN_DATA_KEYS = ('id', 'thing_id', 'name', 'duration', 'flair_template_id', 'state', 'how', 'type', 'sticky', 'spam', 'page')
+
+
+class VirtualClock:
+    # Maps wall time onto the capture's timeline; with speed None ("max") it jumps straight to each entry's time
+
+    def __init__(self, start, speed):
+        self.start = start
+        self.speed = speed
+        self.now = start
+        self.real_start = time.monotonic()
+
+    def __call__(self):
+        if self.speed is None:
+            return self.now
+        return self.start + (time.monotonic() - self.real_start) * self.speed
+
+    async def wait_until(self, timestamp):
+        if self.speed is None:
+            self.now = max(self.now, timestamp)
+            return
+        delay = (timestamp - self()) / self.speed
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class ReplayServer:
+    # Answers each request with the captured responses for the same method, path and query, in captured order
+
+    def __init__(self, records):
+        self.responses = collections.defaultdict(collections.deque)
+        for record in records:
+            if record['type'] == 'response':
+                self.responses[self.key(record['method'], record['path'], record['params'])].append((record['status'], record['body']))
+        self.unmatched = collections.Counter()
+
+    @staticmethod
+    def key(method, path, params):
+        return method.upper(), path.rstrip('/'), tuple(sorted((str(name), str(value)) for name, value in params.items()))
+
+    async def handle(self, request):
+        if request.path.endswith('/access_token'):
+            return web.json_response({"access_token": "replay", "token_type": "bearer", "expires_in": 86400, "scope": "*"})
+
+        queue = self.responses.get(self.key(request.method, request.path, dict(request.query)))
+        if not queue:
+            self.unmatched[f"{request.method} {request.path}"] += 1
+            return web.json_response({"message": "Not Found", "error": 404}, status=404)
+        status, body = queue.popleft() if len(queue) > 1 else queue[0]  # The last response keeps answering repeats
+        return web.Response(status=status, text=body, content_type='application/json')
+
+    async def start(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/{tail:.*}", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        return site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+def action_plans(records):
+    # submission id -> sorted mutating calls, each reduced to method, path and identifying fields
+    plans = collections.defaultdict(list)
+    for record in records:
+        if record['type'] != 'response' or record['method'] == 'GET' or not record.get('submission_id'):
+            continue
+        data = record.get('data') or {}
+        plans[record['submission_id']].append(" ".join([record['method'], record['path'].rstrip('/')] + [f"{key}={data[key]}" for key in PLAN_DATA_KEYS if key in data]))
+    return {submission_id: sorted(calls) for submission_id, calls in plans.items()}
+
+
+def compare_plans(recorded, replayed):
+    different = []
+    for submission_id in sorted(set(recorded) & set(replayed)):
+        if recorded[submission_id] != replayed[submission_id]:
+            different.append({'submission_id': submission_id, 'recorded': recorded[submission_id], 'replayed': replayed[submission_id]})
+    return {
+        'matching': len(set(recorded) & set(replayed)) - len(different),
+        'different': different,
+        'missing_in_replay': sorted(set(recorded) - set(replayed)),
+        'extra_in_replay': sorted(set(replayed) - set(recorded)),
+    }
+
+
+async def replay(fh, records, args):
+    header = next((record for record in records if record['type'] == 'header'), {})
+    bot_username = next(iter((header.get('accounts') or {}).values()), args.bot_username)
+    timeline = [record for record in records if record['type'] in ('modlog', 'config')]
+    first_entry = next((record for record in timeline if record['type'] == 'modlog'), None)
+    if first_entry is None:
+        raise SystemExit("The capture contains no mod log entries")
+
+    server = ReplayServer(records)
+    port = await server.start()
+    url = f"http://127.0.0.1:{port}"
+    reddit = asyncpraw.Reddit(client_id='replay', client_secret='replay', refresh_token='replay', user_agent='FlairHelper2 replay',
+                              oauth_url=url, reddit_url=url, short_url=url, check_for_updates=False,
+                              requestor_class=fh.InstrumentedRequestor, requestor_kwargs={'account': 'replay'})
+    fh.reddit_clients['replay'] = reddit
+    fh.account_usernames['replay'] = bot_username
+
+    clock = VirtualClock(first_entry['t'], None if args.speed == 'max' else float(args.speed))
+    fh.clock = clock
+    fh.create_actions_database()
+    fh.create_configs_database()
+
+    # The replay records its own capture so its action plan is read exactly like the production one
+    replay_capture_filename = os.path.join(os.getcwd(), 'replay_capture.ndjson.gz')
+    fh.start_capture(replay_capture_filename)
+
+    worker = asyncio.create_task(fh.process_flair_actions(reddit, args.max_concurrency))
+    events = 0
+    started = time.perf_counter()
+    try:
+        for record in timeline:
+            await clock.wait_until(record['t'])
+            if record['type'] == 'config':
+                if record['config'] is not None:
+                    await fh.cache_config(record['subreddit'], record['config'])
+                continue
+            await fh.handle_mod_log_entry(reddit, bot_username, asyncpraw.models.ModAction(reddit, _data=dict(record['entry'])))
+            events += 1
+        fed_seconds = time.perf_counter() - started
+
+        deadline = time.monotonic() + args.timeout
+        while fh.get_pending_submission_ids_from_database() and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+        drained_seconds = time.perf_counter() - started
+    finally:
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+        fh.close_capture()
+        await reddit.close()
+        await server.stop()
+
+    recorded_plans = action_plans(records)
+    replayed_plans = action_plans(list(fh.read_capture(replay_capture_filename)))
+    return {
+        'speed': args.speed,
+        'events': events,
+        'captured_span_seconds': timeline[-1]['t'] - first_entry['t'],
+        'feed_seconds': round(fed_seconds, 3),
+        'elapsed_seconds': round(drained_seconds, 3),
+        'events_per_second': round(events / drained_seconds, 3) if drained_seconds else None,
+        'pending_after_timeout': len(fh.get_pending_submission_ids_from_database()),
+        'unmatched_requests': dict(server.unmatched),
+        'plans': compare_plans(recorded_plans, replayed_plans),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a Flair Helper 2 mod log capture offline and compare action plans")
+    parser.add_argument('capture', help="Capture file written by flair_helper2_async.py --record")
+    parser.add_argument('--speed', default='1', help="Replay speed multiplier (1, 10, ...) or 'max' to skip all waiting")
+    parser.add_argument('--max-concurrency', type=int, default=2, help="process_flair_actions concurrency (bot_main uses 2)")
+    parser.add_argument('--timeout', type=float, default=300, help="Seconds to wait for the actions queue to drain after the last entry")
+    parser.add_argument('--bot-username', default='FlairHelperBot', help="Bot username if the capture header does not record one")
+    parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+    if args.speed != 'max':
+        float(args.speed)  # Fail early on a typo
+
+    capture_filename = os.path.abspath(args.capture)
+    workdir = tempfile.mkdtemp(prefix='fh2_replay_')
+    os.chdir(workdir)  # Databases, logs/ and the replay's own capture stay out of the checkout
+    try:
+        import flair_helper2_async as fh
+        records = list(fh.read_capture(capture_filename))
+        report = asyncio.run(replay(fh, records, args))
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(dict(report, capture=capture_filename), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    plans = report['plans']
+    sys.exit(1 if plans['different'] or plans['missing_in_replay'] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""End-to-end benchmark for Flair Helper 2.
+
+Runs the real mod log -> actions queue -> process_flair_assignment pipeline against reddit_emulator.py
+and prints machine-readable JSON so results can be compared between branches:
+
+    python bench/run_bench.py --output results.json
+    python bench/run_bench.py --scenario burst_100 --compare results.json
+
+The emulator runs in its own process so its CPU and memory are not counted against the bot.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+import asyncpraw
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EMULATOR = os.path.join(REPO_DIR, 'reddit_emulator.py')
+sys.path.insert(0, REPO_DIR)
+
+# Each scenario: emulator population plus a traffic shape. "trickle" sends events at a steady rate for the
+# duration, "burst" flairs every event at once.
+SCENARIOS = {
+    'trickle_10': {'subreddits': 10, 'templates': 5, 'traffic': 'trickle', 'rate': 2, 'events': 40},
+    'trickle_100': {'subreddits': 100, 'templates': 5, 'traffic': 'trickle', 'rate': 2, 'events': 40},
+    'trickle_500': {'subreddits': 500, 'templates': 5, 'traffic': 'trickle', 'rate': 2, 'events': 40},
+    'burst_100': {'subreddits': 100, 'templates': 5, 'traffic': 'burst', 'events': 100},
+    'burst_500': {'subreddits': 500, 'templates': 5, 'traffic': 'burst', 'events': 250},
+    'many_templates': {'subreddits': 10, 'templates': 250, 'traffic': 'trickle', 'rate': 2, 'events': 40},
+    'usernote_heavy': {'subreddits': 10, 'templates': 5, 'usernote_users': 20000, 'traffic': 'trickle', 'rate': 2, 'events': 40},
+    'nuke_heavy': {'subreddits': 10, 'templates': 5, 'nuke': True, 'traffic': 'trickle', 'rate': 2, 'events': 40},
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_emulator(scenario, port, args):
+    command = [sys.executable, EMULATOR, '--port', str(port),
+               '--subreddits', str(scenario['subreddits']), '--templates', str(scenario['templates']),
+               '--usernote-users', str(scenario.get('usernote_users', 0)),
+               '--latency', str(args.latency), '--jitter', str(args.jitter), '--budget', str(args.budget), '--seed', '1']
+    if scenario.get('nuke'):
+        command.append('--nuke')
+    if args.no_rate_limit:
+        command.append('--no-rate-limit')
+    return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_for_emulator(session, base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(f"{base_url}/_emulator/stats") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"Emulator at {base_url} did not start within {timeout} seconds")
+
+
+async def get_stats(session, base_url):
+    async with session.get(f"{base_url}/_emulator/stats") as response:
+        return await response.json()
+
+
+async def send_flair_events(session, base_url, count):
+    async with session.post(f"{base_url}/_emulator/flair", json={'count': count}) as response:
+        return (await response.json())['submission_ids']
+
+
+async def sample_process(fh, samples, interval=0.1):
+    # Event loop lag and resident memory of the bot process, sampled while the scenario runs
+    while True:
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        samples['loop_lag'].append(max(time.perf_counter() - expected, 0))
+        rss = fh.get_memory_rss_bytes()
+        if rss is not None:
+            samples['peak_rss_bytes'] = max(samples['peak_rss_bytes'], rss)
+
+
+async def run_scenario(fh, name, scenario, args):
+    workdir = tempfile.mkdtemp(prefix=f'fh2_bench_{name}_')
+    os.chdir(workdir)
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    emulator_process = start_emulator(scenario, port, args)
+    tasks = []
+    reddit = None
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            await wait_for_emulator(session, base_url)
+
+            url = base_url
+            reddit = asyncpraw.Reddit(client_id='emulator', client_secret='emulator', refresh_token='emulator',
+                                      user_agent='FlairHelper2 benchmark', oauth_url=url, reddit_url=url, short_url=url,
+                                      check_for_updates=False, requestor_class=fh.InstrumentedRequestor, requestor_kwargs={'account': name})
+            me = await reddit.user.me()
+            fh.reddit_clients.clear()
+            fh.account_usernames.clear()
+            fh.subreddit_accounts.clear()
+            fh.reddit_clients[name] = reddit
+            fh.account_usernames[name] = me.name
+            fh.create_actions_database()
+
+            # Cold config sweep, as bot_main does on an empty database
+            sweep_started = time.perf_counter()
+            await fh.fetch_and_cache_configs(reddit, me.name)
+            config_sweep_seconds = time.perf_counter() - sweep_started
+
+            samples = {'loop_lag': [], 'peak_rss_bytes': 0}
+            tasks.append(asyncio.create_task(fh.monitor_mod_log(reddit, me.name)))
+            tasks.append(asyncio.create_task(fh.process_flair_actions(reddit, args.max_concurrency)))
+            tasks.append(asyncio.create_task(sample_process(fh, samples)))
+
+            # Let the mod log stream start (skip_existing) before any traffic is generated
+            await asyncio.sleep(args.warmup)
+            before = await get_stats(session, base_url)
+
+            submission_ids = []
+            traffic_started = time.time()
+            if scenario['traffic'] == 'burst':
+                submission_ids += await send_flair_events(session, base_url, scenario['events'])
+            else:
+                for _ in range(scenario['events']):
+                    submission_ids += await send_flair_events(session, base_url, 1)
+                    await asyncio.sleep(1 / scenario['rate'])
+
+            # Wait for every flaired submission to reach its final action and drain the actions queue
+            deadline = time.monotonic() + args.timeout
+            while True:
+                stats = await get_stats(session, base_url)
+                done = [sid for sid in submission_ids if sid in stats['last_action_time']]
+                if len(done) == len(submission_ids) and not fh.get_pending_submission_ids_from_database():
+                    # Give the pipeline a moment to issue any trailing actions before the final snapshot
+                    await asyncio.sleep(args.settle)
+                    stats = await get_stats(session, base_url)
+                    break
+                if time.monotonic() > deadline:
+                    break
+                await asyncio.sleep(0.2)
+
+        completed = [sid for sid in submission_ids if sid in stats['last_action_time']]
+        first_latencies = [stats['first_action_time'][sid] - stats['flair_events'][sid] for sid in completed]
+        latencies = [stats['last_action_time'][sid] - stats['flair_events'][sid] for sid in completed]
+        finished_at = max((stats['last_action_time'][sid] for sid in completed), default=traffic_started)
+        calls = stats['request_count'] - before['request_count']
+        loop_lag = samples['loop_lag']
+
+        return {
+            'scenario': name,
+            'subreddits': scenario['subreddits'],
+            'templates_per_subreddit': scenario['templates'],
+            'traffic': scenario['traffic'],
+            'events_sent': len(submission_ids),
+            'events_completed': len(completed),
+            'config_sweep_seconds': round(config_sweep_seconds, 3),
+            'events_per_second': round(len(completed) / max(finished_at - traffic_started, 1e-9), 3),
+            'latency_first_action_p50': fh.percentile(sorted(first_latencies), 0.5),
+            'latency_p50': fh.percentile(sorted(latencies), 0.5),
+            'latency_p99': fh.percentile(sorted(latencies), 0.99),
+            'reddit_calls': calls,
+            'reddit_calls_per_event': round(calls / len(completed), 2) if completed else None,
+            'mutating_calls': stats['mutating_calls'] - before['mutating_calls'],
+            'peak_rss_bytes': samples['peak_rss_bytes'],
+            'loop_lag_p99': fh.percentile(sorted(loop_lag), 0.99),
+            'loop_lag_max': max(loop_lag, default=None),
+        }
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if reddit is not None:
+            await reddit.close()
+        emulator_process.terminate()
+        emulator_process.wait()
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare_results(results, baseline_filename):
+    with open(baseline_filename) as f:
+        baseline = {entry['scenario']: entry for entry in json.load(f)['scenarios']}
+
+    for entry in results['scenarios']:
+        previous = baseline.get(entry['scenario'])
+        if previous is None:
+            continue
+        for key in ('events_per_second', 'latency_p50', 'latency_p99', 'reddit_calls_per_event', 'peak_rss_bytes', 'loop_lag_p99'):
+            if entry.get(key) is None or not previous.get(key):
+                continue
+            change = (entry[key] - previous[key]) / previous[key] * 100
+            print(f"{entry['scenario']:<16} {key:<24} {previous[key]:>14.4f} -> {entry[key]:>14.4f} ({change:+.1f}%)", file=sys.stderr)
+
+
+async def run(args):
+    # Import inside the bench so logs/ and the databases are created in a scratch directory, not the checkout
+    os.chdir(tempfile.gettempdir())
+    import flair_helper2_async as fh
+    os.chdir(REPO_DIR)
+
+    results = {
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'started_at': time.time(),
+        'scenarios': [],
+    }
+    for name in args.scenario or SCENARIOS:
+        print(f"Running scenario {name}", file=sys.stderr)
+        results['scenarios'].append(await run_scenario(fh, name, SCENARIOS[name], args))
+    results['peak_rss_bytes_process'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end Flair Helper 2 benchmark against the Reddit emulator")
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help="Scenario to run (repeatable, default all)")
+    parser.add_argument('--list', action='store_true', help="List the scenarios and exit")
+    parser.add_argument('--output', help="Write the JSON results to this file instead of stdout")
+    parser.add_argument('--compare', help="Print the change against a previous results file")
+    parser.add_argument('--max-concurrency', type=int, default=2, help="process_flair_actions concurrency (bot_main uses 2)")
+    parser.add_argument('--latency', type=float, default=0.05, help="Emulator base response latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.02, help="Emulator extra random latency in seconds")
+    parser.add_argument('--budget', type=int, default=100000, help="Emulator requests allowed per rate limit window")
+    parser.add_argument('--no-rate-limit', action='store_true', help="Never answer 429 from the emulator")
+    parser.add_argument('--warmup', type=float, default=3, help="Seconds to let the mod log stream start before sending traffic")
+    parser.add_argument('--settle', type=float, default=2, help="Seconds to wait for trailing actions once every event completed")
+    parser.add_argument('--timeout', type=float, default=120, help="Seconds to wait for the pipeline to drain per scenario")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, scenario in SCENARIOS.items():
+            print(f"{name}: {json.dumps(scenario)}")
+        return
+
+    results = asyncio.run(run(args))
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        compare_results(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -20,3 +20,65 @@ discord_bot_notifications = False
 discord_webhook_url = "https://discord.com/api/webhooks/YOUR_DISCORD_WEBHOOK"
 
 logs_dir = "logs/"
+
+# Sharding: split the moderated subreddits across several bot processes.
+# shard_count = 1 keeps the classic single-process behaviour.
+shard_count = 1
+# Optional explicit subreddit -> shard assignments, e.g. {"AskReddit": 0, "pics": 1}. Unlisted subreddits are assigned by hash.
+shard_map = {}
+shard_heartbeat_interval = 30 # Seconds between shard heartbeats
+shard_heartbeat_timeout = 180 # Coordinator restarts a shard that hasn't reported within this many seconds
+shard_event_poll_interval = 10 # Seconds between a shard's checks for subreddits another shard has added to it (e.g. shard 0 accepting a mod invite)
+
+# praw.ini sections to log in with. Add more bot accounts to multiply the Reddit rate budget; each subreddit
+# is handled by the first account listed here that moderates it.
+reddit_accounts = ["fh2_login"]
+
+# Moderated subreddits are kept in a local registry, updated from mod invites and mod log events; this is how often (seconds)
+# it is reconciled against Reddit's full moderator list
+moderated_subreddits_reconcile_interval = 6 * 3600
+# Subreddits whose flair_helper wiki page is missing, blank or unreadable are not fetched again by config sweeps for this
+# many seconds; a revision of the page in the mod log reloads it straight away
+missing_config_ttl = 24 * 3600
+# A wiki revision schedules a background config reload once the page has been quiet for config_reload_debounce_seconds,
+# at most config_reload_max_delay seconds after the first revision of a burst
+config_reload_debounce_seconds = 10
+config_reload_max_delay = 60
+# Shared base pages named by a config's "extends" are re-fetched at most this often (seconds), or straight away when revised
+base_config_ttl = 3600
+# Flair activity per subreddit (used to order config sweeps) is counted in memory and saved every this many seconds
+subreddit_activity_flush_interval = 60
+# The compiled configs are saved for fast restarts after each config sweep, and this often (seconds) if reloads changed one
+compiled_config_snapshot_interval = 600
+
+# zlib/JSON/YAML work on payloads of at least this many bytes (usernotes pages, large configs) runs in a worker pool instead
+# of the event loop. cpu_offload_pool is "process" (also keeps JSON encoding off the loop) or "thread"; 0 workers disables it.
+cpu_offload_threshold_bytes = 256 * 1024
+cpu_offload_pool = "process"
+cpu_offload_workers = 2
+
+# Compact the Toolbox usernotes of subreddits whose flair_helper config sets usernote_expire_days and/or usernote_max_notes:
+# old [FH] notes are removed and FH-Ban- notes are folded into one "FH-Ban-history" summary per user. Interval in seconds.
+usernote_compaction_enabled = False
+usernote_compaction_interval = 24 * 3600
+
+# Decide escalating ban durations from a local ledger of previous bans (seeded once per subreddit from FH-Ban- usernotes)
+# instead of reading the usernotes page for every ban. After running with it off, the ledger is seeded again on the next start.
+ban_ledger_enabled = True
+
+# Local Prometheus-format metrics endpoint (http://metrics_host:metrics_port/metrics). Shards listen on metrics_port + shard id.
+metrics_enabled = False
+metrics_host = "127.0.0.1"
+metrics_port = 9464
+
+# Per-submission latency traces, one line per completed submission, written to logs_dir/traces.ndjson (traces_shardN.ndjson
+# per shard, rotated). Summarise with: python flair_helper2_async.py --trace-summary
+tracing_enabled = False
+trace_log_max_bytes = 10 * 1024 * 1024
+trace_log_backup_count = 5
+
+# Capture every mod log entry and the Reddit responses behind it to this gzip file for bench/replay_capture.py (None disables)
+mod_log_capture_file = None
+
+# Dry run / shadow mode: process everything but log the actions' Reddit writes to logs_dir/dry_run_actions.ndjson instead of sending them
+dry_run = False
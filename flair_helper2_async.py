@@ -1,40 +1,57 @@
+import time
+import_started = time.perf_counter()  # Reported at startup as flair_helper_startup_import_seconds
+
 import aiohttp
 import asyncio
 import asyncpraw
 import asyncprawcore
 import sqlite3
-import yaml
 import re
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from datetime import datetime, timedelta
 from typing import Callable, Any, Dict
-import time
 import zlib
+import gzip
+import hashlib
+import math
+import random
 import base64
+import io
+import pickle
 import json
 import logging
 import os
 import traceback
+import subprocess
+import sys
+import argparse
+import contextvars
 import concurrent.futures
+import functools
+import multiprocessing
+from logging.handlers import RotatingFileHandler
 from logging.handlers import TimedRotatingFileHandler
+from contextlib import asynccontextmanager, redirect_stdout
+from urllib.parse import urlparse
+from aiohttp import web
 from asyncprawcore import exceptions as asyncprawcore_exceptions
 from asyncprawcore import ResponseException
 from asyncprawcore import NotFound
-from discord_webhook import DiscordWebhook, DiscordEmbed
 
 import config  # Import your config.py
+# Usernotes and YAML functions run by the CPU offload pool; a separate module so its spawned workers don't import this one
+from flair_helper2_offload import (
+    init_offload_worker, timed_offload_call,
+    BAN_NOTE_DISALLOWED_CHARACTERS, MODLOG_REASON_DISALLOWED_CHARACTERS, load_yaml, load_yaml_config, load_yaml_config_json, convert_yaml_to_json,
+    decompress_notes, compress_notes, USERNOTES_STREAM_CHUNK_SIZE, USERNOTES_STREAM_MAX_OUTPUT, find_user_notes, add_usernote,
+    read_usernote_ban_values, get_note_ban_values, read_all_usernote_ban_values, build_updated_usernotes,
+    USERNOTE_BAN_HISTORY_PREFIX, parse_ban_history, format_ban_history, compact_user_notes, compact_usernotes,
+)
 
 
-if config.telegram_bot_control:
-    # For optionally being able to restart the bot via a Telegram bot username
-    from telebot import types
-    from telebot.apihelper import ApiTelegramException
-    from telebot.asyncio_helper import ApiTelegramException
-    from telebot.async_telebot import AsyncTeleBot
-    from telebot.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
-
-    telegram_bot = AsyncTeleBot(config.telegram_TOKEN)
-    admin_ids = config.telegram_admin_ids
+# Optional integrations (Telegram, Discord webhooks, YAML configs, colored output) are imported where they are first used
+telegram_bot = None  # Created by setup_telegram_bot() when telegram_bot_control is enabled
+admin_ids = getattr(config, 'telegram_admin_ids', [])
 
 
 debugmode = config.debugmode
@@ -44,6 +61,8 @@ colored_console_output = config.colored_console_output
 
 auto_accept_mod_invites = config.auto_accept_mod_invites
 
+allow_ban_and_nuke = config.allow_ban_and_nuke
+
 # Config Validation Errors are always PM'ed regardless of being True or False
 send_pm_on_wiki_config_update = config.send_pm_on_wiki_config_update
 
@@ -54,6 +73,43 @@ logs_dir = config.logs_dir
 if not os.path.exists(logs_dir):
     os.makedirs(logs_dir)
 
+shard_count = getattr(config, 'shard_count', 1)
+shard_map = {name.lower(): shard for name, shard in getattr(config, 'shard_map', {}).items()}
+shard_heartbeat_interval = getattr(config, 'shard_heartbeat_interval', 30)
+shard_heartbeat_timeout = getattr(config, 'shard_heartbeat_timeout', 180)
+shard_event_poll_interval = getattr(config, 'shard_event_poll_interval', 10)
+shard_id = None  # Set by --shard-id when running as one shard of several processes
+
+metrics_enabled = getattr(config, 'metrics_enabled', False)
+metrics_host = getattr(config, 'metrics_host', '127.0.0.1')
+metrics_port = getattr(config, 'metrics_port', 9464)
+
+tracing_enabled = getattr(config, 'tracing_enabled', False)
+
+mod_log_capture_filename = getattr(config, 'mod_log_capture_file', None)
+
+dry_run = getattr(config, 'dry_run', False)
+
+missing_config_ttl = getattr(config, 'missing_config_ttl', 24 * 3600)
+config_reload_debounce_seconds = getattr(config, 'config_reload_debounce_seconds', 10)
+config_reload_max_delay = getattr(config, 'config_reload_max_delay', 60)
+base_config_ttl = getattr(config, 'base_config_ttl', 3600)
+subreddit_activity_flush_interval = getattr(config, 'subreddit_activity_flush_interval', 60)
+compiled_config_snapshot_interval = getattr(config, 'compiled_config_snapshot_interval', 600)
+
+cpu_offload_threshold_bytes = getattr(config, 'cpu_offload_threshold_bytes', 256 * 1024)
+cpu_offload_pool = getattr(config, 'cpu_offload_pool', 'process')
+cpu_offload_workers = getattr(config, 'cpu_offload_workers', 2)
+
+usernote_compaction_enabled = getattr(config, 'usernote_compaction_enabled', False)
+usernote_compaction_interval = getattr(config, 'usernote_compaction_interval', 24 * 3600)
+
+ban_ledger_enabled = getattr(config, 'ban_ledger_enabled', True)
+
+configs_db_filename = 'flair_helper_configs.db'
+actions_db_filename = 'flair_helper_actions.db'
+shards_db_filename = 'flair_helper_shards.db'
+
 errors_filename = f'{logs_dir}errors.log'
 logging.basicConfig(filename=errors_filename, level=logging.WARNING, format='%(asctime)s %(levelname)s: %(message)s', filemode='a')
 errors_logger = logging.getLogger('errors')
@@ -77,7 +133,6 @@ def check_restriction_status(message):
         return "unauthorized"
 
 
-@telegram_bot.message_handler(commands=['status'])
 async def handle_status_command(message):
     if message.chat.type in ("private") and message.chat.id in config.telegram_admin_ids:
         status_message = "Flair Helper 2 Status Report:\n\n"
@@ -86,11 +141,15 @@ async def handle_status_command(message):
         status_message += f"Current time: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}\n\n"
 
         # Memory usage
-        import psutil
-        process = psutil.Process()
-        memory_usage = process.memory_info().rss / 1024 / 1024  # in MB
+        memory_usage = get_memory_rss_bytes() / 1024 / 1024  # in MB
         status_message += f"Memory usage: {memory_usage:.2f} MB\n\n"
 
+        # Reddit rate budget per account
+        status_message += "Reddit Accounts:\n"
+        for account, limits in get_account_rate_limits().items():
+            status_message += f"- {account_usernames.get(account, account)}: {limits.get('remaining')} calls remaining, {limits.get('used')} used\n"
+        status_message += "\n"
+
         # Running tasks
         status_message += "Running Tasks:\n"
         for task_name in running_tasks.keys():
@@ -98,7 +157,7 @@ async def handle_status_command(message):
         status_message += "\n"
 
         # Monitored subreddits
-        conn = sqlite3.connect('flair_helper_configs.db')
+        conn = sqlite3.connect(configs_db_filename)
         c = conn.cursor()
         c.execute("SELECT subreddit FROM configs")
         subreddits = c.fetchall()
@@ -112,7 +171,7 @@ async def handle_status_command(message):
         status_message += "\n"
 
         # Pending actions in database
-        conn = sqlite3.connect('flair_helper_actions.db')
+        conn = sqlite3.connect(actions_db_filename)
         c = conn.cursor()
         c.execute("SELECT COUNT(*) FROM actions WHERE completed = 0")
         pending_count = c.fetchone()[0]
@@ -132,7 +191,6 @@ async def handle_status_command(message):
         await telegram_bot.send_message(chat_id=message.chat.id, text=status_message)
 
 
-@telegram_bot.message_handler(commands=['restart'])
 async def handle_restart_command(message):
     if message.chat.type in ("private") and message.chat.id in config.telegram_admin_ids:
         #await telegram_bot.send_message(chat_id=message.chat.id, text="Restarting bot...")
@@ -147,24 +205,24 @@ async def handle_restart_command(message):
         except Exception as e:
             await telegram_bot.send_message(chat_id=message.chat.id, text=f"**There was an error restarting the start_process_flair_actions_task...**\n Exception: {e}")
 
-        try:
-            await telegram_bot.send_message(chat_id=message.chat.id, text=f"Restarting start_monitor_mod_log_task...")
-            await add_task('Reddit - Monitor Mod Log', start_task, start_monitor_mod_log_task, reddit, bot_username)
-            #await discord_status_notification(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: {action_type}Starting Monitor Mod Log...")
-        except Exception as e:
-            await telegram_bot.send_message(chat_id=message.chat.id, text=f"**There was an error restarting the start_monitor_mod_log_task...**\n Exception: {e}")
+        for account, account_reddit in reddit_clients.items():
+            try:
+                await telegram_bot.send_message(chat_id=message.chat.id, text=f"Restarting start_monitor_mod_log_task for {account}...")
+                await add_task(get_account_task_name('Reddit - Monitor Mod Log', account), start_task, start_monitor_mod_log_task, account_reddit, account_usernames[account])
+                #await discord_status_notification(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: {action_type}Starting Monitor Mod Log...")
+            except Exception as e:
+                await telegram_bot.send_message(chat_id=message.chat.id, text=f"**There was an error restarting the start_monitor_mod_log_task...**\n Exception: {e}")
 
-        try:
-            await telegram_bot.send_message(chat_id=message.chat.id, text=f"Restarting start_monitor_private_messages_task...")
-            await add_task('Reddit - Monitor Private Messages', start_task, start_monitor_private_messages_task, reddit)
-            #await discord_status_notification(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: {action_type}Starting Monitor Private Messages...")
-        except Exception as e:
-            await telegram_bot.send_message(chat_id=message.chat.id, text=f"**There was an error restarting the start_monitor_private_messages_task...**\n Exception: {e}")
+            try:
+                await telegram_bot.send_message(chat_id=message.chat.id, text=f"Restarting start_monitor_private_messages_task for {account}...")
+                await add_task(get_account_task_name('Reddit - Monitor Private Messages', account), start_task, start_monitor_private_messages_task, account_reddit)
+                #await discord_status_notification(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: {action_type}Starting Monitor Private Messages...")
+            except Exception as e:
+                await telegram_bot.send_message(chat_id=message.chat.id, text=f"**There was an error restarting the start_monitor_private_messages_task...**\n Exception: {e}")
 
 
 
-@telegram_bot.message_handler(commands=['kill'])
-async def handle_restart_command(message):
+async def handle_kill_command(message):
     if message.chat.type in ("private") and message.chat.id in config.telegram_admin_ids:
 
         user_name = message.from_user.username or message.from_user.first_name
@@ -174,8 +232,7 @@ async def handle_restart_command(message):
         os._exit(0)  # Forcefully exit the process
 
 
-@telegram_bot.message_handler(func=lambda message: True, content_types=['new_chat_members'])
-async def handle_new_chat_members(message: Message):
+async def handle_new_chat_members(message):
     # Check if our bot is among the new members
     for member in message.new_chat_members:
         if member.id == telegram_bot_id:  # Use telegram_bot_id instead of making another async call
@@ -191,6 +248,18 @@ async def handle_new_chat_members(message: Message):
             await telegram_bot.leave_chat(message.chat.id)
 
 
+def setup_telegram_bot():
+    # For optionally being able to restart the bot via a Telegram bot username; telebot is only imported when enabled
+    global telegram_bot
+    from telebot.async_telebot import AsyncTeleBot
+
+    telegram_bot = AsyncTeleBot(config.telegram_TOKEN)
+    telegram_bot.message_handler(commands=['status'])(handle_status_command)
+    telegram_bot.message_handler(commands=['restart'])(handle_restart_command)
+    telegram_bot.message_handler(commands=['kill'])(handle_kill_command)
+    telegram_bot.message_handler(func=lambda message: True, content_types=['new_chat_members'])(handle_new_chat_members)
+
+
 
 async def error_handler(error_message, notify_discord=False):
     print(error_message) if debugmode else None
@@ -281,8 +350,10 @@ async def get_subreddit(reddit, subreddit_name):
 
 
 async def discord_status_notification(message):
-    if discord_bot_notifications:
+    # A dry-run bot runs next to the production bot and stays quiet on its channels
+    if discord_bot_notifications and not dry_run:
         try:
+            from discord_webhook import DiscordWebhook, DiscordEmbed
             webhook = DiscordWebhook(url=discord_webhook_url)
             embed = DiscordEmbed(title="Flair Helper 2 Status Notification", description=message, color=242424)
             webhook.add_embed(embed)
@@ -315,7 +386,7 @@ async def send_failure_notification(submission_id, mod_name, error_message):
         await discord_status_notification(notification)
 
     # Send Telegram notification
-    if config.telegram_bot_control:
+    if telegram_bot is not None and not dry_run:
         for admin_id in config.telegram_admin_ids:
             await telegram_bot.send_message(admin_id, notification)
 
@@ -325,38 +396,240 @@ async def send_failure_notification(submission_id, mod_name, error_message):
 
 # Create local sqlite db to cache/store Wiki Configs for all subs ones bot moderates
 def create_configs_database():
-    conn = sqlite3.connect('flair_helper_configs.db')
+    conn = sqlite3.connect(configs_db_filename)
     c = conn.cursor()
+    c.execute("SELECT name FROM pragma_table_info('configs')")
+    configs_columns = {row[0] for row in c.fetchall()}
+    if 'config' in configs_columns:
+        migrate_configs_to_store(c)
+    elif configs_columns and 'base' not in configs_columns:
+        c.execute("ALTER TABLE configs ADD COLUMN base TEXT")
     c.execute('''CREATE TABLE IF NOT EXISTS configs
-                 (subreddit TEXT PRIMARY KEY, config TEXT)''')
+                 (subreddit TEXT PRIMARY KEY, config_hash TEXT, source_hash TEXT, base TEXT)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS config_store
+                 (config_hash TEXT PRIMARY KEY, config TEXT)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS subreddit_activity
+                 (subreddit TEXT PRIMARY KEY, events INTEGER, last_event REAL)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS missing_configs
+                 (subreddit TEXT PRIMARY KEY, reason TEXT, checked_at REAL)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS moderated_subreddits
+                 (account TEXT, subreddit TEXT, display_name TEXT, subreddit_id TEXT, permissions TEXT, has_config INTEGER, updated_at REAL,
+                  PRIMARY KEY (account, subreddit))''')
     conn.commit()
     conn.close()
 
-async def cache_config(subreddit_name, config):
+def migrate_configs_to_store(c):
+    # Databases from before the content-addressed store kept one JSON blob per subreddit in configs.config
+    c.execute("SELECT subreddit, config FROM configs")
+    rows = c.fetchall()
+    c.execute("ALTER TABLE configs RENAME TO configs_old")
+    c.execute('''CREATE TABLE configs (subreddit TEXT PRIMARY KEY, config_hash TEXT, source_hash TEXT, base TEXT)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS config_store (config_hash TEXT PRIMARY KEY, config TEXT)''')
+    for subreddit_name, config_json in rows:
+        try:
+            config_json = json.dumps(json.loads(config_json), sort_keys=True)
+        except (TypeError, json.JSONDecodeError):
+            continue
+        config_hash = hashlib.sha256(config_json.encode('utf-8')).hexdigest()
+        c.execute("INSERT OR IGNORE INTO config_store VALUES (?, ?)", (config_hash, config_json))
+        c.execute("INSERT OR REPLACE INTO configs VALUES (?, ?, NULL, NULL)", (subreddit_name, config_hash))
+    c.execute("DROP TABLE configs_old")
+
+
+# Content-addressed config store: each distinct validated config is stored once in config_store under the SHA-256 of
+# its canonical JSON and subreddits point at that hash. Subreddits with identical configs share one compiled object.
+class CompiledConfig(list):
+    # A validated config (GeneralConfiguration followed by the flair entries) with its content hash and a templateId index
+
+    def __init__(self, config, config_hash):
+        super().__init__(config)
+        self.config_hash = config_hash
+        self.flair_index = {}
+        for flair in self[1:]:
+            if isinstance(flair, dict) and 'templateId' in flair:
+                self.flair_index.setdefault(flair['templateId'], flair)
+
+compiled_configs = {}  # config_hash -> CompiledConfig
+
+def get_config_hash(config):
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+def get_source_hash(wiki_content):
+    # Hash of the raw wiki page, so an unchanged page is not parsed or validated again
+    return hashlib.sha256(wiki_content.encode('utf-8')).hexdigest()
+
+async def cache_config(subreddit_name, config, source_hash=None, base=None):
+    global compiled_config_snapshot_dirty
+    config_json = json.dumps(config, sort_keys=True)
+    config_hash = hashlib.sha256(config_json.encode('utf-8')).hexdigest()
     async with database_lock:
-        conn = sqlite3.connect('flair_helper_configs.db')
+        conn = sqlite3.connect(configs_db_filename)
         c = conn.cursor()
         try:
-            c.execute("INSERT OR REPLACE INTO configs VALUES (?, ?)", (subreddit_name, json.dumps(config, sort_keys=True)))
+            c.execute("INSERT OR IGNORE INTO config_store VALUES (?, ?)", (config_hash, config_json))
+            c.execute("INSERT OR REPLACE INTO configs VALUES (?, ?, ?, ?)", (subreddit_name, config_hash, source_hash, base))
+            c.execute("DELETE FROM config_store WHERE config_hash NOT IN (SELECT config_hash FROM configs)")
+            c.execute("UPDATE moderated_subreddits SET has_config = 1 WHERE subreddit = ?", (subreddit_name.lower(),))
+            c.execute("DELETE FROM missing_configs WHERE subreddit = ?", (subreddit_name.lower(),))
             conn.commit()
+            c.execute("SELECT DISTINCT config_hash FROM configs")
+            referenced_hashes = {row[0] for row in c.fetchall()}
         finally:
             conn.close()
+    for unreferenced_hash in set(compiled_configs) - referenced_hashes:
+        del compiled_configs[unreferenced_hash]
+    set_gauge('flair_helper_compiled_configs', len(compiled_configs))
+    compiled_config_snapshot_dirty = True
+    write_capture_record('config', subreddit=subreddit_name, config=config)
+
+def set_cached_source_hash(subreddit_name, source_hash, base=None):
+    conn = sqlite3.connect(configs_db_filename)
+    c = conn.cursor()
+    c.execute("UPDATE configs SET source_hash = ?, base = ? WHERE subreddit = ?", (source_hash, base, subreddit_name))
+    conn.commit()
+    conn.close()
 
-def get_cached_config(subreddit_name):
-    conn = sqlite3.connect('flair_helper_configs.db')
+def get_cached_config_base(subreddit_name):
+    conn = sqlite3.connect(configs_db_filename)
     c = conn.cursor()
-    c.execute("SELECT config FROM configs WHERE subreddit = ?", (subreddit_name,))
+    c.execute("SELECT base FROM configs WHERE subreddit = ?", (subreddit_name,))
     result = c.fetchone()
     conn.close()
-    if result:
+    return result[0] if result else None
+
+def get_subreddits_by_base():
+    conn = sqlite3.connect(configs_db_filename)
+    c = conn.cursor()
+    c.execute("SELECT base, subreddit FROM configs WHERE base IS NOT NULL")
+    subreddits_by_base = defaultdict(list)
+    for base, subreddit_name in c.fetchall():
+        subreddits_by_base[base].append(subreddit_name)
+    conn.close()
+    return subreddits_by_base
+
+def get_cached_source_hash(subreddit_name):
+    conn = sqlite3.connect(configs_db_filename)
+    c = conn.cursor()
+    c.execute("SELECT source_hash FROM configs WHERE subreddit = ?", (subreddit_name,))
+    result = c.fetchone()
+    conn.close()
+    return result[0] if result else None
+
+def get_cached_config(subreddit_name):
+    conn = sqlite3.connect(configs_db_filename)
+    c = conn.cursor()
+    c.execute("SELECT config_hash FROM configs WHERE subreddit = ?", (subreddit_name,))
+    result = c.fetchone()
+    increment_metric('flair_helper_cache_requests_total', cache='config', result='hit' if result else 'miss')
+    if not result:
+        conn.close()
+        return None
+
+    config_hash = result[0]
+    compiled = compiled_configs.get(config_hash)
+    increment_metric('flair_helper_cache_requests_total', cache='compiled_config', result='hit' if compiled is not None else 'miss')
+    if compiled is None:
+        c.execute("SELECT config FROM config_store WHERE config_hash = ?", (config_hash,))
+        stored = c.fetchone()
         try:
-            return json.loads(result[0])  # Use json.loads instead of yaml.safe_load
+            compiled = CompiledConfig(json.loads(stored[0]), config_hash) if stored else None
         except json.JSONDecodeError:
-            return None
-    return None
+            compiled = None
+        if compiled is not None:
+            compiled_configs[config_hash] = compiled
+            set_gauge('flair_helper_compiled_configs', len(compiled_configs))
+    conn.close()
+    return compiled
+
+
+# Compiled-config snapshot: every compiled config is pickled next to the configs database after a sweep, and every
+# compiled_config_snapshot_interval seconds if reloads changed a config since, so a restart loads them in one read instead
+# of running json.loads per subreddit. The configs are pickled as plain lists, so the file does not depend on how
+# CompiledConfig was imported. The snapshot is ignored if its version differs; entries whose content hash is no longer in
+# config_store are dropped.
+COMPILED_CONFIG_SNAPSHOT_VERSION = 2  # Bump whenever the pickled layout changes
+compiled_config_snapshot_dirty = False  # Set by cache_config, cleared when the snapshot is saved
+
+def get_compiled_config_snapshot_filename():
+    return os.path.splitext(configs_db_filename)[0] + '.snapshot'
+
+def get_referenced_config_hashes():
+    conn = sqlite3.connect(configs_db_filename)
+    c = conn.cursor()
+    c.execute("SELECT DISTINCT config_hash FROM configs")
+    config_hashes = {row[0] for row in c.fetchall()}
+    conn.close()
+    return config_hashes
+
+def write_compiled_config_snapshot(compiled):
+    # Runs in a worker thread with a copy of compiled_configs; configs not compiled yet are read from config_store
+    referenced_hashes = get_referenced_config_hashes()
+    snapshot_configs = {config_hash: list(config) for config_hash, config in compiled.items() if config_hash in referenced_hashes}
+    conn = sqlite3.connect(configs_db_filename)
+    c = conn.cursor()
+    for config_hash in referenced_hashes - set(snapshot_configs):
+        c.execute("SELECT config FROM config_store WHERE config_hash = ?", (config_hash,))
+        stored = c.fetchone()
+        if stored:
+            snapshot_configs[config_hash] = json.loads(stored[0])
+    conn.close()
+
+    # A small header pickle (checked before the configs are unpickled) followed by the configs
+    filename = get_compiled_config_snapshot_filename()
+    with open(filename + '.tmp', 'wb') as f:
+        pickle.dump({'version': COMPILED_CONFIG_SNAPSHOT_VERSION, 'created_at': time.time(), 'configs': len(snapshot_configs)}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(snapshot_configs, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(filename + '.tmp', filename)
+    return len(snapshot_configs), filename
+
+async def save_compiled_config_snapshot():
+    global compiled_config_snapshot_dirty
+    compiled_config_snapshot_dirty = False
+    try:
+        saved_configs, filename = await asyncio.to_thread(write_compiled_config_snapshot, dict(compiled_configs))
+    except Exception:
+        compiled_config_snapshot_dirty = True  # Try again at the next interval
+        raise
+    print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Saved {saved_configs} compiled configs to {filename}") if debugmode else None
+
+async def run_compiled_config_snapshot_saver():
+    while True:
+        await asyncio.sleep(compiled_config_snapshot_interval)
+        if compiled_config_snapshot_dirty and startup_state == 'ready':
+            try:
+                await save_compiled_config_snapshot()
+            except Exception as e:
+                await error_handler(f"Error saving the compiled config snapshot: {str(e)}", notify_discord=False)
+
+def load_compiled_config_snapshot():
+    # Returns the number of compiled configs loaded; 0 means they will be compiled from config_store on first use
+    filename = get_compiled_config_snapshot_filename()
+    if not os.path.exists(filename):
+        increment_metric('flair_helper_compiled_config_snapshot_loads_total', result='missing')
+        return 0
+    try:
+        with open(filename, 'rb') as f:
+            snapshot = io.BytesIO(f.read())
+        header = pickle.load(snapshot)
+        if not isinstance(header, dict) or header.get('version') != COMPILED_CONFIG_SNAPSHOT_VERSION:
+            increment_metric('flair_helper_compiled_config_snapshot_loads_total', result='stale')
+            return 0
+        snapshot_configs = pickle.load(snapshot)
+    except Exception as e:
+        increment_metric('flair_helper_compiled_config_snapshot_loads_total', result='error')
+        print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Ignoring unreadable compiled config snapshot {filename}: {e}") if debugmode else None
+        return 0
+
+    referenced_hashes = get_referenced_config_hashes()
+    loaded = {config_hash: CompiledConfig(config, config_hash) for config_hash, config in snapshot_configs.items()
+              if config_hash in referenced_hashes and isinstance(config, list)}
+    compiled_configs.update(loaded)
+    set_gauge('flair_helper_compiled_configs', len(compiled_configs))
+    increment_metric('flair_helper_compiled_config_snapshot_loads_total', result='loaded' if len(loaded) == len(referenced_hashes) else 'partial')
+    return len(loaded)
 
 def get_stored_subreddits():
-    conn = sqlite3.connect('flair_helper_configs.db')
+    conn = sqlite3.connect(configs_db_filename)
     c = conn.cursor()
     c.execute("SELECT subreddit FROM configs")
     stored_subreddits = [row[0] for row in c.fetchall()]
@@ -364,8 +637,72 @@ def get_stored_subreddits():
     return stored_subreddits
 
 
+# Flair activity is counted in memory on every flair edit and written to SQLite in one batch by flush_subreddit_activity
+pending_subreddit_activity = {}  # Lowercase subreddit name -> [events, last_event]
+
+def record_subreddit_activity(subreddit_name):
+    activity = pending_subreddit_activity.setdefault(subreddit_name.lower(), [0, 0])
+    activity[0] += 1
+    activity[1] = time.time()
+
+def flush_subreddit_activity():
+    if not pending_subreddit_activity:
+        return
+    rows = [(name, events, last_event) for name, (events, last_event) in pending_subreddit_activity.items()]
+    pending_subreddit_activity.clear()
+    conn = sqlite3.connect(configs_db_filename)
+    c = conn.cursor()
+    c.executemany("INSERT INTO subreddit_activity VALUES (?, ?, ?) ON CONFLICT(subreddit) DO UPDATE SET events = events + excluded.events, last_event = excluded.last_event",
+                  rows)
+    conn.commit()
+    conn.close()
+
+async def run_subreddit_activity_flush():
+    while True:
+        await asyncio.sleep(subreddit_activity_flush_interval)
+        try:
+            flush_subreddit_activity()
+        except Exception as e:
+            await error_handler(f"Error saving subreddit activity: {str(e)}", notify_discord=False)
+
+def get_subreddit_activity():
+    flush_subreddit_activity()
+    conn = sqlite3.connect(configs_db_filename)
+    c = conn.cursor()
+    c.execute("SELECT subreddit, events, last_event FROM subreddit_activity")
+    activity = {row[0]: (row[1], row[2]) for row in c.fetchall()}
+    conn.close()
+    return activity
+
+
+# Negative cache: subreddits whose flair_helper page is missing, blank or unreadable, so sweeps don't refetch them
+def record_missing_config(subreddit_name, reason):
+    conn = sqlite3.connect(configs_db_filename)
+    c = conn.cursor()
+    c.execute("INSERT OR REPLACE INTO missing_configs VALUES (?, ?, ?)", (subreddit_name.lower(), reason, time.time()))
+    conn.commit()
+    conn.close()
+
+def forget_missing_config(subreddit_name):
+    conn = sqlite3.connect(configs_db_filename)
+    c = conn.cursor()
+    c.execute("DELETE FROM missing_configs WHERE subreddit = ?", (subreddit_name.lower(),))
+    conn.commit()
+    conn.close()
+
+def get_missing_config_reason(subreddit_name):
+    # The cached reason while the entry is younger than missing_config_ttl, otherwise None
+    conn = sqlite3.connect(configs_db_filename)
+    c = conn.cursor()
+    c.execute("SELECT reason FROM missing_configs WHERE subreddit = ? AND checked_at > ?", (subreddit_name.lower(), time.time() - missing_config_ttl))
+    result = c.fetchone()
+    conn.close()
+    increment_metric('flair_helper_cache_requests_total', cache='missing_config', result='hit' if result else 'miss')
+    return result[0] if result else None
+
+
 def is_config_database_empty():
-    conn = sqlite3.connect('flair_helper_configs.db')
+    conn = sqlite3.connect(configs_db_filename)
     c = conn.cursor()
     c.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name='configs'")
     table_exists = c.fetchone()[0]
@@ -392,36 +729,62 @@ async def get_latest_wiki_revision(subreddit):
     return None
 
 
+# Edit reason of the bot's config write-backs; Reddit shows it as the wikirevise entry's description, which is how
+# handle_mod_log_entry recognises the bot's own revision and skips reloading it
+CONFIG_WRITE_BACK_REASON = "Flair Helper: corrected configuration"
+
+async def write_back_config(subreddit, wiki_page, updated_config):
+    content = await run_cpu_bound('config_json', functools.partial(json.dumps, indent=4), updated_config, size=len(wiki_page.content_md))
+    await reddit_write('config', '/api/wiki/edit', f"r/{subreddit.display_name}/wiki/flair_helper", wiki_page.edit,
+                       content=content, reason=CONFIG_WRITE_BACK_REASON)
+
+
 def create_actions_database():
-    conn = sqlite3.connect('flair_helper_actions.db')
+    conn = sqlite3.connect(actions_db_filename)
     c = conn.cursor()
     c.execute('''CREATE TABLE IF NOT EXISTS actions
                  (submission_id TEXT,
                   action TEXT,
                   completed INTEGER,
                   mod_name TEXT,
-                  flair_guid TEXT)''')
+                  flair_guid TEXT,
+                  subreddit TEXT,
+                  created_utc REAL,
+                  ingested_at REAL)''')
+    # Older databases predate the routing (subreddit) and tracing (created_utc, ingested_at) columns
+    c.execute("PRAGMA table_info(actions)")
+    existing_columns = [row[1] for row in c.fetchall()]
+    for column, column_type in (('subreddit', 'TEXT'), ('created_utc', 'REAL'), ('ingested_at', 'REAL')):
+        if column not in existing_columns:
+            c.execute(f"ALTER TABLE actions ADD COLUMN {column} {column_type}")
+    c.execute('''CREATE TABLE IF NOT EXISTS ban_ledger
+                 (subreddit TEXT, username TEXT, duration TEXT, banned_at REAL, permalink TEXT)''')
+    c.execute("CREATE INDEX IF NOT EXISTS ban_ledger_user ON ban_ledger (subreddit, username)")
+    c.execute('''CREATE TABLE IF NOT EXISTS ban_ledger_seeded
+                 (subreddit TEXT PRIMARY KEY, seeded_at REAL, bans INTEGER)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS ban_ledger_state
+                 (key TEXT PRIMARY KEY, value REAL)''')
     conn.commit()
     conn.close()
 
-def insert_actions_to_database(submission_id, actions, mod_name, flair_guid):
-    conn = sqlite3.connect('flair_helper_actions.db')
+def insert_actions_to_database(submission_id, actions, mod_name, flair_guid, subreddit_name=None, created_utc=None, ingested_at=None):
+    conn = sqlite3.connect(actions_db_filename)
     c = conn.cursor()
     for action in actions:
-        c.execute("INSERT INTO actions VALUES (?, ?, ?, ?, ?)", (submission_id, action, 0, mod_name, flair_guid))
+        c.execute("INSERT INTO actions (submission_id, action, completed, mod_name, flair_guid, subreddit, created_utc, ingested_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (submission_id, action, 0, mod_name, flair_guid, subreddit_name, created_utc, ingested_at))
     conn.commit()
     conn.close()
 
 def get_pending_submission_ids_from_database():
-    conn = sqlite3.connect('flair_helper_actions.db')
+    conn = sqlite3.connect(actions_db_filename)
     c = conn.cursor()
-    c.execute("SELECT DISTINCT submission_id, mod_name FROM actions WHERE completed = 0")
+    c.execute("SELECT submission_id, mod_name, subreddit, MIN(created_utc), MIN(ingested_at) FROM actions WHERE completed = 0 GROUP BY submission_id, mod_name, subreddit")
     pending_submission_ids = c.fetchall()
     conn.close()
     return pending_submission_ids
 
 def get_pending_actions(submission_id):
-    conn = sqlite3.connect('flair_helper_actions.db')
+    conn = sqlite3.connect(actions_db_filename)
     c = conn.cursor()
     c.execute("SELECT action FROM actions WHERE submission_id = ? AND completed = 0", (submission_id,))
     pending_actions = [row[0] for row in c.fetchall()]
@@ -429,14 +792,14 @@ def get_pending_actions(submission_id):
     return pending_actions
 
 def mark_action_as_completed(submission_id, action):
-    conn = sqlite3.connect('flair_helper_actions.db')
+    conn = sqlite3.connect(actions_db_filename)
     c = conn.cursor()
     c.execute("UPDATE actions SET completed = 1 WHERE submission_id = ? AND action = ?", (submission_id, action))
     conn.commit()
     conn.close()
 
 def mark_all_actions_completed(submission_id):
-    conn = sqlite3.connect('flair_helper_actions.db')
+    conn = sqlite3.connect(actions_db_filename)
     c = conn.cursor()
     c.execute("UPDATE actions SET completed = 1 WHERE submission_id = ?", (submission_id,))
     conn.commit()
@@ -444,7 +807,7 @@ def mark_all_actions_completed(submission_id):
     print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Marked all actions as completed for submission {submission_id} due to repeated failures") if debugmode else None
 
 def is_action_completed(submission_id, action):
-    conn = sqlite3.connect('flair_helper_actions.db')
+    conn = sqlite3.connect(actions_db_filename)
     c = conn.cursor()
     c.execute("SELECT COUNT(*) FROM actions WHERE submission_id = ? AND action = ? AND completed = 1", (submission_id, action))
     completed_count = c.fetchone()[0]
@@ -452,7 +815,7 @@ def is_action_completed(submission_id, action):
     return completed_count > 0
 
 def is_submission_completed(submission_id):
-    conn = sqlite3.connect('flair_helper_actions.db')
+    conn = sqlite3.connect(actions_db_filename)
     c = conn.cursor()
     c.execute("SELECT COUNT(*) FROM actions WHERE submission_id = ? AND completed = 0", (submission_id,))
     pending_count = c.fetchone()[0]
@@ -460,108 +823,736 @@ def is_submission_completed(submission_id):
     return pending_count == 0
 
 def delete_completed_actions(submission_id):
-    conn = sqlite3.connect('flair_helper_actions.db')
+    conn = sqlite3.connect(actions_db_filename)
     c = conn.cursor()
     c.execute("DELETE FROM actions WHERE submission_id = ? AND completed = 1", (submission_id,))
     conn.commit()
     conn.close()
 
+# Ban ledger: one row per escalating ban, durations stored like the FH-Ban- usernote suffixes ('7', 'permanent')
+def record_ledger_ban(subreddit_name, username, duration, permalink):
+    conn = sqlite3.connect(actions_db_filename)
+    c = conn.cursor()
+    c.execute("INSERT INTO ban_ledger VALUES (?, ?, ?, ?, ?)", (subreddit_name.lower(), username.lower(), duration, time.time(), permalink))
+    conn.commit()
+    conn.close()
 
-def convert_yaml_to_json(yaml_config):
-    # Create the GeneralConfiguration section
-    general_config = {
-        "GeneralConfiguration": {
-            "notes": yaml_config.get('notes', ''),
-            "header": yaml_config.get('header', ''),
-            "footer": yaml_config.get('footer', ''),
-            "usernote_type_name": yaml_config.get('usernote_type_name', ''),
-            "removal_comment_type": yaml_config.get('removal_comment_type', ''),
-            "skip_add_newlines": yaml_config.get('skip_add_newlines', False),
-            "require_config_to_edit": yaml_config.get('require_config_to_edit', False),
-            "ignore_same_flair_seconds": yaml_config.get('ignore_same_flair_seconds', 60),
-            "webhook": yaml_config.get('webhook', ''),
-            "wh_content": yaml_config.get('wh_content', ''),
-            "wh_ping_over_score": yaml_config.get('wh_ping_over_score', None),
-            "wh_ping_over_ping": yaml_config.get('wh_ping_over_ping', ''),
-            "wh_exclude_mod": yaml_config.get('wh_exclude_mod', False),
-            "wh_exclude_reports": yaml_config.get('wh_exclude_reports', False),
-            "wh_exclude_image": yaml_config.get('wh_exclude_image', False),
-            "wh_include_nsfw_images": yaml_config.get('wh_include_nsfw_images', False),
-            "utc_offset": yaml_config.get('utc_offset', 0),
-            "custom_time_format": yaml_config.get('custom_time_format', ''),
-            "maxAgeForComment": yaml_config.get('max_age_for_comment', 175),
-            "maxAgeForBan": yaml_config.get('max_age_for_ban', None)
-        }
-    }
+def get_ledger_ban_values(subreddit_name, username):
+    conn = sqlite3.connect(actions_db_filename)
+    c = conn.cursor()
+    c.execute("SELECT duration FROM ban_ledger WHERE subreddit = ? AND username = ? ORDER BY banned_at", (subreddit_name.lower(), username.lower()))
+    ban_values = [row[0] for row in c.fetchall()]
+    conn.close()
+    return ban_values
 
-    # Convert the YAML configuration to JSON format
-    json_config = [general_config]
-    for flair_id, flair_details in yaml_config.get('flairs', {}).items():
-        # Remove special characters except dashes, underscores, periods, and commas
-        cleaned_mod_note = re.sub(r'[^a-zA-Z0-9\s\-_.,]', '', yaml_config.get('ban_note', {}).get(flair_id, ''))
+def is_ban_ledger_seeded(subreddit_name):
+    conn = sqlite3.connect(actions_db_filename)
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM ban_ledger_seeded WHERE subreddit = ?", (subreddit_name.lower(),))
+    result = c.fetchone()
+    conn.close()
+    return result is not None
 
-        # Truncate the mod_note to 250 characters
-        cleaned_mod_note = cleaned_mod_note[:100]
+def seed_ledger_bans(subreddit_name, bans):
+    # bans are (username, duration, banned_at, permalink); stored together with the seeded marker so a seed is never half-done
+    # Replaces the rows of an earlier seed, whose bans are all on the usernotes page too
+    conn = sqlite3.connect(actions_db_filename)
+    c = conn.cursor()
+    c.execute("DELETE FROM ban_ledger WHERE subreddit = ?", (subreddit_name.lower(),))
+    c.executemany("INSERT INTO ban_ledger VALUES (?, ?, ?, ?, ?)",
+                  [(subreddit_name.lower(), username.lower(), duration, banned_at, permalink) for username, duration, banned_at, permalink in bans])
+    c.execute("INSERT OR REPLACE INTO ban_ledger_seeded VALUES (?, ?, ?)", (subreddit_name.lower(), time.time(), len(bans)))
+    conn.commit()
+    conn.close()
 
-        # Remove special characters except dashes, underscores, periods, and commas
-        cleaned_modlog_reason = re.sub(r'[^a-zA-Z0-9\s\-_.,/\\]', '', yaml_config.get('ban', {}).get(flair_id, ''))
-        cleaned_modlog_reason = cleaned_modlog_reason.replace('\n', ' ')
-        cleaned_modlog_reason = cleaned_modlog_reason.replace('  ', ' ')
-        cleaned_modlog_reason = cleaned_modlog_reason.replace('  ', ', ')
-        cleaned_modlog_reason = cleaned_modlog_reason.strip()
+def sync_ban_ledger_state():
+    # Bans made while ban_ledger_enabled is False only reach usernotes. The first start with it off records when, and the
+    # next start with it on forgets every seed, so each subreddit is seeded again from usernotes. Returns True in that case.
+    conn = sqlite3.connect(actions_db_filename)
+    c = conn.cursor()
+    reseed = False
+    if not ban_ledger_enabled:
+        c.execute("INSERT OR IGNORE INTO ban_ledger_state VALUES ('disabled_at', ?)", (time.time(),))
+    else:
+        c.execute("SELECT value FROM ban_ledger_state WHERE key = 'disabled_at'")
+        if c.fetchone() is not None:
+            c.execute("DELETE FROM ban_ledger_seeded")
+            c.execute("DELETE FROM ban_ledger_state WHERE key = 'disabled_at'")
+            reseed = True
+    conn.commit()
+    conn.close()
+    return reseed
+
+
+# Sharding: each shard process owns a deterministic subset of the moderated subreddits
+def configure_shard(new_shard_id):
+    global shard_id, configs_db_filename, actions_db_filename, traces_filename, mod_log_capture_filename
+    shard_id = new_shard_id
+    db_suffix = '_dryrun' if dry_run else ''
+    configs_db_filename = f'flair_helper_configs{db_suffix}_shard{shard_id}.db'
+    actions_db_filename = f'flair_helper_actions{db_suffix}_shard{shard_id}.db'
+    traces_filename = f'{logs_dir}traces_shard{shard_id}.ndjson'
+    if mod_log_capture_filename:
+        directory, name = os.path.split(mod_log_capture_filename)
+        stem, dot, extension = name.partition('.')
+        mod_log_capture_filename = os.path.join(directory, f'{stem}_shard{shard_id}{dot}{extension}')
+
+def get_shard_for_subreddit(subreddit_name):
+    subreddit_key = subreddit_name.lower()
+    if subreddit_key in shard_map:
+        return shard_map[subreddit_key] % shard_count
+    # crc32 rather than hash() so every process agrees on the assignment
+    return zlib.crc32(subreddit_key.encode('utf-8')) % shard_count
+
+def is_subreddit_in_shard(subreddit_name):
+    if shard_id is None or shard_count <= 1:
+        return True
+    return get_shard_for_subreddit(subreddit_name) == shard_id
 
-        # Truncate the modlog_reason to 250 characters
-        cleaned_modlog_reason = cleaned_modlog_reason[:250]
+def is_primary_shard():
+    # Work that isn't tied to one subreddit (the inbox, mod invites, Telegram polling) runs in shard 0 only
+    return shard_id is None or shard_id == 0
 
-        flair_config = {
-            "templateId": flair_id,
-            "notes": flair_details,
-            "approve": flair_id in yaml_config.get('approve', {}),
-            "remove": flair_id in yaml_config.get('remove', {}),
-            "lock": flair_id in yaml_config.get('lock_post', {}),
-            "spoiler": flair_id in yaml_config.get('spoiler_post', {}),
-            "clearPostFlair": flair_id in yaml_config.get('remove_link_flair', {}),
-            "modlogReason": cleaned_modlog_reason,
-            "comment": {
-                "enabled": flair_id in yaml_config.get('comment', {}),
-                "body": flair_details,
-                "lockComment": yaml_config.get('comment_locked', {}).get(flair_id, False),
-                "stickyComment": yaml_config.get('comment_stickied', {}).get(flair_id, False),
-                "distinguish": True,
-                "headerFooter": True
-            },
-            "nukeUserComments": flair_id in yaml_config.get('nukeUserComments', {}),
-            "usernote": {
-                "enabled": flair_id in yaml_config.get('usernote', {}),
-                "note": yaml_config.get('usernote', {}).get(flair_id, '')
-            },
-            "contributor": {
-                "enabled": flair_id in yaml_config.get('add_contributor', {}) or flair_id in yaml_config.get('remove_contributor', {}),
-                "action": "add" if flair_id in yaml_config.get('add_contributor', {}) else "add"
-            },
-            "userFlair": {
-                "enabled": flair_id in yaml_config.get('set_author_flair_text', {}) or
-                           flair_id in yaml_config.get('set_author_flair_css_class', {}) or
-                           flair_id in yaml_config.get('set_author_flair_template_id', {}),
-                "text": yaml_config.get('set_author_flair_text', {}).get(flair_id, ''),
-                "cssClass": yaml_config.get('set_author_flair_css_class', {}).get(flair_id, ''),
-                "templateId": yaml_config.get('set_author_flair_template_id', {}).get(flair_id, '')
-            },
-            "ban": {
-                "enabled": flair_id in yaml_config.get('bans', {}),
-                "duration": "" if yaml_config.get('bans', {}).get(flair_id, 0) is True else yaml_config.get('bans', {}).get(flair_id, 0),
-                "message": yaml_config.get('ban_message', {}).get(flair_id, ''),
-                "modNote": cleaned_mod_note
-            },
-            "unban": flair_id in yaml_config.get('unbans', {}),
-            "sendToWebhook": flair_id in yaml_config.get('send_to_webhook', [])
-        }
+def create_shards_database():
+    conn = sqlite3.connect(shards_db_filename)
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS shards
+                 (shard_id INTEGER PRIMARY KEY,
+                  pid INTEGER,
+                  last_heartbeat REAL,
+                  subreddit_count INTEGER,
+                  pending_actions INTEGER)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS shard_events
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  shard_id INTEGER,
+                  event TEXT,
+                  subreddit TEXT,
+                  details TEXT,
+                  created_at REAL)''')
+    conn.commit()
+    conn.close()
 
-        json_config.append(flair_config)
+def record_shard_heartbeat(subreddit_count, pending_actions):
+    conn = sqlite3.connect(shards_db_filename, timeout=10)
+    c = conn.cursor()
+    c.execute("INSERT OR REPLACE INTO shards VALUES (?, ?, ?, ?, ?)", (shard_id, os.getpid(), time.time(), subreddit_count, pending_actions))
+    conn.commit()
+    conn.close()
+
+def get_shard_heartbeats():
+    conn = sqlite3.connect(shards_db_filename, timeout=10)
+    c = conn.cursor()
+    c.execute("SELECT shard_id, pid, last_heartbeat, subreddit_count, pending_actions FROM shards")
+    heartbeats = {row[0]: row[1:] for row in c.fetchall()}
+    conn.close()
+    return heartbeats
+
+# Shard events: one shard telling another about a subreddit it owns, e.g. shard 0 accepting a mod invite for it.
+# Each shard polls for its own events every shard_event_poll_interval seconds.
+shard_mod_log_subreddits = defaultdict(dict)  # Account -> {lowercase name: display name} of the subreddits its mod log stream covers in this shard
+shard_mod_log_changed = set()  # Accounts whose set changed; their monitor_mod_log then rebuilds its stream
+
+def post_shard_event(target_shard_id, event, subreddit_name, details=None):
+    conn = sqlite3.connect(shards_db_filename, timeout=10)
+    c = conn.cursor()
+    c.execute("INSERT INTO shard_events (shard_id, event, subreddit, details, created_at) VALUES (?, ?, ?, ?, ?)",
+              (target_shard_id, event, subreddit_name, json.dumps(details or {}), time.time()))
+    c.execute("DELETE FROM shard_events WHERE created_at < ?", (time.time() - 86400,))  # Every shard has long since read them
+    conn.commit()
+    conn.close()
+
+def get_shard_events(after_id):
+    conn = sqlite3.connect(shards_db_filename, timeout=10)
+    c = conn.cursor()
+    c.execute("SELECT id, event, subreddit, details FROM shard_events WHERE shard_id = ? AND id > ? ORDER BY id", (shard_id, after_id))
+    events = [(row[0], row[1], row[2], json.loads(row[3])) for row in c.fetchall()]
+    conn.close()
+    return events
 
-    print(f"YAML to JSON Conversion complete.")
+def get_last_shard_event_id():
+    conn = sqlite3.connect(shards_db_filename, timeout=10)
+    c = conn.cursor()
+    c.execute("SELECT COALESCE(MAX(id), 0) FROM shard_events")
+    last_event_id = c.fetchone()[0]
+    conn.close()
+    return last_event_id
+
+def add_shard_mod_log_subreddit(account, subreddit_name):
+    if subreddit_name.lower() not in shard_mod_log_subreddits[account]:
+        shard_mod_log_subreddits[account][subreddit_name.lower()] = subreddit_name
+        shard_mod_log_changed.add(account)
+
+def remove_shard_mod_log_subreddit(account, subreddit_name):
+    if shard_mod_log_subreddits[account].pop(subreddit_name.lower(), None) is not None:
+        shard_mod_log_changed.add(account)
+
+async def process_shard_events(after_id):
+    # Applies this shard's events newer than after_id; returns the last one seen
+    for event_id, event, subreddit_name, details in get_shard_events(after_id):
+        if event == 'subreddit_added' and details.get('account') in reddit_clients:
+            print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Shard {shard_id} now streams the mod log of /r/{subreddit_name}") if debugmode else None
+            register_subreddit_account(subreddit_name, reddit_clients[details['account']])
+        elif event == 'wiki_revised' and reddit_clients:
+            account, account_reddit = next(iter(reddit_clients.items()))
+            reload_configs_extending_page(account_reddit, account_usernames.get(account), subreddit_name, details.get('details'))
+        after_id = event_id
+    return after_id
+
+async def run_shard_events():
+    last_event_id = get_last_shard_event_id()
+    while True:
+        await asyncio.sleep(shard_event_poll_interval)
+        try:
+            last_event_id = await process_shard_events(last_event_id)
+        except sqlite3.Error as e:
+            await error_handler(f"run_shard_events: Error reading events for shard {shard_id}: {e}")
+
+async def shard_heartbeat():
+    while True:
+        try:
+            record_shard_heartbeat(len(get_stored_subreddits()), len(get_pending_submission_ids_from_database()))
+        except sqlite3.Error as e:
+            await error_handler(f"shard_heartbeat: Error recording heartbeat for shard {shard_id}: {e}")
+        await asyncio.sleep(shard_heartbeat_interval)
+
+def run_shard_coordinator(num_shards):
+    # Spawns one bot process per shard and restarts any shard that exits or stops sending heartbeats
+    create_shards_database()
+    script_path = os.path.abspath(__file__)
+
+    def spawn_shard(index):
+        print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: [Coordinator] Starting shard {index}/{num_shards}")
+        command = [sys.executable, script_path, '--shard-id', str(index), '--shards', str(num_shards)]
+        if mod_log_capture_filename:
+            command += ['--record', mod_log_capture_filename]
+        if dry_run:
+            command.append('--dry-run')
+        return subprocess.Popen(command)
+
+    processes = {index: spawn_shard(index) for index in range(num_shards)}
+    started_at = {index: time.time() for index in range(num_shards)}
+
+    try:
+        while True:
+            time.sleep(shard_heartbeat_interval)
+            heartbeats = get_shard_heartbeats()
+            for index, process in processes.items():
+                exit_code = process.poll()
+                heartbeat = heartbeats.get(index)
+                last_seen = heartbeat[1] if heartbeat and heartbeat[0] == process.pid else started_at[index]
+
+                if exit_code is not None:
+                    errors_logger.error(f"[Coordinator] Shard {index} exited with code {exit_code}. Restarting.")
+                elif time.time() - last_seen > shard_heartbeat_timeout:
+                    errors_logger.error(f"[Coordinator] Shard {index} missed heartbeats for {int(time.time() - last_seen)} seconds. Restarting.")
+                    process.terminate()
+                    try:
+                        process.wait(timeout=30)
+                    except subprocess.TimeoutExpired:
+                        process.kill()
+                else:
+                    if heartbeat and verbosemode:
+                        print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: [Coordinator] Shard {index}: pid {heartbeat[0]}, {heartbeat[2]} subreddits, {heartbeat[3]} pending submissions")
+                    continue
+
+                processes[index] = spawn_shard(index)
+                started_at[index] = time.time()
+    except KeyboardInterrupt:
+        for process in processes.values():
+            process.terminate()
+
+
+# Multi-account credential pool: each praw.ini section gets its own Reddit client (and therefore its own rate budget)
+reddit_clients = {}  # praw.ini section -> asyncpraw.Reddit
+account_usernames = {}  # praw.ini section -> bot username
+subreddit_accounts = {}  # lowercased subreddit name -> praw.ini section that owns it
+
+def get_account_for_reddit(reddit):
+    return next((account for account, client in reddit_clients.items() if client is reddit), None)
+
+def get_reddit_for_subreddit(subreddit_name, default=None):
+    account = subreddit_accounts.get(subreddit_name.lower()) if subreddit_name else None
+    return reddit_clients.get(account, default)
+
+def is_subreddit_owned_by(subreddit_name, reddit):
+    # Subreddits moderated by several bot accounts are only handled by the first account listed in config.reddit_accounts
+    owner = subreddit_accounts.get(subreddit_name.lower())
+    return owner is None or reddit_clients.get(owner) is reddit
+
+def register_subreddit_account(subreddit_name, reddit):
+    # Called when an account accepts a mod invite. A shard's mod log streams only cover the subreddits it owned when it
+    # started, and only shard 0 reads the inbox, so a subreddit owned by another shard is passed on through the shards database.
+    account = get_account_for_reddit(reddit)
+    if account is None:
+        return
+    if not is_subreddit_in_shard(subreddit_name):
+        post_shard_event(get_shard_for_subreddit(subreddit_name), 'subreddit_added', subreddit_name, {'account': account})
+        return
+    subreddit_accounts.setdefault(subreddit_name.lower(), account)
+    upsert_moderated_subreddit(account, subreddit_name)
+    if shard_id is not None and shard_count > 1 and is_subreddit_owned_by(subreddit_name, reddit):
+        add_shard_mod_log_subreddit(account, subreddit_name)
+
+def unregister_subreddit_account(subreddit_name, reddit):
+    # Called when an account is removed as a moderator; another account that moderates the subreddit takes it over at the next reconcile
+    account = get_account_for_reddit(reddit)
+    if account is not None:
+        if subreddit_accounts.get(subreddit_name.lower()) == account:
+            del subreddit_accounts[subreddit_name.lower()]
+        delete_moderated_subreddit(account, subreddit_name)
+        remove_shard_mod_log_subreddit(account, subreddit_name)
+
+def get_account_rate_limits():
+    # asyncprawcore tracks the X-Ratelimit headers per client; 'remaining' is None until the first request
+    return {account: dict(client.auth.limits) for account, client in reddit_clients.items()}
+
+async def build_subreddit_account_map():
+    subreddit_accounts.clear()
+    for account, client in reddit_clients.items():
+        for subreddit_name in await get_moderated_subreddit_names(client):
+            subreddit_accounts.setdefault(subreddit_name.lower(), account)
+    print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Assigned {len(subreddit_accounts)} subreddits across {len(reddit_clients)} accounts") if debugmode else None
+
+
+# Moderated-subreddit registry: which subreddits each account moderates, kept in the configs database so startup and
+# config refreshes don't page through moderator_subreddits(). Updated from mod invites and mod log events, and
+# reconciled against Reddit every moderated_subreddits_reconcile_interval seconds.
+moderated_subreddits_reconcile_interval = getattr(config, 'moderated_subreddits_reconcile_interval', 6 * 3600)
+
+def upsert_moderated_subreddit(account, subreddit_name, subreddit_id=None, permissions=None):
+    conn = sqlite3.connect(configs_db_filename)
+    c = conn.cursor()
+    c.execute('''INSERT INTO moderated_subreddits VALUES (?, ?, ?, ?, ?, (SELECT COUNT(*) > 0 FROM configs WHERE subreddit = ? COLLATE NOCASE), ?)
+                 ON CONFLICT(account, subreddit) DO UPDATE SET display_name = excluded.display_name,
+                 subreddit_id = COALESCE(excluded.subreddit_id, subreddit_id), permissions = COALESCE(excluded.permissions, permissions),
+                 has_config = excluded.has_config, updated_at = excluded.updated_at''',
+              (account, subreddit_name.lower(), subreddit_name, subreddit_id, json.dumps(permissions) if permissions is not None else None, subreddit_name, time.time()))
+    conn.commit()
+    conn.close()
+
+def delete_moderated_subreddit(account, subreddit_name):
+    conn = sqlite3.connect(configs_db_filename)
+    c = conn.cursor()
+    c.execute("DELETE FROM moderated_subreddits WHERE account = ? AND subreddit = ?", (account, subreddit_name.lower()))
+    conn.commit()
+    conn.close()
+
+def get_moderated_subreddits(account):
+    conn = sqlite3.connect(configs_db_filename)
+    c = conn.cursor()
+    c.execute("SELECT display_name, subreddit_id, permissions, has_config FROM moderated_subreddits WHERE account = ? ORDER BY subreddit", (account,))
+    rows = [{'display_name': row[0], 'id': row[1], 'permissions': json.loads(row[2]) if row[2] else None, 'has_config': bool(row[3])} for row in c.fetchall()]
+    conn.close()
+    return rows
+
+def set_subreddit_has_config(subreddit_name, has_config):
+    conn = sqlite3.connect(configs_db_filename)
+    c = conn.cursor()
+    c.execute("UPDATE moderated_subreddits SET has_config = ? WHERE subreddit = ?", (int(has_config), subreddit_name.lower()))
+    conn.commit()
+    conn.close()
+
+async def sync_moderated_subreddits(reddit):
+    # Full reconcile of one account's registry rows against moderator_subreddits(); returns (added, removed) names
+    account = get_account_for_reddit(reddit)
+    bot_username = account_usernames.get(account)
+    create_configs_database()
+    known = {row['display_name'].lower(): row['display_name'] for row in get_moderated_subreddits(account)}
+    seen = set()
+    added = []
+    async for subreddit in reddit.user.moderator_subreddits():
+        if bot_username and f"u_{bot_username}" in subreddit.display_name:
+            continue  # Skip the bot's own user page
+        seen.add(subreddit.display_name.lower())
+        if subreddit.display_name.lower() not in known:
+            added.append(subreddit.display_name)
+        upsert_moderated_subreddit(account, subreddit.display_name, getattr(subreddit, 'name', None), getattr(subreddit, 'mod_permissions', None))
+    removed = [display_name for name, display_name in known.items() if name not in seen]
+    for subreddit_name in removed:
+        delete_moderated_subreddit(account, subreddit_name)
+    increment_metric('flair_helper_moderated_subreddit_syncs_total', account=account)
+    return added, removed
+
+async def get_moderated_subreddit_names(reddit):
+    # Served from the registry; only an account with no registry rows yet (first start) pages through Reddit
+    account = get_account_for_reddit(reddit)
+    if account is None:
+        return [subreddit.display_name async for subreddit in reddit.user.moderator_subreddits()]
+    create_configs_database()
+    rows = get_moderated_subreddits(account)
+    if not rows:
+        await sync_moderated_subreddits(reddit)
+        rows = get_moderated_subreddits(account)
+    return [row['display_name'] for row in rows]
+
+async def reconcile_moderated_subreddits():
+    while True:
+        await asyncio.sleep(moderated_subreddits_reconcile_interval)
+        for account, client in reddit_clients.items():
+            try:
+                added, removed = await sync_moderated_subreddits(client)
+            except Exception as e:
+                await error_handler(f"Error reconciling moderated subreddits for {account}: {str(e)}", notify_discord=True)
+                continue
+            if added or removed:
+                print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Moderated subreddits for {account_usernames[account]} changed. Added: {added}, removed: {removed}") if debugmode else None
+            for subreddit_name in removed:
+                if subreddit_accounts.get(subreddit_name.lower()) == account:
+                    del subreddit_accounts[subreddit_name.lower()]
+                remove_shard_mod_log_subreddit(account, subreddit_name)
+            for subreddit_name in added:
+                subreddit_accounts.setdefault(subreddit_name.lower(), account)
+                if is_subreddit_in_shard(subreddit_name) and is_subreddit_owned_by(subreddit_name, client):
+                    if shard_id is not None and shard_count > 1:
+                        add_shard_mod_log_subreddit(account, subreddit_name)
+                    await fetch_and_cache_configs(client, account_usernames[account], single_sub=subreddit_name)
+
+
+# Metrics: counters, gauges and latency histograms exposed in Prometheus text format on a local HTTP endpoint
+metrics_latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+metrics_counters = defaultdict(float)  # (name, labels) -> value
+metrics_gauges = {}  # (name, labels) -> value
+metrics_histograms = {}  # (name, labels) -> [bucket counts, sum, count]
+metrics_descriptions = {
+    'flair_helper_stage_duration_seconds': ('histogram', 'Time spent in each pipeline stage (ingest, hydrate, execute)'),
+    'flair_helper_action_duration_seconds': ('histogram', 'Time spent in each action handler'),
+    'flair_helper_actions_total': ('counter', 'Flair actions processed, by action and result'),
+    'flair_helper_mod_log_entries_total': ('counter', 'Mod log entries received, by action'),
+    'flair_helper_cache_requests_total': ('counter', 'Cache lookups, by cache and result'),
+    'flair_helper_reddit_requests_total': ('counter', 'HTTP requests sent to Reddit, by account and status'),
+    'flair_helper_reddit_ratelimit_remaining': ('gauge', 'Reddit API calls remaining in the current window'),
+    'flair_helper_reddit_ratelimit_used': ('gauge', 'Reddit API calls used in the current window'),
+    'flair_helper_reddit_ratelimit_reset_seconds': ('gauge', 'Seconds until the Reddit rate limit window resets'),
+    'flair_helper_pending_actions': ('gauge', 'Actions waiting in the actions database'),
+    'flair_helper_pending_submissions': ('gauge', 'Submissions with pending actions in the actions database'),
+    'flair_helper_inflight_submissions': ('gauge', 'Submissions currently being processed'),
+    'flair_helper_event_loop_lag_seconds': ('gauge', 'How late the event loop woke a 1 second timer'),
+    'flair_helper_memory_rss_bytes': ('gauge', 'Resident memory of the bot process'),
+    'flair_helper_dry_run_calls_total': ('counter', 'Reddit writes recorded instead of sent in dry run, by action'),
+    'flair_helper_dry_run_api_calls_total': ('counter', 'HTTP requests those dry-run writes would have cost, by action'),
+    'flair_helper_startup_import_seconds': ('gauge', 'Time spent importing the bot module at startup'),
+    'flair_helper_startup_seconds': ('gauge', 'Time from process start until every task was started'),
+    'flair_helper_config_sweep_remaining': ('gauge', 'Subreddits queued in the startup config sweep when it began'),
+    'flair_helper_config_sweep_seconds': ('gauge', 'Duration of the last full config sweep'),
+    'flair_helper_buffered_mod_log_entries': ('gauge', 'Mod log entries waiting for their subreddit config to load'),
+    'flair_helper_buffered_mod_log_entries_total': ('counter', 'Mod log entries buffered while their subreddit config loaded'),
+    'flair_helper_moderated_subreddit_syncs_total': ('counter', 'Full moderator_subreddits() enumerations, by account'),
+    'flair_helper_config_reload_requests_total': ('counter', 'Config reloads requested from the mod log, by reason'),
+    'flair_helper_config_reloads_total': ('counter', 'Debounced config reloads run by the background reloader, by result'),
+    'flair_helper_pending_config_reloads': ('gauge', 'Subreddits waiting for a debounced config reload'),
+    'flair_helper_compiled_configs': ('gauge', 'Distinct compiled configs held in memory (shared by subreddits with identical configs)'),
+    'flair_helper_compiled_config_snapshot_loads_total': ('counter', 'Compiled config snapshot loads at startup, by result'),
+    'flair_helper_bot_config_revisions_skipped_total': ('counter', 'wikirevise entries for config write-backs by the bot that were not reloaded'),
+    'flair_helper_cpu_offload_calls_total': ('counter', 'CPU-bound calls, by kind and where they ran (inline, thread, process)'),
+    'flair_helper_cpu_offload_inflight': ('gauge', 'CPU-bound calls queued or running in the offload pool'),
+    'flair_helper_cpu_offload_queue_seconds': ('histogram', 'Time offloaded calls waited for a pool worker, by kind'),
+    'flair_helper_cpu_offload_run_seconds': ('histogram', 'Time offloaded calls took in the pool worker, by kind'),
+    'flair_helper_cpu_offload_fallbacks_total': ('counter', 'Offloaded calls run in a thread because the pool failed, by kind'),
+    'flair_helper_ban_ledger_lookups_total': ('counter', 'Escalating ban decisions, by source (ledger, usernotes)'),
+    'flair_helper_ban_ledger_seeds_total': ('counter', 'Subreddits whose ban ledger was seeded from usernotes'),
+    'flair_helper_usernotes_writes_total': ('counter', 'Usernotes page saves, by result (written, conflict, failed)'),
+    'flair_helper_usernotes_compactions_total': ('counter', 'Usernotes compaction runs per subreddit, by result (compacted, unchanged, conflict, failed)'),
+    'flair_helper_usernotes_compacted_notes_total': ('counter', 'Flair Helper usernotes removed or folded into a ban summary by compaction'),
+    'flair_helper_usernotes_compaction_blob_bytes_total': ('counter', 'Usernotes blob size seen by compaction, by stage (before, after)'),
+}
+reddit_ratelimit_resets = {}  # account -> unix time the current rate limit window resets
+
+def metric_key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def increment_metric(name, value=1, **labels):
+    metrics_counters[metric_key(name, labels)] += value
+
+def set_gauge(name, value, **labels):
+    metrics_gauges[metric_key(name, labels)] = value
+
+def observe_metric(name, value, **labels):
+    key = metric_key(name, labels)
+    if key not in metrics_histograms:
+        metrics_histograms[key] = [[0] * len(metrics_latency_buckets), 0.0, 0]
+    histogram = metrics_histograms[key]
+    for index, bucket in enumerate(metrics_latency_buckets):
+        if value <= bucket:
+            histogram[0][index] += 1
+    histogram[1] += value
+    histogram[2] += 1
+
+def get_memory_rss_bytes():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def update_metrics_gauges():
+    conn = sqlite3.connect(actions_db_filename)
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*), COUNT(DISTINCT submission_id) FROM actions WHERE completed = 0")
+    pending_actions, pending_submissions = c.fetchone()
+    conn.close()
+    set_gauge('flair_helper_pending_actions', pending_actions)
+    set_gauge('flair_helper_pending_submissions', pending_submissions)
+
+    for account, limits in get_account_rate_limits().items():
+        if limits.get('remaining') is not None:
+            set_gauge('flair_helper_reddit_ratelimit_remaining', limits['remaining'], account=account)
+            set_gauge('flair_helper_reddit_ratelimit_used', limits['used'], account=account)
+        if account in reddit_ratelimit_resets:
+            set_gauge('flair_helper_reddit_ratelimit_reset_seconds', max(reddit_ratelimit_resets[account] - time.time(), 0), account=account)
+
+    set_gauge('flair_helper_memory_rss_bytes', get_memory_rss_bytes())
+
+def format_metric_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    formatted = []
+    for key, value in pairs:
+        escaped_value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        formatted.append(f'{key}="{escaped_value}"')
+    return '{' + ','.join(formatted) + '}'
+
+def render_prometheus_metrics():
+    lines = []
+    described = set()
+
+    def describe(name):
+        if name not in described and name in metrics_descriptions:
+            metric_type, help_text = metrics_descriptions[name]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+        described.add(name)
+
+    for (name, labels), value in sorted(metrics_counters.items()):
+        describe(name)
+        lines.append(f"{name}{format_metric_labels(labels)} {value}")
+
+    for (name, labels), value in sorted(metrics_gauges.items()):
+        describe(name)
+        lines.append(f"{name}{format_metric_labels(labels)} {value}")
+
+    for (name, labels), (bucket_counts, total, count) in sorted(metrics_histograms.items()):
+        describe(name)
+        for bucket, bucket_count in zip(metrics_latency_buckets, bucket_counts):
+            lines.append(f"{name}_bucket{format_metric_labels(labels, [('le', bucket)])} {bucket_count}")
+        lines.append(f"{name}_bucket{format_metric_labels(labels, [('le', '+Inf')])} {count}")
+        lines.append(f"{name}_sum{format_metric_labels(labels)} {total}")
+        lines.append(f"{name}_count{format_metric_labels(labels)} {count}")
+
+    return "\n".join(lines) + "\n"
+
+class InstrumentedRequestor(asyncprawcore.Requestor):
+    # Counts every HTTP request per account and remembers when the account's rate limit window resets
+
+    def __init__(self, *args, account=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.account = account
+
+    @asynccontextmanager
+    async def request(self, *args, **kwargs):
+        async with super().request(*args, **kwargs) as response:
+            increment_metric('flair_helper_reddit_requests_total', account=self.account, status=response.status)
+            trace = current_trace.get()
+            if trace is not None:
+                trace['reddit_calls'] += 1
+            if 'x-ratelimit-reset' in response.headers:
+                reddit_ratelimit_resets[self.account] = time.time() + int(float(response.headers['x-ratelimit-reset']))
+            if capture_file is not None:
+                await capture_response(args[0], args[1], kwargs, response)
+            yield response
+
+async def monitor_event_loop_lag(interval=1):
+    while True:
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        set_gauge('flair_helper_event_loop_lag_seconds', max(time.perf_counter() - expected, 0))
+
+async def handle_metrics_request(request):
+    update_metrics_gauges()
+    return web.Response(text=render_prometheus_metrics(), content_type='text/plain', charset='utf-8', headers={'X-Content-Type-Options': 'nosniff'})
+
+async def run_metrics_server():
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics_request)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    port = metrics_port + (shard_id or 0)  # Each shard listens on its own port
+    site = web.TCPSite(runner, metrics_host, port)
+    await site.start()
+    print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Metrics endpoint listening on http://{metrics_host}:{port}/metrics") if debugmode else None
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await runner.cleanup()
+
+
+# Tracing: every work item carries a trace from the mod log entry to the last action handler, across processing attempts,
+# and is written once the item is done. Each shard writes its own file.
+current_trace = contextvars.ContextVar('current_trace', default=None)
+
+traces_filename = f'{logs_dir}traces.ndjson'  # traces_shardN.ndjson once configure_shard() runs
+traces_logger = logging.getLogger('traces')
+traces_logger.propagate = False
+
+def enable_tracing():
+    if not any(isinstance(handler, RotatingFileHandler) for handler in traces_logger.handlers):
+        traces_handler = RotatingFileHandler(traces_filename, maxBytes=getattr(config, 'trace_log_max_bytes', 10 * 1024 * 1024), backupCount=getattr(config, 'trace_log_backup_count', 5))
+        traces_handler.setFormatter(logging.Formatter('%(message)s'))
+        traces_logger.addHandler(traces_handler)
+        traces_logger.setLevel(logging.INFO)
+
+def start_trace(submission_id, subreddit_name, mod_name, created_utc=None, ingested_at=None):
+    picked_up_at = time.time()
+    trace = {
+        'submission_id': submission_id,
+        'subreddit': subreddit_name,
+        'mod': mod_name,
+        'created_utc': created_utc,
+        'ingested_at': ingested_at,
+        'picked_up_at': picked_up_at,
+        'queue_wait': picked_up_at - ingested_at if ingested_at else None,
+        'handlers': [],
+        'reddit_calls': 0,
+        'attempts': 0,
+    }
+    current_trace.set(trace)
+    return trace
+
+def finish_trace(trace):
+    current_trace.set(None)
+    if not tracing_enabled:
+        return
+    enable_tracing()
+    trace['completed_at'] = time.time()
+    if trace['created_utc']:
+        trace['end_to_end'] = trace['completed_at'] - trace['created_utc']
+    traces_logger.info(json.dumps(trace))
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    index = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[index]
+
+def summarize_traces(filenames=None):
+    # Flair-to-action latency (handler end minus mod log created_utc) per subreddit and per action type
+    if filenames is None:
+        # traces.ndjson or every shard's traces_shardN.ndjson, with their rotated files
+        filenames = sorted(os.path.join(logs_dir, name) for name in os.listdir(logs_dir) if name.startswith('traces') and '.ndjson' in name)
+
+    by_subreddit = defaultdict(list)
+    by_action = defaultdict(list)
+    for filename in filenames:
+        if not os.path.exists(filename):
+            continue
+        with open(filename) as traces_file:
+            for line in traces_file:
+                try:
+                    trace = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if not trace.get('created_utc'):
+                    continue
+                for handler in trace['handlers']:
+                    if 'end' in handler:
+                        latency = handler['end'] - trace['created_utc']
+                        by_subreddit[trace['subreddit']].append(latency)
+                        by_action[handler['action']].append(latency)
+
+    def summarize(groups):
+        summary = {}
+        for name, latencies in sorted(groups.items(), key=lambda item: str(item[0]).lower()):
+            latencies.sort()
+            summary[name] = {
+                'count': len(latencies),
+                'p50': percentile(latencies, 0.50),
+                'p95': percentile(latencies, 0.95),
+                'p99': percentile(latencies, 0.99),
+            }
+        return summary
+
+    return {'subreddits': summarize(by_subreddit), 'actions': summarize(by_action)}
+
+
+# Capture: tees mod log entries, cached configs and the Reddit responses behind them into a gzip NDJSON file
+# that bench/replay_capture.py can feed back through handle_mod_log_entry offline
+capture_format_version = 1
+capture_file = None
+clock = time.time  # Mod log ingestion reads the time through this so a replay can substitute a virtual clock
+
+def start_capture(filename):
+    global capture_file, mod_log_capture_filename
+    mod_log_capture_filename = filename
+    capture_file = gzip.open(filename, 'at', encoding='utf-8')
+    write_capture_record('header', version=capture_format_version, shard_id=shard_id, accounts=dict(account_usernames))
+    create_configs_database()
+    for subreddit_name in get_stored_subreddits():
+        write_capture_record('config', subreddit=subreddit_name, config=get_cached_config(subreddit_name))
+    print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Capturing mod log traffic to {filename}") if debugmode else None
+
+def close_capture():
+    global capture_file
+    if capture_file is not None:
+        capture_file.close()
+        capture_file = None
+
+def write_capture_record(record_type, **fields):
+    if capture_file is None:
+        return
+    capture_file.write(json.dumps({'type': record_type, 't': clock(), **fields}) + "\n")
+    if record_type == 'modlog':
+        capture_file.flush()  # Keep every captured entry on disk if the bot is killed
+
+def read_capture(filename):
+    with gzip.open(filename, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        except (EOFError, json.JSONDecodeError):
+            return  # The last record of a capture that was cut off mid-write
+
+def mod_log_entry_to_dict(log_entry):
+    entry = {key: value for key, value in vars(log_entry).items() if not key.startswith('_')}
+    entry['mod'] = str(log_entry.mod)
+    return entry
+
+async def capture_response(method, url, kwargs, response):
+    path = urlparse(url).path
+    if path.endswith('/access_token'):
+        return  # Never write OAuth exchanges to disk
+    data = kwargs.get('data') or kwargs.get('json')
+    write_capture_record('response', method=method, path=path, params=dict(kwargs.get('params') or {}),
+                         data=dict(data) if data else None, status=response.status, body=await response.text(),
+                         submission_id=(current_trace.get() or {}).get('submission_id'))
+
+
+# Legacy YAML configs: parsed with libyaml's CSafeLoader when PyYAML was built with it (large pages off the event loop,
+# see run_cpu_bound), and the converted JSON config is kept by source hash so an unchanged page is only converted once
+yaml_conversion_cache = OrderedDict()  # Source hash -> converted config as JSON text, least recently used first
+yaml_conversion_cache_size = 256
+
+async def parse_yaml_config(wiki_content):
+    # Raises yaml.YAMLError for an invalid page
+    source_hash = get_source_hash(wiki_content)
+    converted = yaml_conversion_cache.get(source_hash)
+    increment_metric('flair_helper_cache_requests_total', cache='yaml_conversion', result='hit' if converted is not None else 'miss')
+    if converted is None:
+        converted = await run_cpu_bound('yaml', load_yaml_config_json, wiki_content, size=len(wiki_content))
+        yaml_conversion_cache[source_hash] = converted
+        while len(yaml_conversion_cache) > yaml_conversion_cache_size:
+            yaml_conversion_cache.popitem(last=False)
+    yaml_conversion_cache.move_to_end(source_hash)
+    return json.loads(converted)  # A fresh copy; callers may modify it
 
-    return json_config
 
 
 @reddit_error_handler
@@ -596,6 +1587,109 @@ def correct_config(config):
     return corrected_config
 
 
+# Shared base configs: a JSON page whose GeneralConfiguration has "extends": "r/Templates" (or "r/Templates/wiki/page")
+# inherits that page's GeneralConfiguration and flair entries and overrides only what it sets. Each base page is fetched
+# and compiled once, kept for base_config_ttl seconds, and dropped straight away when its wikirevise is seen.
+base_configs = {}  # Base key ("r/templates/wiki/flair_helper") -> {'config', 'source_hash', 'fetched_at'}
+base_config_locks = defaultdict(asyncio.Lock)
+
+def parse_config_reference(reference):
+    # "r/Templates", "/r/Templates/wiki/network_page" or "Templates" -> (subreddit name, wiki page)
+    reference = reference.strip().strip('/')
+    if reference.lower().startswith('r/'):
+        reference = reference[2:]
+    subreddit_name, _, page = reference.partition('/wiki/')
+    return subreddit_name.strip('/'), page.strip('/') or 'flair_helper'
+
+def get_base_config_key(reference):
+    subreddit_name, page = parse_config_reference(reference)
+    return f"r/{subreddit_name}/wiki/{page}".lower()
+
+async def parse_config_content(wiki_content):
+    if wiki_content.startswith('['):
+        return json.loads(wiki_content)
+    return await parse_yaml_config(wiki_content)
+
+def get_general_configuration(config):
+    # config[0]['GeneralConfiguration'] of a parsed page, or None if the page doesn't have that shape
+    if isinstance(config, list) and config and isinstance(config[0], dict) and isinstance(config[0].get('GeneralConfiguration'), dict):
+        return config[0]['GeneralConfiguration']
+    return None
+
+def get_config_extends(config):
+    # The page's "extends" reference, or None if it has none or it isn't a string
+    base_reference = (get_general_configuration(config) or {}).get('extends')
+    return (base_reference.strip() or None) if isinstance(base_reference, str) else None
+
+def merge_config_entries(base, override):
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_config_entries(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+def merge_base_config(base_config, config):
+    # The subreddit's GeneralConfiguration keys and flair entries override the base's; flair entries match on templateId
+    general_config = merge_config_entries(base_config[0]['GeneralConfiguration'], config[0]['GeneralConfiguration'])
+    general_config.pop('extends', None)
+    flairs = {flair.get('templateId'): flair for flair in base_config[1:] if isinstance(flair, dict)}
+    for flair in config[1:]:
+        if not isinstance(flair, dict):
+            continue
+        template_id = flair.get('templateId')
+        flairs[template_id] = merge_config_entries(flairs[template_id], flair) if template_id in flairs else flair
+    return [{'GeneralConfiguration': general_config}] + list(flairs.values())
+
+async def get_base_config(reddit, reference):
+    key = get_base_config_key(reference)
+    async with base_config_locks[key]:
+        base = base_configs.get(key)
+        fresh = base is not None and time.time() - base['fetched_at'] < base_config_ttl
+        increment_metric('flair_helper_cache_requests_total', cache='base_config', result='hit' if fresh else 'miss')
+        if not fresh:
+            subreddit_name, page = parse_config_reference(reference)
+            base_subreddit = await get_subreddit(reddit, subreddit_name)
+            wiki_page = await base_subreddit.wiki.get_page(page)
+            wiki_content = wiki_page.content_md.strip()
+            base_config = correct_config(await parse_config_content(wiki_content))
+            if get_general_configuration(base_config) is None:
+                raise ValueError(f"{key} has no GeneralConfiguration")
+            base_config[0]['GeneralConfiguration'].pop('extends', None)  # Bases don't chain
+            base = base_configs[key] = {'config': base_config, 'source_hash': get_source_hash(wiki_content), 'fetched_at': time.time()}
+            print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Loaded base configuration {key}") if debugmode else None
+        return base
+
+async def load_base_config(reddit, subreddit, reference):
+    # The base for one subreddit's config, or None (reported) if it can't be loaded; the cached config is then kept
+    try:
+        return await get_base_config(reddit, reference)
+    except Exception as e:
+        await error_handler(f"Error loading the base configuration {reference} extended by {subreddit.display_name}: {e}", notify_discord=True)
+        return None
+
+def reload_configs_extending(reddit, bot_username, log_entry):
+    # A revision of a base page drops it from the cache and schedules a reload of every subreddit that extends it. Only the
+    # shard streaming the base's subreddit sees the revision, so it is passed on to the other shards' dependants too.
+    reload_configs_extending_page(reddit, bot_username, log_entry.subreddit, log_entry.details)
+    if shard_id is not None and shard_count > 1:
+        for other_shard_id in range(shard_count):
+            if other_shard_id != shard_id:
+                post_shard_event(other_shard_id, 'wiki_revised', log_entry.subreddit, {'details': log_entry.details})
+
+def reload_configs_extending_page(reddit, bot_username, revised_subreddit_name, details):
+    for base_key, subreddit_names in get_subreddits_by_base().items():
+        base_subreddit_name, page = parse_config_reference(base_key)
+        if base_subreddit_name != revised_subreddit_name.lower() or page not in (details or '').lower():
+            continue
+        base_configs.pop(base_key, None)
+        print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Base configuration {base_key} revised; reloading {len(subreddit_names)} subreddits") if debugmode else None
+        for subreddit_name in subreddit_names:
+            account_reddit = get_reddit_for_subreddit(subreddit_name, default=reddit)
+            request_config_reload(account_reddit, account_usernames.get(get_account_for_reddit(account_reddit), bot_username), subreddit_name, reason='base_wikirevise')
+
+
 @reddit_error_handler
 async def fetch_and_cache_configs(reddit, bot_username, max_retries=3, retry_delay=1, max_retry_delay=60, single_sub=None):
     delay_between_wiki_fetch = 1
@@ -604,8 +1698,8 @@ async def fetch_and_cache_configs(reddit, bot_username, max_retries=3, retry_del
     if single_sub:
         moderated_subreddits.append(await get_subreddit(reddit, single_sub))
     else:
-        async for subreddit in reddit.user.moderator_subreddits():
-            moderated_subreddits.append(subreddit)
+        for subreddit_name in await get_moderated_subreddit_names(reddit):
+            moderated_subreddits.append(await get_subreddit(reddit, subreddit_name))
 
     semaphore = asyncio.Semaphore(3)  # Limit the number of concurrent tasks to 4
 
@@ -613,9 +1707,13 @@ async def fetch_and_cache_configs(reddit, bot_username, max_retries=3, retry_del
     for subreddit in moderated_subreddits:
         if f"u_{bot_username}" in subreddit.display_name:
             continue  # Skip the bot's own user page
+        if not is_subreddit_in_shard(subreddit.display_name):
+            continue  # Owned by another shard
+        if not single_sub and not is_subreddit_owned_by(subreddit.display_name, reddit):
+            continue  # Owned by another bot account
 
         async with semaphore:
-            tasks.append(process_subreddit_config(reddit, subreddit, bot_username, max_retries, retry_delay, max_retry_delay, delay_between_wiki_fetch))
+            tasks.append(process_subreddit_config(reddit, subreddit, bot_username, max_retries, retry_delay, max_retry_delay, delay_between_wiki_fetch, force=bool(single_sub)))
 
     await asyncio.gather(*tasks)
     if single_sub:
@@ -624,7 +1722,7 @@ async def fetch_and_cache_configs(reddit, bot_username, max_retries=3, retry_del
         print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Completed checking all Wiki page configuration.") if debugmode else None
 
 
-async def process_subreddit_config(reddit, subreddit, bot_username, max_retries, retry_delay, max_retry_delay, delay_between_wiki_fetch):
+async def process_subreddit_config(reddit, subreddit, bot_username, max_retries, retry_delay, max_retry_delay, delay_between_wiki_fetch, force=False):
     retries = 0
 
     if colored_console_output:
@@ -632,22 +1730,50 @@ async def process_subreddit_config(reddit, subreddit, bot_username, max_retries,
     else:
         disp_subreddit_displayname = subreddit.display_name
 
+    # Sweeps skip subreddits known not to use Flair Helper; single-subreddit reloads (force) always fetch
+    if not force:
+        missing_reason = get_missing_config_reason(subreddit.display_name)
+        if missing_reason is not None:
+            print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Flair Helper configuration for {disp_subreddit_displayname} skipped ({missing_reason}, cached)") if verbosemode else None
+            return
+
     while retries < max_retries:
         wiki_content = ""  # Initialize wiki_content with a default value
+        missing_reason = 'blank page'
         try:
             # Access wiki page using asyncpraw
             wiki_page = await subreddit.wiki.get_page('flair_helper')
             wiki_content = wiki_page.content_md.strip()
             # The rest of your code to handle the wiki content goes here
+        except asyncprawcore.exceptions.NotFound:
+            missing_reason = 'no page'
+        except asyncprawcore.exceptions.Forbidden:
+            missing_reason = 'no wiki access'
         except Exception as e:
             # Handle exceptions appropriately
             await error_handler(f"Error accessing the {subreddit.display_name} flair_helper wiki page: {e}", notify_discord=True)
+            missing_reason = None  # Transient errors are not cached
 
         if not wiki_content:
-            print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Flair Helper configuration for {disp_subreddit_displayname} is blank. Skipping...") if debugmode else None
+            print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Flair Helper configuration for {disp_subreddit_displayname} is unavailable ({missing_reason or 'error'}). Skipping...") if debugmode else None
+            set_subreddit_has_config(subreddit.display_name, False)
+            if missing_reason is not None:
+                record_missing_config(subreddit.display_name, missing_reason)
             break  # Skip processing if the wiki page is blank
 
-
+        # An unchanged page (and base, for configs that extend one) needs no parsing, validation or comparison. The stored
+        # base is only used for this shortcut: if it can't be loaded, the page may no longer extend it, so parse it in full
+        base_reference = get_cached_config_base(subreddit.display_name)
+        if base_reference:
+            base = await load_base_config(reddit, subreddit, base_reference)
+            source_hash = get_source_hash(wiki_content + base['source_hash']) if base is not None else None
+        else:
+            source_hash = get_source_hash(wiki_content)
+        source_unchanged = source_hash is not None and source_hash == get_cached_source_hash(subreddit.display_name)
+        increment_metric('flair_helper_cache_requests_total', cache='config_source', result='hit' if source_unchanged else 'miss')
+        if source_unchanged:
+            print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: The Flair Helper wiki page for {disp_subreddit_displayname} is unchanged since it was last compiled.") if debugmode else None
+            break
 
         if wiki_content.strip().startswith('['):
             # Content starts with '[', assume it's JSON
@@ -677,17 +1803,17 @@ async def process_subreddit_config(reddit, subreddit, bot_username, max_retries,
 
                     # Message the Moderator who made the change
                     redditor = await reddit.redditor(mod_name_str)
-                    await redditor.message(subject, message)
+                    await reddit_write('config', '/api/compose', f"u/{mod_name_str}", redditor.message, subject, message)
                 except Exception as e:
                     await error_handler(f"Error sending message to {subreddit.display_name} or moderator {mod_name}: {str(e)}", notify_discord=True)
 
                 return
         else:
             # Content doesn't start with '[', assume it's YAML
+            import yaml
             try:
-                updated_config = yaml.safe_load(wiki_content)
+                updated_config = await parse_yaml_config(wiki_content)
                 await error_handler(f"Configuration for {subreddit.display_name} is in YAML format. Converting to JSON.", notify_discord=True)
-                updated_config = convert_yaml_to_json(updated_config)
             except yaml.YAMLError as e:
                 await error_handler(f"Invalid YAML format for {subreddit.display_name}. Error details: {str(e)}", notify_discord=True)
 
@@ -711,7 +1837,7 @@ async def process_subreddit_config(reddit, subreddit, bot_username, max_retries,
 
                     # Message the Moderator who made the change
                     redditor = await reddit.redditor(mod_name_str)
-                    await redditor.message(subject, message)
+                    await reddit_write('config', '/api/compose', f"u/{mod_name_str}", redditor.message, subject, message)
                 except Exception as e:
                     await error_handler(f"Error sending message to {subreddit.display_name} or moderator {mod_name}: {str(e)}", notify_discord=True)
 
@@ -719,12 +1845,26 @@ async def process_subreddit_config(reddit, subreddit, bot_username, max_retries,
 
 
 
-        # Perform validation and automatic correction
+        # Perform validation and automatic correction; the page is only rewritten if the correction changed something
+        parsed_config_json = json.dumps(updated_config, sort_keys=True, default=str)
         updated_config = correct_config(updated_config)
+        config_corrected = json.dumps(updated_config, sort_keys=True, default=str) != parsed_config_json
+
+        page_config = updated_config
+        base_reference = get_config_extends(page_config)
+        base_key = get_base_config_key(base_reference) if base_reference else None
+        if base_reference:
+            base = await load_base_config(reddit, subreddit, base_reference)
+            if base is None:
+                break
+            updated_config = merge_base_config(base['config'], page_config)
+            source_hash = get_source_hash(wiki_content + base['source_hash'])
+        else:
+            source_hash = get_source_hash(wiki_content)
 
         cached_config = get_cached_config(subreddit.display_name)
 
-        if cached_config is None or cached_config != updated_config:
+        if cached_config is None or cached_config.config_hash != get_config_hash(updated_config):
             # Check if the mod who edited the wiki page has the "config" permission
             wiki_revision = await get_latest_wiki_revision(subreddit)
             mod_name = wiki_revision['author']
@@ -742,16 +1882,17 @@ async def process_subreddit_config(reddit, subreddit, bot_username, max_retries,
                 # If mod_name is the bot's own username, proceed with caching the configuration
 
             try:
-                await cache_config(subreddit.display_name, updated_config)
+                await cache_config(subreddit.display_name, updated_config, source_hash=source_hash, base=base_key)
                 await error_handler(f"The [Flair Helper wiki page configuration](https://www.reddit.com/r/{subreddit.display_name}/wiki/edit/flair_helper) for {subreddit.display_name} has been successfully cached and reloaded.", notify_discord=False)
 
                 # Save the validated and corrected configuration back to the wiki page
-                await wiki_page.edit(content=json.dumps(updated_config, indent=4))
+                if config_corrected:
+                    await write_back_config(subreddit, wiki_page, page_config)
 
                 if send_pm_on_wiki_config_update:
                     try:
                         subreddit_instance = await get_subreddit(reddit, subreddit.display_name)
-                        await subreddit_instance.message(
+                        await reddit_write('config', '/api/compose', f"r/{subreddit.display_name}", subreddit_instance.message,
                             subject="Flair Helper Configuration Reloaded",
                             message=f"Changes made by {mod_name} to the [Flair Helper configuration](https://www.reddit.com/r/{subreddit.display_name}/wiki/edit/flair_helper) for /r/{subreddit.display_name} has been successfully reloaded."
                         )
@@ -762,7 +1903,7 @@ async def process_subreddit_config(reddit, subreddit, bot_username, max_retries,
                 if send_pm_on_wiki_config_update:
                     try:
                         subreddit_instance = await get_subreddit(reddit, subreddit.display_name)
-                        await subreddit_instance.message(
+                        await reddit_write('config', '/api/compose', f"r/{subreddit.display_name}", subreddit_instance.message,
                             subject="Flair Helper Configuration Error",
                             message=f"The Flair Helper configuration for /r/{subreddit.display_name} could not be cached due to errors:\n\n{e}"
                         )
@@ -770,40 +1911,59 @@ async def process_subreddit_config(reddit, subreddit, bot_username, max_retries,
                         await error_handler(f"Error sending message to {subreddit.display_name}: {e}", notify_discord=True)
         else:
             print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: The Flair Helper wiki page configuration for {disp_subreddit_displayname} has not changed.") if debugmode else None
+            set_cached_source_hash(subreddit.display_name, source_hash, base_key)  # e.g. reformatted by a write-back; skip parsing it next time
             #await asyncio.sleep(1)  # Adjust the delay as needed
         break  # Configuration loaded successfully, exit the retry loop
 
     await asyncio.sleep(delay_between_wiki_fetch)  # Add a delay between subreddit configurations
 
-# Toolbox Note Handlers
-def decompress_notes(compressed):
+# CPU offload: small payloads run inline, where handing them to a worker would cost more than it saves; large ones go to
+# a shared pool so a multi-MB usernotes rewrite doesn't stall mod log ingestion. Offloaded functions take and return plain
+# data and live in flair_helper2_offload.py, which is all a spawned worker process imports.
+cpu_offload_executor = None
+cpu_offload_inflight = 0
+
+def get_cpu_offload_executor():
+    global cpu_offload_executor
+    if cpu_offload_executor is None:
+        if cpu_offload_pool == 'process':
+            # spawn: the workers never inherit the event loop, sockets or Telegram threads of the bot process, and unpickle
+            # the offloaded functions by importing flair_helper2_offload
+            cpu_offload_executor = concurrent.futures.ProcessPoolExecutor(max_workers=cpu_offload_workers, mp_context=multiprocessing.get_context('spawn'),
+                                                                          initializer=init_offload_worker)
+        else:
+            cpu_offload_executor = concurrent.futures.ThreadPoolExecutor(max_workers=cpu_offload_workers, thread_name_prefix='fh2-offload')
+    return cpu_offload_executor
+
+async def run_cpu_bound(kind, function, *args, size=0):
+    # function(*args), inline when size (bytes of the payload) is under cpu_offload_threshold_bytes, otherwise in the pool
+    global cpu_offload_executor, cpu_offload_inflight
+    if size < cpu_offload_threshold_bytes or cpu_offload_workers <= 0:
+        increment_metric('flair_helper_cpu_offload_calls_total', kind=kind, pool='inline')
+        return function(*args)
+
+    increment_metric('flair_helper_cpu_offload_calls_total', kind=kind, pool=cpu_offload_pool)
+    cpu_offload_inflight += 1
+    set_gauge('flair_helper_cpu_offload_inflight', cpu_offload_inflight)
     try:
-        decompressed = zlib.decompress(base64.b64decode(compressed))
-        return json.loads(decompressed.decode('utf-8'))
-    except (zlib.error, base64.binascii.Error, json.JSONDecodeError) as e:
-        error_handler(f"Error decompressing usernotes: {e}", notify_discord=True)
-        return {}
-
-def compress_notes(notes):
-    compressed = base64.b64encode(zlib.compress(json.dumps(notes).encode('utf-8'))).decode('utf-8')
-    return compressed
-
-def add_usernote(notes, author, note_text, link, mod_index, usernote_type_index):
-    if author not in notes:
-        notes[author] = {"ns": []}
-
-    timestamp = int(time.time())
-    submission_id = link.split('/')[-3]
-    new_note = {
-        "n": f"[FH] {note_text}",
-        "t": timestamp,
-        "m": mod_index,
-        "l": f"l,{submission_id}",
-        "w": usernote_type_index
-    }
-    notes[author]["ns"].append(new_note)
+        result, queued_seconds, run_seconds = await asyncio.get_running_loop().run_in_executor(get_cpu_offload_executor(), timed_offload_call, function, args, time.time())
+    except concurrent.futures.BrokenExecutor as e:
+        # A worker died (e.g. killed for memory); start a fresh pool for the next call and run this one in a thread
+        increment_metric('flair_helper_cpu_offload_fallbacks_total', kind=kind)
+        print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: CPU offload pool failed ({e}); running {kind} in a thread") if debugmode else None
+        if cpu_offload_executor is not None:
+            cpu_offload_executor.shutdown(wait=False, cancel_futures=True)
+            cpu_offload_executor = None
+        return await asyncio.to_thread(function, *args)
+    finally:
+        cpu_offload_inflight -= 1
+        set_gauge('flair_helper_cpu_offload_inflight', cpu_offload_inflight)
+    observe_metric('flair_helper_cpu_offload_queue_seconds', queued_seconds, kind=kind)
+    observe_metric('flair_helper_cpu_offload_run_seconds', run_seconds, kind=kind)
+    return result
 
 
+# Toolbox Note Handlers
 async def add_escalating_ban_note(subreddit, author, ban_duration, link, mod_name):
     if ban_duration == 0:
         note_text = "FH-Ban-permanent"
@@ -820,27 +1980,7 @@ async def get_usernotes(subreddit, username, max_retries=3, retry_delay=5):
             try:
                 usernotes_wiki = await subreddit.wiki.get_page("usernotes")
                 usernotes_content = usernotes_wiki.content_md
-                usernotes_data = json.loads(usernotes_content)
-
-                if 'blob' not in usernotes_data:
-                    return []  # No usernotes exist
-
-                decompressed_notes = decompress_notes(usernotes_data['blob'])
-
-                if username not in decompressed_notes:
-                    return []  # No notes for this user
-
-                user_notes = decompressed_notes[username]['ns']
-
-                # Convert the notes to the format we need for ban tracking
-                formatted_notes = []
-                for note in user_notes:
-                    note_text = note['n']
-                    if note_text.startswith("[FH] FH-Ban-"):
-                        ban_value = note_text.split("FH-Ban-")[1]
-                        formatted_notes.append(ban_value)
-
-                return formatted_notes
+                return await run_cpu_bound('usernotes_read', read_usernote_ban_values, usernotes_content, username, size=len(usernotes_content))
 
             except Exception as e:
                 if attempt < max_retries - 1:
@@ -851,6 +1991,11 @@ async def get_usernotes(subreddit, username, max_retries=3, retry_delay=5):
                     await error_handler(error_message, notify_discord=True)
                     return []  # Return an empty list if we can't retrieve the notes
 
+# Usernotes saves pass the revision they were built from as "previous", so Reddit rejects the save with a 409 if Toolbox or
+# another bot saved the page in between. The page is then re-read and only this note is applied again on top of the new blob,
+# after a short random wait so two writers that conflicted don't keep saving at the same moment.
+USERNOTES_CONFLICT_RETRY_DELAY = (0.5, 2.0)  # Seconds, chosen uniformly
+
 @reddit_error_handler
 async def update_usernotes(subreddit, author, note_text, link, mod_name, usernote_type_name=None, max_retries=3, retry_delay=5):
     async with usernotes_lock:
@@ -858,44 +2003,111 @@ async def update_usernotes(subreddit, author, note_text, link, mod_name, usernot
             try:
                 usernotes_wiki = await subreddit.wiki.get_page("usernotes")
                 usernotes_content = usernotes_wiki.content_md
-                usernotes_data = json.loads(usernotes_content)
-
-                if 'blob' not in usernotes_data:
-                    usernotes_data['blob'] = ''
-
-                decompressed_notes = decompress_notes(usernotes_data['blob'])
-
-                if 'constants' not in usernotes_data:
-                    usernotes_data['constants'] = {'users': [], 'warnings': []}
-
-                if mod_name not in usernotes_data['constants']['users']:
-                    usernotes_data['constants']['users'].append(mod_name)
-
-                mod_index = usernotes_data['constants']['users'].index(mod_name)
-
-                if usernote_type_name:
-                    if usernote_type_name not in usernotes_data['constants']['warnings']:
-                        usernotes_data['constants']['warnings'].append(usernote_type_name)
-                    usernote_type_index = usernotes_data['constants']['warnings'].index(usernote_type_name)
-                else:
-                    usernote_type_index = 0  # Use the default index if usernote_type_name is not provided
-
-                add_usernote(decompressed_notes, author, note_text, link, mod_index, usernote_type_index)
-
-                usernotes_data['blob'] = compress_notes(decompressed_notes)
-
-                compressed_notes = json.dumps(usernotes_data)
+                compressed_notes = await run_cpu_bound('usernotes_write', build_updated_usernotes, usernotes_content, author, note_text, link, mod_name, usernote_type_name,
+                                                       size=len(usernotes_content))
                 edit_reason = f"note added on user {author} via flair_helper2"
-                await usernotes_wiki.edit(content=compressed_notes, reason=edit_reason)
+                await reddit_write('usernote', '/api/wiki/edit', f"r/{subreddit.display_name}/wiki/usernotes", usernotes_wiki.edit, content=compressed_notes, reason=edit_reason,
+                                   previous=usernotes_wiki.revision_id)
+                increment_metric('flair_helper_usernotes_writes_total', result='written')
                 break  # Exit the retry loop if the update is successful
             except Exception as e:
+                conflict = isinstance(e, asyncprawcore_exceptions.Conflict)
+                if conflict:
+                    increment_metric('flair_helper_usernotes_writes_total', result='conflict')
+                    print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Usernotes in r/{subreddit.display_name} changed while adding a note on {author}, re-applying it") if debugmode else None
                 if attempt < max_retries - 1:
-                    await asyncio.sleep(retry_delay)
+                    # A conflict means the page is fine, so re-read it soon rather than after retry_delay
+                    await asyncio.sleep(random.uniform(*USERNOTES_CONFLICT_RETRY_DELAY) if conflict else retry_delay)
                 else:
+                    increment_metric('flair_helper_usernotes_writes_total', result='failed')
                     error_message = f"Failed to update usernotes for user {author}"
                     print(error_message) if debugmode else None
                     raise RuntimeError(error_message) from e
 
+ban_ledger_seed_locks = defaultdict(asyncio.Lock)
+
+async def seed_ban_ledger(subreddit):
+    # Copies a subreddit's FH-Ban- usernotes into the ban ledger the first time one of its bans is escalated
+    subreddit_name = subreddit.display_name.lower()
+    async with ban_ledger_seed_locks[subreddit_name]:
+        if is_ban_ledger_seeded(subreddit_name):
+            return
+        async with usernotes_lock:
+            try:
+                usernotes_wiki = await subreddit.wiki.get_page("usernotes")
+                usernotes_content = usernotes_wiki.content_md
+            except NotFound:
+                usernotes_content = '{}'  # No usernotes page yet, so no previous bans
+        bans = await run_cpu_bound('usernotes_seed', read_all_usernote_ban_values, usernotes_content, size=len(usernotes_content))
+        # Toolbox links are "l,<submission id>"
+        seed_ledger_bans(subreddit_name, [(username, ban_value, banned_at, f"/r/{subreddit_name}/comments/{link.split(',')[1]}/" if link.startswith('l,') else link)
+                                          for username, ban_value, banned_at, link in bans])
+        increment_metric('flair_helper_ban_ledger_seeds_total')
+        print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Seeded the ban ledger for r/{subreddit_name} with {len(bans)} bans from usernotes") if debugmode else None
+
+async def get_previous_ban_values(subreddit, username):
+    # The FH-Ban- values of a user's previous bans, from the ban ledger, or from usernotes if the ledger is off or can't be seeded
+    if ban_ledger_enabled:
+        try:
+            await seed_ban_ledger(subreddit)
+        except Exception as e:
+            await error_handler(f"Error seeding the ban ledger for r/{subreddit.display_name}: {str(e)}", notify_discord=True)
+        else:
+            increment_metric('flair_helper_ban_ledger_lookups_total', source='ledger')
+            return get_ledger_ban_values(subreddit.display_name, username)
+    increment_metric('flair_helper_ban_ledger_lookups_total', source='usernotes')
+    return await get_usernotes(subreddit, username)
+
+def get_usernote_compaction_policy(config):
+    # (expire_days, max_notes) from a subreddit's config; (0, 0) means the subreddit doesn't compact its usernotes
+    general_config = config[0].get('GeneralConfiguration', {}) if config else {}
+    try:
+        return max(int(general_config.get('usernote_expire_days') or 0), 0), max(int(general_config.get('usernote_max_notes') or 0), 0)
+    except (TypeError, ValueError):
+        return 0, 0
+
+@reddit_error_handler
+async def compact_subreddit_usernotes(subreddit, expire_days, max_notes):
+    async with usernotes_lock:
+        usernotes_wiki = await subreddit.wiki.get_page("usernotes")
+        usernotes_content = usernotes_wiki.content_md
+        expire_before = time.time() - expire_days * 86400 if expire_days else None
+        compacted_content, stats = await run_cpu_bound('usernotes_compact', compact_usernotes, usernotes_content, expire_before, max_notes,
+                                                       size=len(usernotes_content))
+        if compacted_content is not None:
+            try:
+                await reddit_write('usernote', '/api/wiki/edit', f"r/{subreddit.display_name}/wiki/usernotes", usernotes_wiki.edit, content=compacted_content,
+                                   reason=f"{stats['notes']} Flair Helper notes compacted via flair_helper2", previous=usernotes_wiki.revision_id)
+            except asyncprawcore_exceptions.Conflict:
+                # Someone saved the page since it was read; their notes win and the next run compacts again
+                increment_metric('flair_helper_usernotes_writes_total', result='conflict')
+                increment_metric('flair_helper_usernotes_compactions_total', result='conflict')
+                return None
+            increment_metric('flair_helper_usernotes_writes_total', result='written')
+
+    increment_metric('flair_helper_usernotes_compactions_total', result='compacted' if compacted_content is not None else 'unchanged')
+    increment_metric('flair_helper_usernotes_compacted_notes_total', stats['notes'])
+    increment_metric('flair_helper_usernotes_compaction_blob_bytes_total', stats['blob_bytes_before'], stage='before')
+    increment_metric('flair_helper_usernotes_compaction_blob_bytes_total', stats['blob_bytes_after'], stage='after')
+    print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Usernotes compaction in r/{subreddit.display_name}: {stats['notes']} notes compacted, "
+          f"{stats['users_removed']} users removed, blob {stats['blob_bytes_before']} -> {stats['blob_bytes_after']} bytes") if debugmode else None
+    return stats
+
+async def run_usernote_compaction():
+    while True:
+        await asyncio.sleep(usernote_compaction_interval)
+        for subreddit_name in get_stored_subreddits():
+            expire_days, max_notes = get_usernote_compaction_policy(get_cached_config(subreddit_name))
+            if not (expire_days or max_notes) or not is_subreddit_in_shard(subreddit_name):
+                continue
+            reddit = get_reddit_for_subreddit(subreddit_name, default=next(iter(reddit_clients.values()), None))
+            try:
+                subreddit = await reddit.subreddit(subreddit_name)
+                await compact_subreddit_usernotes(subreddit, expire_days, max_notes)
+            except Exception as e:
+                increment_metric('flair_helper_usernotes_compactions_total', result='failed')
+                await error_handler(f"Error compacting usernotes in r/{subreddit_name}: {str(e)}", notify_discord=True)
+
 
 
 def send_webhook_notification(config, post, flair_text, mod_name, flair_guid):
@@ -903,6 +2115,8 @@ def send_webhook_notification(config, post, flair_text, mod_name, flair_guid):
     if 'webhook' in config[0]['GeneralConfiguration'] and any(flair['templateId'] == flair_guid and flair.get('sendToWebhook', False) for flair in config[1:]):
         print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Webhook notification triggered for flair GUID: {flair_guid}") if debugmode else None
 
+        from discord_webhook import DiscordWebhook, DiscordEmbed
+
         webhook_url = config[0]['GeneralConfiguration']['webhook']
         webhook = DiscordWebhook(url=webhook_url)
 
@@ -983,34 +2197,198 @@ def get_display_name(author, use_color=False):
     return colored(name, "light_red") if use_color else name
 
 
-def parse_ban_duration_list(duration_str):
-    return [int(d) if d.isdigit() else 0 for d in duration_str.split(',')]
+def replace_placeholders(text, placeholders):
+    for placeholder, value in placeholders.items():
+        text = text.replace(f"{{{{{placeholder}}}}}", str(value))
+    return text
 
 
-async def get_next_ban_duration(subreddit, user, duration_list):
-    print(f"Debug: Entering get_next_ban_duration for user {user}") if verbosemode else None
-    print(f"Debug: Duration list: {duration_list}") if verbosemode else None
+def find_flair_details(config, flair_guid):
+    flair_index = getattr(config, 'flair_index', None)  # Compiled configs from get_cached_config carry a templateId index
+    if flair_index is not None:
+        return flair_index.get(flair_guid)
+    return next((flair for flair in config[1:] if flair['templateId'] == flair_guid), None)
+
+
+def parse_ban_duration_list(duration_str):
+    return [int(d) if d.isdigit() else 0 for d in duration_str.split(',')]
 
-    usernotes = await get_usernotes(subreddit, user)
-    print(f"Debug: Retrieved usernotes: {usernotes}") if verbosemode else None
 
-    if not usernotes:
-        next_duration = duration_list[0]
-        print(f"Debug: No relevant notes, returning first duration: {next_duration}") if verbosemode else None
-        return next_duration
+def select_next_ban_duration(previous_durations, duration_list):
+    # previous_durations are the "FH-Ban-" usernote suffixes, e.g. ['3', '7', 'permanent']
+    if not previous_durations:
+        return duration_list[0]
 
-    highest_duration = max([int(note) if note != 'permanent' else float('inf') for note in usernotes])
+    highest_duration = max([int(note) if note != 'permanent' else float('inf') for note in previous_durations])
     print(f"Debug: Highest previous duration: {highest_duration}") if verbosemode else None
 
     if highest_duration == float('inf'):
         return 0  # Return 0 for permanent ban
 
-    next_duration = duration_list[-1]  # Default to the last (highest) duration
     for duration in duration_list:
         if duration > highest_duration:
-            next_duration = duration
-            break
+            return duration
+    return duration_list[-1]  # Default to the last (highest) duration
+
+
+def get_flair_actions(flair_details):
+    # The actions queued in the database for a flair, in the order handle_mod_log_entry has always inserted them
+    actions = []
+    if flair_details.get('approve', False):
+        actions.append('approve')
+    if flair_details.get('remove', False):
+        actions.append('remove')
+    if flair_details.get('lock', False):
+        actions.append('lock')
+    if flair_details.get('spoiler', False):
+        actions.append('spoiler')
+    if flair_details.get('clearPostFlair', False):
+        actions.append('clearPostFlair')
+    if flair_details.get('modlogReason', '').strip():
+        actions.append('modlogReason')
+    if flair_details.get('comment', {}).get('enabled', False):
+        actions.append('comment')
+    if flair_details.get('nukeUserComments', False):
+        actions.append('nukeUserComments')
+    if flair_details.get('usernote', {}).get('enabled', False):
+        actions.append('usernote')
+    if flair_details.get('contributor', {}).get('enabled', False):
+        actions.append('contributor')
+    if flair_details.get('userFlair', {}).get('enabled', False):
+        actions.append('userFlair')
+    if flair_details.get('ban', {}).get('enabled', False):
+        actions.append('ban')
+    if flair_details.get('unban', False):
+        actions.append('unban')
+    if flair_details.get('sendToWebhook', False):
+        actions.append('sendToWebhook')
+    return actions
+
+
+# Submission attributes the placeholders and the action decisions depend on
+SUBMISSION_SNAPSHOT_FIELDS = ('id', 'title', 'selftext', 'permalink', 'url', 'domain', 'created_utc', 'removed', 'locked', 'spoiler',
+                              'author_flair_text', 'author_flair_css_class', 'author_flair_template_id',
+                              'link_flair_text', 'link_flair_css_class', 'link_flair_template_id')
+
+def submission_snapshot(post):
+    snapshot = {field: getattr(post, field, None) for field in SUBMISSION_SNAPSHOT_FIELDS}
+    snapshot['subreddit'] = post.subreddit.display_name
+    return snapshot
+
+
+def build_placeholders(submission, author_name, author_id, subreddit_id, mod_name, general_config, now=None):
+    # submission is a submission_snapshot() dict; now is a naive UTC datetime and defaults to the current time
+    utc_offset = general_config.get('utc_offset', 0)
+    custom_time_format = general_config.get('custom_time_format', '')
+    now = (now or datetime.utcnow()) + timedelta(hours=utc_offset)
+    created_time = datetime.utcfromtimestamp(submission['created_utc']) + timedelta(hours=utc_offset)
+
+    placeholders = {
+        'time_unix': int(now.timestamp()),
+        'time_iso': now.isoformat(),
+        'time_custom': now.strftime(custom_time_format) if custom_time_format else '',
+        'created_unix': int(created_time.timestamp()),
+        'created_iso': created_time.isoformat(),
+        'created_custom': created_time.strftime(custom_time_format) if custom_time_format else ''
+    }
 
+    placeholders.update({
+        'author': author_name,
+        'subreddit': submission['subreddit'],
+        'body': submission['selftext'],
+        'title': submission['title'],
+        'id': submission['id'],
+        'permalink': submission['permalink'],
+        'url': submission['permalink'],
+        'domain': submission['domain'],
+        'link': submission['url'],
+        'kind': 'submission',
+        'mod': mod_name,
+        'author_flair_text': submission.get('author_flair_text') or '',
+        'author_flair_css_class': submission.get('author_flair_css_class') or '',
+        'author_flair_template_id': submission.get('author_flair_template_id') or '',
+        'link_flair_text': submission.get('link_flair_text') or '',
+        'link_flair_css_class': submission.get('link_flair_css_class') or '',
+        'link_flair_template_id': submission.get('link_flair_template_id') or '',
+        'author_id': author_id if author_id is not None else '[deleted]',
+        'subreddit_id': subreddit_id if subreddit_id else '[unavailable]'
+    })
+    return placeholders
+
+
+def render_removal_comment(general_config, flair_details, placeholders):
+    formatted_header = general_config['header']
+    formatted_footer = general_config['footer']
+
+    if not general_config.get('skip_add_newlines', False):
+        formatted_header += "\n\n"
+        formatted_footer = "\n\n" + formatted_footer
+
+    formatted_header = replace_placeholders(formatted_header, placeholders)
+    formatted_footer = replace_placeholders(formatted_footer, placeholders)
+    formatted_flair_removal_details = replace_placeholders(flair_details['comment'].get('body', ''), placeholders)
+    return f"{formatted_header}\n\n{formatted_flair_removal_details}\n\n{formatted_footer}"
+
+
+def get_removal_comment_type(general_config):
+    removal_type = general_config.get('removal_comment_type', '')
+    if removal_type not in ['public', 'private', 'private_exposed', 'public_as_subreddit']:
+        removal_type = 'public_as_subreddit'
+    return removal_type
+
+
+def get_remove_mod_note(flair_details):
+    mod_note = flair_details['usernote']['note'][:100] if 'usernote' in flair_details and flair_details['usernote']['enabled'] else ''
+    if flair_details.get('modlogReason'):
+        mod_note = flair_details['modlogReason'][:100]  # Truncate to 100 characters
+    return mod_note
+
+
+def get_post_age_days(created_utc, now=None):
+    return ((now or datetime.utcnow()) - datetime.utcfromtimestamp(created_utc)).days
+
+
+def get_comment_skip_reason(general_config, flair_details, created_utc, now=None):
+    post_age_days = get_post_age_days(created_utc, now)
+    max_age = general_config.get('maxAgeForComment', 175)
+    if post_age_days > max_age:
+        return f"post is {post_age_days} days old, maxAgeForComment is {max_age}"
+    if not flair_details['comment'].get('body', '').strip():
+        return 'empty comment body'
+    return None
+
+
+def get_ban_kind(ban_duration):
+    # 'escalating' for a comma separated duration list, 'permanent', 'temporary', or None for an invalid duration
+    if isinstance(ban_duration, str) and ',' in ban_duration:
+        return 'escalating'
+    if ban_duration == '' or ban_duration is True:
+        return 'permanent'
+    if isinstance(ban_duration, int) and ban_duration > 0:
+        return 'temporary'
+    return None
+
+
+def get_user_flair_update(flair_details, placeholders):
+    # The subreddit.flair.set keyword arguments for a userFlair action, or None when there is nothing to set
+    flair_text = replace_placeholders(flair_details['userFlair'].get('text', ''), placeholders)
+    flair_css_class = replace_placeholders(flair_details['userFlair'].get('cssClass', ''), placeholders)
+    flair_template_id = flair_details['userFlair'].get('templateId', '') or flair_details['userFlair'].get('templateID', '')
+    if flair_template_id:
+        return {'flair_template_id': flair_template_id}
+    if flair_text or flair_css_class:
+        return {'text': flair_text, 'css_class': flair_css_class}
+    return None
+
+
+async def get_next_ban_duration(subreddit, user, duration_list):
+    print(f"Debug: Entering get_next_ban_duration for user {user}") if verbosemode else None
+    print(f"Debug: Duration list: {duration_list}") if verbosemode else None
+
+    previous_bans = await get_previous_ban_values(subreddit, user)
+    print(f"Debug: Previous bans: {previous_bans}") if verbosemode else None
+
+    next_duration = select_next_ban_duration(previous_bans, duration_list)
     print(f"Debug: Returning next duration: {next_duration}") if verbosemode else None
     return next_duration
 
@@ -1046,9 +2424,11 @@ async def apply_escalating_ban(subreddit, user, duration_list, ban_message, mod_
         print(f"Debug: Final mod note: {mod_note}") if verbosemode else None
 
         if next_duration == 0:
-            await subreddit.banned.add(user, ban_message=ban_message, note=mod_note)
+            await reddit_write('ban', '/api/friend', f"u/{user} in r/{subreddit.display_name}", subreddit.banned.add, user, ban_message=ban_message, note=mod_note)
         else:
-            await subreddit.banned.add(user, duration=next_duration, ban_message=ban_message, note=mod_note)
+            await reddit_write('ban', '/api/friend', f"u/{user} in r/{subreddit.display_name}", subreddit.banned.add, user, duration=next_duration, ban_message=ban_message, note=mod_note)
+        if ban_ledger_enabled and not dry_run:
+            record_ledger_ban(subreddit.display_name, user.name, ban_duration_number, link)
 
         await add_escalating_ban_note(subreddit, user.name, next_duration, link, mod_name)
         print(f"Applied escalating ban: FH-Ban-{ban_duration_number} to user {user.name}") if debugmode or verbosemode else None
@@ -1067,6 +2447,87 @@ async def apply_escalating_ban(subreddit, user, duration_list, ban_message, mod_
 
 
 
+# Dry run: the whole pipeline runs, but every mutating Reddit call made for an action is recorded instead of sent
+dry_run_filename = f'{logs_dir}dry_run_actions.ndjson'
+dry_run_logger = logging.getLogger('dry_run')
+dry_run_logger.propagate = False
+
+def enable_dry_run():
+    global dry_run, configs_db_filename, actions_db_filename, shards_db_filename
+    dry_run = True
+    # The shadow bot keeps its own databases, so it never consumes the production actions queue or writes the production
+    # config cache, ban ledger, subreddit registry or shard heartbeats
+    configs_db_filename = 'flair_helper_configs_dryrun.db'
+    actions_db_filename = 'flair_helper_actions_dryrun.db'
+    shards_db_filename = 'flair_helper_shards_dryrun.db'
+    if not any(isinstance(handler, RotatingFileHandler) for handler in dry_run_logger.handlers):
+        dry_run_handler = RotatingFileHandler(dry_run_filename, maxBytes=getattr(config, 'trace_log_max_bytes', 10 * 1024 * 1024), backupCount=getattr(config, 'trace_log_backup_count', 5))
+        dry_run_handler.setFormatter(logging.Formatter('%(message)s'))
+        dry_run_logger.addHandler(dry_run_handler)
+        dry_run_logger.setLevel(logging.INFO)
+
+def summarize_dry_run_value(value):
+    value = value if isinstance(value, (int, float, bool)) or value is None else str(value)
+    if isinstance(value, str) and len(value) > 500:
+        return f"<{len(value)} characters>"  # Usernote blobs and config write-backs are too large to log
+    return value
+
+def record_dry_run_call(action, endpoint, target, args=(), kwargs=None, api_calls=1):
+    trace = current_trace.get()
+    record = {
+        'time': time.time(),
+        'submission_id': trace['submission_id'] if trace else None,
+        'subreddit': trace['subreddit'] if trace else None,
+        'action': action,
+        'endpoint': endpoint,
+        'target': target,
+        'api_calls': api_calls,
+        'args': [summarize_dry_run_value(value) for value in args],
+        'kwargs': {key: summarize_dry_run_value(value) for key, value in (kwargs or {}).items()},
+    }
+    increment_metric('flair_helper_dry_run_calls_total', action=action)
+    increment_metric('flair_helper_dry_run_api_calls_total', api_calls, action=action)
+    print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: [DRY RUN] {action}: {endpoint} {target}") if debugmode else None
+    dry_run_logger.info(json.dumps(record))
+
+async def reddit_write(action, endpoint, target, call, *args, api_calls=1, **kwargs):
+    # Every mutating Reddit call made for an action goes through here; api_calls is the number of HTTP requests it costs
+    if dry_run:
+        record_dry_run_call(action, endpoint, target, args, kwargs, api_calls)
+        return None
+    return await call(*args, **kwargs)
+
+def summarize_dry_run(filenames=None):
+    # Intended calls and API cost per action type from the dry-run log (including rotated files)
+    if filenames is None:
+        filenames = [dry_run_filename] + [f"{dry_run_filename}.{index}" for index in range(1, getattr(config, 'trace_log_backup_count', 5) + 1)]
+
+    actions = defaultdict(lambda: {'calls': 0, 'api_calls': 0})
+    submissions = set()
+    submission_api_calls = 0
+    for filename in filenames:
+        if not os.path.exists(filename):
+            continue
+        with open(filename) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                actions[record['action']]['calls'] += 1
+                actions[record['action']]['api_calls'] += record.get('api_calls', 1)
+                if record.get('submission_id'):
+                    submissions.add(record['submission_id'])
+                    submission_api_calls += record.get('api_calls', 1)
+
+    return {
+        'submissions': len(submissions),
+        'actions': dict(actions),
+        'api_calls': sum(action['api_calls'] for action in actions.values()),
+        'api_calls_per_submission': round(submission_api_calls / len(submissions), 2) if submissions else None,
+    }
+
+
 async def handle_approve_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname):
     #if not is_action_completed(submission_id, 'approve') and 'approve' in flair_details and flair_details['approve']:
     try:
@@ -1075,15 +2536,15 @@ async def handle_approve_action(post, submission_id, flair_details, disp_submiss
 
         print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - Approve triggered on ID: {disp_submission_id} in {disp_subreddit_displayname}") if debugmode else None
         if post.removed:
-            await post.mod.approve()
+            await reddit_write('approve', '/api/approve', post.fullname, post.mod.approve)
             print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - Submission approved on ID: {disp_submission_id} in {disp_subreddit_displayname}") if debugmode else None
         else:
             print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - Submission already approved on ID: {disp_submission_id} in {disp_subreddit_displayname}") if debugmode else None
         if post.locked:
-            await post.mod.unlock()
+            await reddit_write('approve', '/api/unlock', post.fullname, post.mod.unlock)
             print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - Submission unlocked on ID: {disp_submission_id} in {disp_subreddit_displayname}") if debugmode else None
         if post.spoiler:
-            await post.mod.unspoiler()
+            await reddit_write('approve', '/api/unspoiler', post.fullname, post.mod.unspoiler)
             print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - Spoiler removed on ID: {disp_submission_id} in {disp_subreddit_displayname}") if debugmode else None
         mark_action_as_completed(submission_id, 'approve')
     except Exception as e:
@@ -1103,12 +2564,10 @@ async def handle_remove_action(post, submission_id, flair_details, disp_submissi
             mark_action_as_completed(submission_id, 'remove')
             mark_action_as_completed(submission_id, 'modlogReason')
         else:
-            mod_note = flair_details['usernote']['note'][:100] if 'usernote' in flair_details and flair_details['usernote']['enabled'] else ''
+            mod_note = get_remove_mod_note(flair_details)
 
-            if flair_details.get('modlogReason'):
-                mod_note = flair_details['modlogReason'][:100]  # Truncate to 100 characters
-
-            await post.mod.remove(spam=False, mod_note=mod_note)
+            # asyncpraw follows the removal with a second request to attach the mod note
+            await reddit_write('remove', '/api/remove', post.fullname, post.mod.remove, spam=False, mod_note=mod_note, api_calls=2 if mod_note else 1)
             mark_action_as_completed(submission_id, 'remove')
             mark_action_as_completed(submission_id, 'modlogReason')
     except Exception as e:
@@ -1125,7 +2584,7 @@ async def handle_modlog_reason_action(post, submission_id, flair_details, disp_s
         mod_note = flair_details.get('modlogReason', '')[:250]  # Truncate to 250 characters
 
         if mod_note:
-            await post.mod.create_note(note=mod_note)
+            await reddit_write('modlogReason', '/api/mod/notes', post.fullname, post.mod.create_note, note=mod_note)
             print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - Added mod note: '{mod_note}' to ID: {disp_submission_id} in {disp_subreddit_displayname}") if debugmode else None
         else:
             print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - No mod note provided for ID: {disp_submission_id} in {disp_subreddit_displayname}") if debugmode else None
@@ -1143,7 +2602,7 @@ async def handle_lock_action(post, submission_id, flair_details, disp_submission
 
         print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - lock triggered on ID: {disp_submission_id} in {disp_subreddit_displayname}") if debugmode else None
         if not post.locked:
-            await post.mod.lock()
+            await reddit_write('lock', '/api/lock', post.fullname, post.mod.lock)
             mark_action_as_completed(submission_id, 'lock')
         else:
             print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Post {disp_submission_id} is already locked. Marking action as completed.") if debugmode else None
@@ -1160,7 +2619,7 @@ async def handle_spoiler_action(post, submission_id, flair_details, disp_submiss
 
         print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - spoiler triggered on ID: {disp_submission_id} in {disp_subreddit_displayname}") if debugmode else None
         if not post.spoiler:
-            await post.mod.spoiler()
+            await reddit_write('spoiler', '/api/spoiler', post.fullname, post.mod.spoiler)
             mark_action_as_completed(submission_id, 'spoiler')
         else:
             print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Post {disp_submission_id} is already spoilered. Marking action as completed.") if debugmode else None
@@ -1173,7 +2632,7 @@ async def handle_clear_post_flair_action(post, submission_id, flair_details, dis
     #if not is_action_completed(submission_id, 'clearPostFlair') and 'clearPostFlair' in flair_details and flair_details['clearPostFlair']:
     try:
         print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - remove_link_flair triggered on ID: {disp_submission_id} in {disp_subreddit_displayname}") if debugmode else None
-        await post.mod.flair(text='', css_class='')
+        await reddit_write('clearPostFlair', '/api/flair', post.fullname, post.mod.flair, text='', css_class='')
         mark_action_as_completed(submission_id, 'clearPostFlair')
     except Exception as e:
         await error_handler(f"Error in handle_clear_post_flair_action for {disp_submission_id}: {str(e)}", notify_discord=True)
@@ -1183,7 +2642,10 @@ async def handle_webhook_action(config, post, flair_text, mod_name, flair_guid,
     #if not is_action_completed(submission_id, 'sendToWebhook') and 'sendToWebhook' in flair_details and flair_details['sendToWebhook']:
     try:
         print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - send_to_webhook triggered on ID: {disp_submission_id} in {disp_subreddit_displayname}") if debugmode else None
-        send_webhook_notification(config, post, flair_text, mod_name, flair_guid)
+        if dry_run:
+            record_dry_run_call('sendToWebhook', 'discord webhook', config[0]['GeneralConfiguration'].get('webhook', ''))
+        else:
+            send_webhook_notification(config, post, flair_text, mod_name, flair_guid)
         mark_action_as_completed(submission_id, 'sendToWebhook')
     except Exception as e:
         await error_handler(f"Error in handle_webhook_action for {disp_submission_id}: {str(e)}", notify_discord=True)
@@ -1192,31 +2654,22 @@ async def handle_webhook_action(config, post, flair_text, mod_name, flair_guid,
 async def handle_comment_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname, config, formatted_removal_reason_comment):
     #if not is_action_completed(submission_id, 'comment') and 'comment' in flair_details and flair_details['comment']['enabled']:
     try:
-        post_age_days = (datetime.utcnow() - datetime.utcfromtimestamp(post.created_utc)).days
-        max_age = config[0]['GeneralConfiguration'].get('maxAgeForComment', 175)
-        if post_age_days <= max_age:
-            comment_body = flair_details['comment'].get('body', '')
-            if comment_body.strip():
-                print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - comment triggered on ID: {disp_submission_id} in {disp_subreddit_displayname}") if debugmode else None
-                if flair_details['remove']:
-                    removal_type = config[0]['GeneralConfiguration'].get('removal_comment_type', '')
-                    if removal_type == '':
-                        removal_type = 'public_as_subreddit'
-                    elif removal_type not in ['public', 'private', 'private_exposed', 'public_as_subreddit']:
-                        removal_type = 'public_as_subreddit'
-                    await post.mod.send_removal_message(message=formatted_removal_reason_comment, type=removal_type)
-                else:
-                    comment = await post.reply(formatted_removal_reason_comment)
-                    if flair_details['comment']['stickyComment']:
-                        await comment.mod.distinguish(sticky=True)
-                    if flair_details['comment']['lockComment']:
-                        await comment.mod.lock()
-                mark_action_as_completed(submission_id, 'comment')
+        skip_reason = get_comment_skip_reason(config[0]['GeneralConfiguration'], flair_details, post.created_utc)
+        if skip_reason is None:
+            print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - comment triggered on ID: {disp_submission_id} in {disp_subreddit_displayname}") if debugmode else None
+            if flair_details['remove']:
+                removal_type = get_removal_comment_type(config[0]['GeneralConfiguration'])
+                await reddit_write('comment', '/api/v1/modactions/removal_link_message', post.fullname, post.mod.send_removal_message, message=formatted_removal_reason_comment, type=removal_type)
             else:
-                print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Skipping comment action due to empty comment body on ID: {disp_submission_id} in {disp_subreddit_displayname}") if debugmode else None
-                mark_action_as_completed(submission_id, 'comment')
+                comment = await reddit_write('comment', '/api/comment', post.fullname, post.reply, formatted_removal_reason_comment)
+                # The lambdas defer the attribute lookup, as there is no comment object in dry-run mode
+                if flair_details['comment']['stickyComment']:
+                    await reddit_write('comment', '/api/distinguish', f"reply to {post.fullname}", lambda **kwargs: comment.mod.distinguish(**kwargs), sticky=True)
+                if flair_details['comment']['lockComment']:
+                    await reddit_write('comment', '/api/lock', f"reply to {post.fullname}", lambda: comment.mod.lock())
         else:
-            mark_action_as_completed(submission_id, 'comment')
+            print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Skipping comment action on ID: {disp_submission_id} in {disp_subreddit_displayname}: {skip_reason}") if debugmode else None
+        mark_action_as_completed(submission_id, 'comment')
     except Exception as e:
         await error_handler(f"Error in handle_comment_action for {disp_submission_id}: {str(e)}", notify_discord=True)
 
@@ -1228,18 +2681,18 @@ async def handle_ban_action(subreddit, post, submission_id, flair_details, disp_
         ban_message = flair_details['ban']['message']
         ban_reason = flair_details['ban']['modNote']
 
-        for placeholder, value in placeholders.items():
-            ban_message = ban_message.replace(f"{{{{{placeholder}}}}}", str(value))
-            ban_reason = ban_reason.replace(f"{{{{{placeholder}}}}}", str(value))[:100]
+        ban_message = replace_placeholders(ban_message, placeholders)
+        ban_reason = replace_placeholders(ban_reason, placeholders)[:100]
 
-        if isinstance(ban_duration, str) and ',' in ban_duration:
+        ban_kind = get_ban_kind(ban_duration)
+        if ban_kind == 'escalating':
             duration_list = parse_ban_duration_list(ban_duration)
             await apply_escalating_ban(subreddit, post.author, duration_list, ban_message, ban_reason, mod_name, post.permalink)
         else:
-            if ban_duration == '' or ban_duration is True:
-                await subreddit.banned.add(post.author, ban_message=ban_message, ban_reason=ban_reason)
-            elif isinstance(ban_duration, int) and ban_duration > 0:
-                await subreddit.banned.add(post.author, ban_message=ban_message, ban_reason=ban_reason, duration=ban_duration)
+            if ban_kind == 'permanent':
+                await reddit_write('ban', '/api/friend', f"u/{post.author} in r/{subreddit.display_name}", subreddit.banned.add, post.author, ban_message=ban_message, ban_reason=ban_reason)
+            elif ban_kind == 'temporary':
+                await reddit_write('ban', '/api/friend', f"u/{post.author} in r/{subreddit.display_name}", subreddit.banned.add, post.author, ban_message=ban_message, ban_reason=ban_reason, duration=ban_duration)
             else:
                 print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Skipping ban action due to invalid ban duration on ID: {disp_submission_id} for flair GUID: {flair_details['templateId']} in {disp_subreddit_displayname}") if debugmode else None
                 return
@@ -1252,7 +2705,7 @@ async def handle_unban_action(subreddit, post, submission_id, flair_details, dis
     #if not is_action_completed(submission_id, 'unban') and 'unban' in flair_details and flair_details['unban']:
     try:
         print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - unban triggered on ID: {disp_submission_id} in {disp_subreddit_displayname}") if debugmode else None
-        await subreddit.banned.remove(post.author)
+        await reddit_write('unban', '/api/unfriend', f"u/{post.author} in r/{subreddit.display_name}", subreddit.banned.remove, post.author)
         mark_action_as_completed(submission_id, 'unban')
     except Exception as e:
         await error_handler(f"Error in handle_unban_action for {disp_submission_id}: {str(e)}", notify_discord=True)
@@ -1263,19 +2716,12 @@ async def handle_user_flair_action(subreddit, post, submission_id, flair_details
     try:
         print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - set_author_flair triggered on ID: {disp_submission_id} in {disp_subreddit_displayname}") if debugmode else None
 
-        flair_text = flair_details['userFlair'].get('text', '')
-        flair_css_class = flair_details['userFlair'].get('cssClass', '')
-        flair_template_id = flair_details['userFlair'].get('templateId', '') or flair_details['userFlair'].get('templateID', '')
-
-        for placeholder, value in placeholders.items():
-            flair_text = flair_text.replace(f"{{{{{placeholder}}}}}", str(value))
-            flair_css_class = flair_css_class.replace(f"{{{{{placeholder}}}}}", str(value))
+        flair_update = get_user_flair_update(flair_details, placeholders)
 
         try:
-            if flair_template_id:
-                await subreddit.flair.set(post.author, flair_template_id=flair_template_id)
-            elif flair_text or flair_css_class:
-                await subreddit.flair.set(post.author, text=flair_text, css_class=flair_css_class)
+            if flair_update is not None:
+                endpoint = '/api/selectflair' if 'flair_template_id' in flair_update else '/api/flair'
+                await reddit_write('userFlair', endpoint, f"u/{post.author} in r/{subreddit.display_name}", subreddit.flair.set, post.author, **flair_update)
             mark_action_as_completed(submission_id, 'userFlair')
         except Exception as e:
             await error_handler(f"Error setting user flair for {post.author} in {subreddit.display_name}: {str(e)}", notify_discord=True)
@@ -1291,8 +2737,7 @@ async def handle_usernote_action(subreddit, post, submission_id, flair_details,
             print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - usernote triggered on ID: {disp_submission_id} in {disp_subreddit_displayname}") if debugmode else None
             author = post.author.name
             note_text = flair_details['usernote']['note']
-            for placeholder, value in placeholders.items():
-                note_text = note_text.replace(f"{{{{{placeholder}}}}}", str(value))
+            note_text = replace_placeholders(note_text, placeholders)
             link = post.permalink
             usernote_type_name = config[0]['GeneralConfiguration'].get('usernote_type_name', None)
             await update_usernotes(subreddit, author, note_text, link, mod_name, usernote_type_name)
@@ -1309,10 +2754,10 @@ async def handle_contributor_action(subreddit, post, submission_id, flair_detail
     try:
         if flair_details['contributor']['action'] == 'add':
             print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - add_contributor triggered on ID: {disp_submission_id} in {disp_subreddit_displayname}") if debugmode else None
-            await subreddit.contributor.add(post.author)
+            await reddit_write('contributor', '/api/friend', f"u/{post.author} in r/{subreddit.display_name}", subreddit.contributor.add, post.author)
         elif flair_details['contributor']['action'] == 'remove':
             print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - remove_contributor triggered on ID: {disp_submission_id} in {disp_subreddit_displayname}") if debugmode else None
-            await subreddit.contributor.remove(post.author)
+            await reddit_write('contributor', '/api/unfriend', f"u/{post.author} in r/{subreddit.display_name}", subreddit.contributor.remove, post.author)
         mark_action_as_completed(submission_id, 'contributor')
     except Exception as e:
         await error_handler(f"Error in handle_contributor_action for {disp_submission_id}: {str(e)}", notify_discord=True)
@@ -1333,24 +2778,24 @@ async def handle_nuke_action(reddit, submission_id, flair_details, disp_submissi
     try:
         for subreddit_name in subreddits:
             try:
-                subreddit = await reddit.subreddit(subreddit_name)
+                subreddit = await get_reddit_for_subreddit(subreddit_name, default=reddit).subreddit(subreddit_name)
 
                 if ban:
-                    await subreddit.banned.add(user, ban_reason="Nuke action performed")
+                    await reddit_write('nuke', '/api/friend', f"u/{user} in r/{subreddit_name}", subreddit.banned.add, user, ban_reason="Nuke action performed")
                     print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - [NUKE] Banned user {user} from {subreddit_name}") if debugmode else None
 
                 if remove_comments:
                     async for comment in user.comments.new(limit=None):
                         if comment.subreddit == subreddit_name and not comment.removed:
-                            await comment.mod.remove()
+                            await reddit_write('nuke', '/api/remove', comment.fullname, comment.mod.remove)
                             print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - [NUKE] Removed comment {comment.id} from {subreddit_name}") if debugmode else None
 
                 if remove_submissions:
                     async for submission in user.submissions.new(limit=None):
                         if submission.subreddit == subreddit_name and not submission.removed:
-                            await submission.mod.remove()
-                            await submission.mod.lock()
-                            await submission.mod.spoiler()
+                            await reddit_write('nuke', '/api/remove', submission.fullname, submission.mod.remove)
+                            await reddit_write('nuke', '/api/lock', submission.fullname, submission.mod.lock)
+                            await reddit_write('nuke', '/api/spoiler', submission.fullname, submission.mod.spoiler)
                             print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - [NUKE] Removed submission {submission.id} from {subreddit_name}") if debugmode else None
 
             except Exception as e:
@@ -1373,7 +2818,7 @@ async def handle_nuke_user_comments_action(post, submission_id, flair_details, d
 
         async for comment in submission_comments:
             if not comment.removed and comment.distinguished != 'moderator':
-                await comment.mod.remove()
+                await reddit_write('nukeUserComments', '/api/remove', comment.fullname, comment.mod.remove)
                 print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - removed comment {comment.id} under Post ID: {disp_submission_id} in {disp_subreddit_displayname}") if debugmode else None
 
         print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: - finished nuking comments under Post ID: {disp_submission_id} in {disp_subreddit_displayname}") if debugmode else None
@@ -1384,11 +2829,260 @@ async def handle_nuke_user_comments_action(post, submission_id, flair_details, d
 
 
 
+# Which handlers process_flair_assignment runs for a flair, shared with the offline action planner below
+# Actions a deleted author's post skips; it is only removed and locked
+DELETED_AUTHOR_SKIPPED_ACTIONS = ('comment', 'approve', 'modlogReason', 'spoiler', 'clearPostFlair', 'ban', 'unban', 'userFlair', 'usernote',
+                                  'contributor', 'sendToWebhook', 'nuke', 'nukeUserComments')
+# Actions aimed at the author rather than the post, skipped for a suspended author
+AUTHOR_ACTIONS = ('comment', 'ban', 'unban', 'userFlair', 'usernote', 'contributor', 'nuke')
+
+def is_flair_action_enabled(flair_details, action):
+    value = flair_details.get(action)
+    return value.get('enabled', False) if isinstance(value, dict) else bool(value)
+
+def decide_flair_actions(flair_details, author_state, allow_nuke):
+    # author_state is 'deleted', 'suspended' or 'active'. Returns the actions in the order their handlers run, as
+    # (action, skip_reason) pairs: skip_reason is None when the handler runs, otherwise the action is only marked completed.
+    if author_state == 'deleted':
+        # Deleted author: the post is removed and locked whatever the flair says, nothing else runs
+        decisions = [('remove', None), ('lock', None)]
+        decisions += [(action, 'author deleted') for action in DELETED_AUTHOR_SKIPPED_ACTIONS if is_flair_action_enabled(flair_details, action)]
+        return decisions
+
+    decisions = []
+    for action in ('approve', 'remove', 'modlogReason', 'lock', 'spoiler', 'clearPostFlair', 'sendToWebhook') + AUTHOR_ACTIONS + ('nukeUserComments',):
+        if action == 'modlogReason':
+            # Removing the post attaches the modlogReason to the removal
+            if flair_details.get('remove') or not flair_details.get('modlogReason'):
+                continue
+        elif not is_flair_action_enabled(flair_details, action):
+            continue
+
+        if action in AUTHOR_ACTIONS and author_state == 'suspended':
+            decisions.append((action, 'author suspended'))
+        elif action == 'nuke' and not allow_nuke:
+            decisions.append((action, 'allow_ban_and_nuke is disabled'))
+        else:
+            decisions.append((action, None))
+    return decisions
+
+
+# Offline action planner: the Reddit calls the handlers would make for decide_flair_actions, without touching Reddit
+# Reads process_flair_assignment makes before any action: post, subreddit, author, latest comment and user flair
+hydrate_api_calls = {'deleted': 1, 'suspended': 3, 'active': 5}
+
+def plan_flair_actions(config, submission, author, mod_name, now=None, allow_nuke=None):
+    # submission is a submission_snapshot() dict (optionally with 'subreddit_id'); author is None for a deleted account,
+    # otherwise a dict with 'name', 'id', 'is_suspended' and 'previous_ban_durations' (the FH-Ban- usernote suffixes).
+    # Returns the ordered Reddit calls the handlers would make, the skipped actions and the predicted API-call count.
+    general_config = config[0]['GeneralConfiguration']
+    flair_guid = submission.get('link_flair_template_id')
+    flair_details = find_flair_details(config, flair_guid)
+    allow_nuke = allow_ban_and_nuke if allow_nuke is None else allow_nuke
+    fullname = f"t3_{submission['id']}"
+
+    plan = {
+        'submission_id': submission['id'],
+        'subreddit': submission['subreddit'],
+        'flair_template_id': flair_guid,
+        'author': author['name'] if author else '[deleted]',
+        'queued_actions': [],
+        'steps': [],
+        'skipped': [],
+    }
+    if flair_details is None:
+        plan['skipped'].append({'action': None, 'reason': 'flair template not found in the configuration'})
+        plan.update(hydrate_api_calls=0, action_api_calls=0, api_calls=0, variable_api_calls=False)
+        return plan
+
+    plan['notes'] = flair_details.get('notes', 'No description')
+    plan['queued_actions'] = get_flair_actions(flair_details)
+
+    def step(action, endpoint, target, api_calls=1, **details):
+        plan['steps'].append(dict(action=action, endpoint=endpoint, target=target, api_calls=api_calls, **details))
+
+    def skip(action, reason):
+        plan['skipped'].append({'action': action, 'reason': reason})
+
+    if author is None:
+        author_state = 'deleted'
+    else:
+        author_state = 'suspended' if author.get('is_suspended') else 'active'
+        author_name = author['name']
+        author_id = None if author_state == 'suspended' else author.get('id')
+        user_target = f"u/{author_name} in r/{submission['subreddit']}"
+        placeholders = build_placeholders(submission, author_name, author_id, submission.get('subreddit_id'), mod_name, general_config, now)
+
+    for action, skip_reason in decide_flair_actions(flair_details, author_state, allow_nuke):
+        if skip_reason is not None:
+            skip(action, skip_reason)
+
+        elif action == 'approve':
+            if submission['removed']:
+                step('approve', '/api/approve', fullname)
+            if submission['locked']:
+                step('approve', '/api/unlock', fullname)
+            if submission['spoiler']:
+                step('approve', '/api/unspoiler', fullname)
+            if not (submission['removed'] or submission['locked'] or submission['spoiler']):
+                skip('approve', 'already approved')
+
+        elif action == 'remove':
+            if submission['removed']:
+                skip('remove', 'already removed')
+            else:
+                mod_note = get_remove_mod_note(flair_details)
+                step('remove', '/api/remove', fullname, 2 if mod_note else 1, mod_note=mod_note)
+
+        elif action == 'modlogReason':
+            step('modlogReason', '/api/mod/notes', fullname, note=flair_details['modlogReason'][:250])
+
+        elif action == 'lock':
+            if submission['locked']:
+                skip('lock', 'already locked')
+            else:
+                step('lock', '/api/lock', fullname)
+
+        elif action == 'spoiler':
+            if submission['spoiler']:
+                skip('spoiler', 'already spoilered')
+            else:
+                step('spoiler', '/api/spoiler', fullname)
+
+        elif action == 'clearPostFlair':
+            step('clearPostFlair', '/api/flair', fullname, text='', css_class='')
+
+        elif action == 'sendToWebhook':
+            step('sendToWebhook', 'discord webhook', general_config.get('webhook', ''), 0)
+
+        elif action == 'comment':
+            comment_skip_reason = get_comment_skip_reason(general_config, flair_details, submission['created_utc'], now)
+            if comment_skip_reason is not None:
+                skip('comment', comment_skip_reason)
+            else:
+                comment_text = render_removal_comment(general_config, flair_details, placeholders)
+                if flair_details.get('remove'):
+                    step('comment', '/api/v1/modactions/removal_link_message', fullname, text=comment_text, type=get_removal_comment_type(general_config))
+                else:
+                    step('comment', '/api/comment', fullname, text=comment_text)
+                    if flair_details['comment']['stickyComment']:
+                        step('comment', '/api/distinguish', f"reply to {fullname}", sticky=True)
+                    if flair_details['comment']['lockComment']:
+                        step('comment', '/api/lock', f"reply to {fullname}")
+
+        elif action == 'ban':
+            ban_duration = flair_details['ban'].get('duration', '')
+            ban_message = replace_placeholders(flair_details['ban']['message'], placeholders)
+            ban_reason = replace_placeholders(flair_details['ban']['modNote'], placeholders)[:100]
+            ban_kind = get_ban_kind(ban_duration)
+
+            if ban_kind == 'escalating':
+                next_duration = select_next_ban_duration(author.get('previous_ban_durations', []), parse_ban_duration_list(ban_duration))
+                ban_duration_string, ban_duration_number = get_ban_duration_string(next_duration)
+                ban_message = ban_message.replace("{{ban_duration}}", ban_duration_string).replace("{{ban_duration_number}}", ban_duration_number)
+                ban_reason = ban_reason.replace("{{ban_duration}}", ban_duration_string).replace("{{ban_duration_number}}", ban_duration_number)
+                # The ban, then the FH-Ban- usernote (read and write); previous bans come from the ban ledger, or one more usernotes read without it
+                step('ban', '/api/friend', user_target, 3 if ban_ledger_enabled else 4, duration=next_duration or None, ban_message=ban_message, note=ban_reason, escalating=True)
+            elif ban_kind == 'permanent':
+                step('ban', '/api/friend', user_target, duration=None, ban_message=ban_message, ban_reason=ban_reason)
+            elif ban_kind == 'temporary':
+                step('ban', '/api/friend', user_target, duration=ban_duration, ban_message=ban_message, ban_reason=ban_reason)
+            else:
+                skip('ban', f"invalid ban duration {ban_duration!r}")
+
+        elif action == 'unban':
+            step('unban', '/api/unfriend', user_target)
+
+        elif action == 'userFlair':
+            flair_update = get_user_flair_update(flair_details, placeholders)
+            if flair_update is None:
+                skip('userFlair', 'no flair template, text or CSS class')
+            elif 'flair_template_id' in flair_update:
+                step('userFlair', '/api/selectflair', user_target, **flair_update)
+            else:
+                step('userFlair', '/api/flair', user_target, **flair_update)
+
+        elif action == 'usernote':
+            if flair_details['usernote'].get('note', '').strip():
+                # The usernotes page is read, then written back with the new note
+                step('usernote', '/api/wiki/edit', f"r/{submission['subreddit']}/wiki/usernotes", 2,
+                     text=replace_placeholders(flair_details['usernote']['note'], placeholders), type=general_config.get('usernote_type_name', None))
+            else:
+                skip('usernote', 'empty usernote')
+
+        elif action == 'contributor':
+            if flair_details['contributor']['action'] == 'add':
+                step('contributor', '/api/friend', user_target)
+            elif flair_details['contributor']['action'] == 'remove':
+                step('contributor', '/api/unfriend', user_target)
+            else:
+                skip('contributor', f"unknown contributor action {flair_details['contributor']['action']!r}")
+
+        elif action == 'nuke':
+            nuke_config = flair_details['nuke']
+            for subreddit_name in nuke_config.get('targetSubreddits', []):
+                if nuke_config.get('banFromAllListed', True):
+                    step('nuke', '/api/friend', f"u/{author_name} in r/{subreddit_name}", ban_reason="Nuke action performed")
+                # The listing read is counted; each matching item adds one (comment) or three (submission) calls
+                if nuke_config.get('removeAllComments', True):
+                    step('nuke', '/api/remove', f"comments by u/{author_name} in r/{subreddit_name}", per_item_api_calls=1)
+                if nuke_config.get('removeAllSubmissions', True):
+                    step('nuke', '/api/remove', f"submissions by u/{author_name} in r/{subreddit_name}", per_item_api_calls=3)
+
+        elif action == 'nukeUserComments':
+            # The comments come with the loaded submission, only the removals cost calls
+            step('nukeUserComments', '/api/remove', f"comments under {fullname}", 0, per_item_api_calls=1)
+
+    plan['hydrate_api_calls'] = hydrate_api_calls[author_state]
+    plan['action_api_calls'] = sum(planned['api_calls'] for planned in plan['steps'])
+    plan['api_calls'] = plan['hydrate_api_calls'] + plan['action_api_calls']
+    plan['variable_api_calls'] = any('per_item_api_calls' in planned for planned in plan['steps'])
+    return plan
+
+def load_plan_config(filename):
+    # A compiled JSON config (as cached in the configs database) or a flair_helper wiki page in YAML
+    with open(filename) as f:
+        content = f.read()
+    if content.strip().startswith('['):
+        config = json.loads(content)
+    else:
+        with redirect_stdout(io.StringIO()):  # convert_yaml_to_json reports every section it converts
+            config = load_yaml_config(content)
+    return correct_config(config)
+
+def explain_flair_assignment(config_filename, snapshot_filename):
+    # snapshot.json: {"submission": {...}, "author": {...} or null, "mod": "ModName", "now": unix time (optional)}
+    config = load_plan_config(config_filename)
+    with open(snapshot_filename) as f:
+        snapshot = json.load(f)
+    now = datetime.utcfromtimestamp(snapshot['now']) if snapshot.get('now') is not None else None
+    return plan_flair_actions(config, snapshot['submission'], snapshot.get('author'), snapshot.get('mod', '[unknown]'), now)
+
+
+async def run_action_handler(action, submission_id, handler):
+    # Runs a single handle_*_action coroutine, recording its latency and whether it completed the action
+    handler_started = time.perf_counter()
+    trace = current_trace.get()
+    if trace is not None:
+        trace['handlers'].append({'action': action, 'start': time.time()})
+    completed = False
+    try:
+        await handler
+        completed = is_action_completed(submission_id, action)
+    finally:
+        # A handler that raises is counted as a failure too
+        observe_metric('flair_helper_action_duration_seconds', time.perf_counter() - handler_started, action=action)
+        if trace is not None:
+            trace['handlers'][-1]['end'] = time.time()
+        increment_metric('flair_helper_actions_total', action=action, result='success' if completed else 'failure')
+
+
 # Primary process to handle any flair changes that appear in the logs
 async def process_flair_assignment(reddit, post, config, subreddit, mod_name, max_retries=3, retry_delay=5):
+    hydrate_started = time.perf_counter()
     submission_id = post.id
     flair_guid = getattr(post, 'link_flair_template_id', None)
-    flair_details = next((flair for flair in config[1:] if flair['templateId'] == flair_guid), None)
+    flair_details = find_flair_details(config, flair_guid)
 
     # Initialize variables
     post_author_name = "[deleted]"
@@ -1410,6 +3104,34 @@ async def process_flair_assignment(reddit, post, config, subreddit, mod_name, ma
         print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Flair GUID {disp_flair_guid} not found in the configuration for {disp_subreddit_displayname}") if debugmode else None
         return
 
+    # The handler for each action decide_flair_actions can return; placeholders, flair_text and the removal comment are
+    # filled in below before any handler that needs them runs
+    action_handlers = {
+        'approve': lambda: handle_approve_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname),
+        'remove': lambda: handle_remove_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname),
+        'modlogReason': lambda: handle_modlog_reason_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname),
+        'lock': lambda: handle_lock_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname),
+        'spoiler': lambda: handle_spoiler_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname),
+        'clearPostFlair': lambda: handle_clear_post_flair_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname),
+        'sendToWebhook': lambda: handle_webhook_action(config, post, flair_text, mod_name, flair_guid, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname),
+        'comment': lambda: handle_comment_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname, config, formatted_removal_reason_comment),
+        'ban': lambda: handle_ban_action(subreddit, post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname, placeholders, mod_name),
+        'unban': lambda: handle_unban_action(subreddit, post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname),
+        'userFlair': lambda: handle_user_flair_action(subreddit, post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname, placeholders),
+        'usernote': lambda: handle_usernote_action(subreddit, post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname, placeholders, config, mod_name),
+        'contributor': lambda: handle_contributor_action(subreddit, post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname),
+        'nuke': lambda: handle_nuke_action(reddit, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname, post),
+        'nukeUserComments': lambda: handle_nuke_user_comments_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname),
+    }
+
+    async def process_deleted_author_post():
+        for action, skip_reason in decide_flair_actions(flair_details, 'deleted', allow_ban_and_nuke):
+            if skip_reason is None:
+                await action_handlers[action]()
+            else:
+                mark_action_as_completed(submission_id, action)
+                print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Marked action '{action}' as completed for deleted post {disp_submission_id}") if debugmode else None
+
     # Reload the configuration from the database
     config = get_cached_config(subreddit.display_name)
 
@@ -1417,7 +3139,7 @@ async def process_flair_assignment(reddit, post, config, subreddit, mod_name, ma
         print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Configuration not found for {disp_subreddit_displayname}. Skipping flair assignment.")
         return
 
-    if flair_guid and any(flair['templateId'] == flair_guid for flair in config[1:]):
+    if flair_guid and find_flair_details(config, flair_guid) is not None:
         user_info = ""
         author_details = ""
 
@@ -1426,31 +3148,8 @@ async def process_flair_assignment(reddit, post, config, subreddit, mod_name, ma
 
             if post.author is None:
                 print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: No author found for post ID: {disp_submission_id}. Post is likely deleted.") if debugmode else None
-                # Mark all actions as completed for deleted posts
-
-                await handle_remove_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname)
-                await handle_lock_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname)
-
-                # Mark other actions as completed
-                #actions_to_complete = ['comment', 'approve', 'remove', 'lock', 'modlogReason', 'ban', 'unban', 'userFlair', 'usernote', 'contributor', 'sendToWebhook']
-                actions_to_complete = ['comment', 'approve', 'modlogReason', 'ban', 'unban', 'userFlair', 'usernote', 'contributor', 'sendToWebhook']
-                #for action in actions_to_complete:
-                #    mark_action_as_completed(submission_id, action)
-                #    print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Marked action '{action}' as completed for deleted post {disp_submission_id}") if debugmode else None
-
-                for action in actions_to_complete:
-                    if action in flair_details:
-                        should_mark_completed = False
-                        if action == 'comment':
-                            should_mark_completed = flair_details[action].get('enabled', False)
-                        elif action in ['userFlair', 'ban']:
-                            should_mark_completed = flair_details[action].get('enabled', False)
-                        else:
-                            should_mark_completed = bool(flair_details[action])
-
-                        if should_mark_completed:
-                            mark_action_as_completed(submission_id, action)
-                            print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Marked action '{action}' as completed for deleted post {disp_submission_id}") if debugmode else None
+                # Remove and lock the post, mark the other actions as completed
+                await process_deleted_author_post()
 
                 # Delete all actions for this submission from the database
                 delete_completed_actions(submission_id)
@@ -1498,27 +3197,7 @@ async def process_flair_assignment(reddit, post, config, subreddit, mod_name, ma
         except (asyncprawcore.exceptions.NotFound, asyncprawcore.exceptions.Forbidden) as e:
             print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Exception {type(e).__name__}: Error loading post or author data for ID: {disp_submission_id}. Post may be removed or author may be shadowbanned/deleted. Error details: {str(e)}") if debugmode else None
 
-            await handle_remove_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname)
-            await handle_lock_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname)
-
-            #actions_to_complete = ['comment', 'approve', 'remove', 'lock', 'modlogReason', 'ban', 'unban', 'userFlair', 'usernote', 'contributor', 'sendToWebhook']
-            actions_to_complete = ['comment', 'approve', 'modlogReason', 'ban', 'unban', 'userFlair', 'usernote', 'contributor', 'sendToWebhook']
-            #for action in actions_to_complete:
-            #    mark_action_as_completed(submission_id, action)
-            #    print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Marked action '{action}' as completed for submission {disp_submission_id}") if debugmode else None
-            for action in actions_to_complete:
-                if action in flair_details:
-                    should_mark_completed = False
-                    if action == 'comment':
-                        should_mark_completed = flair_details[action].get('enabled', False)
-                    elif action in ['userFlair', 'ban']:
-                        should_mark_completed = flair_details[action].get('enabled', False)
-                    else:
-                        should_mark_completed = bool(flair_details[action])
-
-                    if should_mark_completed:
-                        mark_action_as_completed(submission_id, action)
-                        print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Marked action '{action}' as completed for deleted post {disp_submission_id}") if debugmode else None
+            await process_deleted_author_post()
 
             # Delete all actions for this submission from the database
             delete_completed_actions(submission_id)
@@ -1616,18 +3295,7 @@ async def process_flair_assignment(reddit, post, config, subreddit, mod_name, ma
             except Exception as e:
                 print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Error fetching current flair: {str(e)}") if debugmode else None
 
-        # Format the header, flair details, and footer with the placeholders
-        formatted_header = config[0]['GeneralConfiguration']['header']
-        formatted_footer = config[0]['GeneralConfiguration']['footer']
-        skip_add_newlines = config[0]['GeneralConfiguration'].get('skip_add_newlines', False)
-        require_config_to_edit = config[0]['GeneralConfiguration'].get('require_config_to_edit', False)
         ignore_same_flair_seconds = config[0]['GeneralConfiguration'].get('ignore_same_flair_seconds', 60)
-        utc_offset = config[0]['GeneralConfiguration'].get('utc_offset', 0)
-        custom_time_format = config[0]['GeneralConfiguration'].get('custom_time_format', '')
-
-        if not skip_add_newlines:
-            formatted_header += "\n\n"
-            formatted_footer = "\n\n" + formatted_footer
 
         last_flair_time = getattr(post, '_last_flair_time', 0)
         if time.time() - last_flair_time < ignore_same_flair_seconds:
@@ -1635,119 +3303,33 @@ async def process_flair_assignment(reddit, post, config, subreddit, mod_name, ma
             return
         post._last_flair_time = time.time()
 
-        now = datetime.utcnow() + timedelta(hours=utc_offset)
-        created_time = datetime.utcfromtimestamp(post.created_utc) + timedelta(hours=utc_offset)
-
-        placeholders = {
-            'time_unix': int(now.timestamp()),
-            'time_iso': now.isoformat(),
-            'time_custom': now.strftime(custom_time_format) if custom_time_format else '',
-            'created_unix': int(created_time.timestamp()),
-            'created_iso': created_time.isoformat(),
-            'created_custom': created_time.strftime(custom_time_format) if custom_time_format else ''
-        }
+        # Format the header, flair details, and footer with the placeholders
+        placeholders = build_placeholders(submission_snapshot(post), post_author_name, author_id, subreddit_id, mod_name, config[0]['GeneralConfiguration'])
+        formatted_removal_reason_comment = render_removal_comment(config[0]['GeneralConfiguration'], flair_details, placeholders)
 
-        # Create a dictionary to store the placeholder values
-        placeholders.update({
-            'author': post_author_name,
-            'subreddit': post.subreddit.display_name,
-            'body': post.selftext,
-            'title': post.title,
-            'id': post.id,
-            'permalink': post.permalink,
-            'url': post.permalink,
-            'domain': post.domain,
-            'link': post.url,
-            'kind': 'submission',
-            'mod': mod_name,
-            'author_flair_text': post.author_flair_text if post.author_flair_text else '',
-            'author_flair_css_class': post.author_flair_css_class if post.author_flair_css_class else '',
-            'author_flair_template_id': post.author_flair_template_id if post.author_flair_template_id else '',
-            'link_flair_text': post.link_flair_text if post.link_flair_text else '',
-            'link_flair_css_class': post.link_flair_css_class if post.link_flair_css_class else '',
-            'link_flair_template_id': post.link_flair_template_id if post.link_flair_template_id else '',
-            'author_id': author_id if author_id is not None else '[deleted]',
-            'subreddit_id': subreddit_id if subreddit_id else '[unavailable]'
-        })
-
-        for placeholder, value in placeholders.items():
-            formatted_header = formatted_header.replace(f"{{{{{placeholder}}}}}", str(value))
-            formatted_footer = formatted_footer.replace(f"{{{{{placeholder}}}}}", str(value))
-
-        # Replace placeholders in specific flair_details values
-        formatted_flair_removal_details = flair_details['comment'].get('body', '')
-        for placeholder, value in placeholders.items():
-            formatted_flair_removal_details = formatted_flair_removal_details.replace(f"{{{{{placeholder}}}}}", str(value))
-        formatted_removal_reason_comment = f"{formatted_header}\n\n{formatted_flair_removal_details}\n\n{formatted_footer}"
+        observe_metric('flair_helper_stage_duration_seconds', time.perf_counter() - hydrate_started, stage='hydrate')
 
         # Execute the configured actions
+        execute_started = time.perf_counter()
 
         try:
             print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Beginning action processing for submission {disp_submission_id}") if debugmode else None
 
             # Handle each action
-            if not is_action_completed(submission_id, 'approve') and 'approve' in flair_details and flair_details['approve']:
-                await handle_approve_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname)
-
-            if not is_action_completed(submission_id, 'remove') and 'remove' in flair_details and flair_details['remove']:
-                await handle_remove_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname)
-
-            if not flair_details.get('remove') and not is_action_completed(submission_id, 'modlogReason') and flair_details.get('modlogReason'):
-                await handle_modlog_reason_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname)
-
-            if not is_action_completed(submission_id, 'lock') and 'lock' in flair_details and flair_details['lock']:
-                await handle_lock_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname)
-
-            if not is_action_completed(submission_id, 'spoiler') and 'spoiler' in flair_details and flair_details['spoiler']:
-                await handle_spoiler_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname)
-
-            if not is_action_completed(submission_id, 'clearPostFlair') and 'clearPostFlair' in flair_details and flair_details['clearPostFlair']:
-                await handle_clear_post_flair_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname)
-
-            if not is_action_completed(submission_id, 'sendToWebhook') and 'sendToWebhook' in flair_details and flair_details['sendToWebhook']:
-                await handle_webhook_action(config, post, flair_text, mod_name, flair_guid, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname)
-
-            if not (is_author_deleted or is_author_suspended):
-                if not is_action_completed(submission_id, 'comment') and 'comment' in flair_details and flair_details['comment']['enabled']:
-                    await handle_comment_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname, config, formatted_removal_reason_comment)
-
-                if not is_action_completed(submission_id, 'ban') and 'ban' in flair_details and flair_details['ban']['enabled']:
-                    await handle_ban_action(subreddit, post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname, placeholders, mod_name)
-
-                if not is_action_completed(submission_id, 'unban') and 'unban' in flair_details and flair_details['unban']:
-                    await handle_unban_action(subreddit, post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname)
-
-                if not is_action_completed(submission_id, 'userFlair') and 'userFlair' in flair_details and flair_details['userFlair']['enabled']:
-                    await handle_user_flair_action(subreddit, post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname, placeholders)
-
-                if not is_action_completed(submission_id, 'usernote') and 'usernote' in flair_details and flair_details['usernote']['enabled']:
-                    await handle_usernote_action(subreddit, post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname, placeholders, config, mod_name)
-
-                if not is_action_completed(submission_id, 'contributor') and 'contributor' in flair_details and flair_details['contributor']['enabled']:
-                    await handle_contributor_action(subreddit, post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname)
-
-                if not is_action_completed(submission_id, 'nuke') and 'nuke' in flair_details and flair_details['nuke'].get('enabled', False):
-                    if allow_ban_and_nuke:
-                        await handle_nuke_action(reddit, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname, post)
-                    else:
-                        mark_action_as_completed(submission_id, 'nuke')
-
-            else:
-                #User Suspended or Deleted, Mark actions as complete
-                mark_action_as_completed(submission_id, 'comment')
-                mark_action_as_completed(submission_id, 'ban')
-                mark_action_as_completed(submission_id, 'unban')
-                mark_action_as_completed(submission_id, 'userFlair')
-                mark_action_as_completed(submission_id, 'usernote')
-                mark_action_as_completed(submission_id, 'contributor')
-                mark_action_as_completed(submission_id, 'nuke')
-
-
-            if not is_action_completed(submission_id, 'nukeUserComments') and flair_details.get('nukeUserComments', False):
-                await handle_nuke_user_comments_action(post, submission_id, flair_details, disp_submission_id, disp_subreddit_displayname)
+            author_state = 'deleted' if is_author_deleted else 'suspended' if is_author_suspended else 'active'
+            for action, skip_reason in decide_flair_actions(flair_details, author_state, allow_ban_and_nuke):
+                if is_action_completed(submission_id, action):
+                    continue
+                if skip_reason is None:
+                    await run_action_handler(action, submission_id, action_handlers[action]())
+                else:
+                    mark_action_as_completed(submission_id, action)
+                    print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Skipped action '{action}' on ID: {disp_submission_id}: {skip_reason}") if debugmode else None
 
         except Exception as e:
             await error_handler(f"Error in process_flair_assignment for {disp_submission_id}: {str(e)}", notify_discord=True)
+        finally:
+            observe_metric('flair_helper_stage_duration_seconds', time.perf_counter() - execute_started, stage='execute')
 
         #finally:
         #    if is_submission_completed(submission_id):
@@ -1771,6 +3353,7 @@ async def handle_private_messages(reddit):
                     subreddit = await reddit.subreddit(message.subreddit.display_name)
                     try:
                         await subreddit.mod.accept_invite()
+                        register_subreddit_account(subreddit.display_name, reddit)
                         print(f"Accepted mod invite for /r/{subreddit.display_name}")
                     except asyncprawcore.NotFound:
                         print(f"Invalid mod invite for /r/{subreddit.display_name}")
@@ -1789,6 +3372,7 @@ async def handle_private_messages(reddit):
                 if auto_accept_mod_invites:
                     subreddit = await get_subreddit(reddit, message.subreddit.display_name)
                     await subreddit.mod.accept_invite()
+                    register_subreddit_account(subreddit.display_name, reddit)
                     print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Accepted mod invitation for r/{subreddit.display_name}") if debugmode else None
                     await discord_status_notification(f"Accepted mod invitation for r/{subreddit.display_name}")
                 else:
@@ -1960,6 +3544,156 @@ last_startup_time_MonitorModLog = None
 
 last_flair_data_dict = {}
 
+accounts_to_ignore = ['AssistantBOT1', 'anyadditionalacctshere', 'thatmayinteractwithflair']
+
+# Background config reloader: mod log handling only schedules a reload, so ingestion never waits on a wiki fetch.
+# Requests for the same subreddit are debounced and collapsed into one fetch of the page's latest revision.
+pending_config_reloads = {}  # Lowercase subreddit name -> {'reddit', 'bot_username', 'subreddit', 'first_requested', 'due'}
+config_reloader_task = None
+
+def request_config_reload(reddit, bot_username, subreddit_name, reason='wikirevise'):
+    global config_reloader_task
+    now = time.monotonic()
+    pending = pending_config_reloads.get(subreddit_name.lower())
+    if pending is None:
+        pending = pending_config_reloads[subreddit_name.lower()] = {'reddit': reddit, 'bot_username': bot_username, 'subreddit': subreddit_name, 'first_requested': now}
+    pending['due'] = min(now + config_reload_debounce_seconds, pending['first_requested'] + config_reload_max_delay)
+    increment_metric('flair_helper_config_reload_requests_total', reason=reason)
+    set_gauge('flair_helper_pending_config_reloads', len(pending_config_reloads))
+
+    if config_reloader_task is None or config_reloader_task.done():
+        config_reloader_task = asyncio.create_task(run_config_reloader())
+
+async def run_config_reloader(concurrency=3):
+    # Runs while reloads are pending, fetching each subreddit once its debounce window has passed (a few at a time, as a
+    # revised base page schedules every subreddit that extends it)
+    while pending_config_reloads:
+        now = time.monotonic()
+        due = sorted((name for name, pending in pending_config_reloads.items() if pending['due'] <= now), key=lambda name: pending_config_reloads[name]['due'])
+        if not due:
+            next_due = min(pending['due'] for pending in pending_config_reloads.values())
+            await asyncio.sleep(min(next_due - now, 1))  # Re-check, a newer request may have moved an earlier one
+            continue
+
+        batch = [pending_config_reloads.pop(name) for name in due[:concurrency]]
+        set_gauge('flair_helper_pending_config_reloads', len(pending_config_reloads))
+        await asyncio.gather(*(reload_subreddit_config(pending) for pending in batch))
+
+async def reload_subreddit_config(pending):
+    print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Reloading the Flair Helper configuration for /r/{pending['subreddit']}") if debugmode else None
+    try:
+        await fetch_and_cache_configs(pending['reddit'], pending['bot_username'], max_retries=3, retry_delay=5, single_sub=pending['subreddit'])
+        increment_metric('flair_helper_config_reloads_total', result='success')
+    except asyncprawcore.exceptions.NotFound:
+        increment_metric('flair_helper_config_reloads_total', result='not_found')
+        print(f"reload_subreddit_config: Flair Helper wiki page not found in /r/{pending['subreddit']}") if debugmode else None
+        errors_logger.error(f"reload_subreddit_config: Flair Helper wiki page not found in /r/{pending['subreddit']}")
+    except Exception as e:
+        increment_metric('flair_helper_config_reloads_total', result='error')
+        await error_handler(f"Error reloading the configuration for /r/{pending['subreddit']}: {str(e)}", notify_discord=True)
+
+
+# Handles a single mod log entry; shared by the live stream and the capture replay driver
+async def handle_mod_log_entry(reddit, bot_username, log_entry, ingested_at=None):
+    # ingested_at is only passed when a buffered entry is handled again once its subreddit's config has loaded
+    print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: New log entry: {log_entry.action}") if verbosemode else None
+
+    if not is_subreddit_in_shard(log_entry.subreddit) or not is_subreddit_owned_by(log_entry.subreddit, reddit):
+        return
+
+    if ingested_at is None:
+        write_capture_record('modlog', entry=mod_log_entry_to_dict(log_entry))
+        increment_metric('flair_helper_mod_log_entries_total', action=log_entry.action)
+        ingested_at = clock()
+    ingest_started = time.perf_counter()
+
+    if log_entry.target_fullname is not None:
+        log_entry_id = log_entry.target_fullname[3:]
+
+        if colored_console_output:
+            disp_subreddit_displayname = colored("/r/"+log_entry.subreddit, "cyan", attrs=["underline"])
+            disp_submission_id = colored(log_entry_id, "yellow")
+        else:
+            disp_subreddit_displayname = "/r/"+log_entry.subreddit
+            disp_submission_id = log_entry_id
+    else:
+        disp_subreddit_displayname = log_entry.subreddit
+        disp_submission_id = "N/A"
+
+    if log_entry.action == 'wikirevise':
+        reload_configs_extending(reddit, bot_username, log_entry)
+        if 'flair_helper' in log_entry.details and str(log_entry.mod).lower() == bot_username.lower() and log_entry.description == CONFIG_WRITE_BACK_REASON:
+            # The bot's own write-back of a corrected config; the cache already holds it
+            increment_metric('flair_helper_bot_config_revisions_skipped_total')
+            print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Skipping reload for the bot's own Flair Helper wiki revision in {disp_subreddit_displayname}") if debugmode else None
+        elif 'flair_helper' in log_entry.details:
+            print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Flair Helper wiki page revised by {log_entry.mod} in {disp_subreddit_displayname}") if debugmode else None
+            forget_missing_config(log_entry.subreddit)
+            request_config_reload(reddit, bot_username, log_entry.subreddit)
+
+    elif log_entry.action == 'acceptmoderatorinvite' and str(log_entry.mod).lower() == bot_username.lower():
+        print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: {bot_username} joined the mod team of {disp_subreddit_displayname}") if debugmode else None
+        register_subreddit_account(log_entry.subreddit, reddit)
+        request_config_reload(reddit, bot_username, log_entry.subreddit, reason='acceptmoderatorinvite')
+
+    elif log_entry.action == 'removemoderator' and (log_entry.target_author or '').lower() == bot_username.lower():
+        print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: {bot_username} was removed from the mod team of {disp_subreddit_displayname}") if debugmode else None
+        unregister_subreddit_account(log_entry.subreddit, reddit)
+
+    elif (log_entry.action == 'editflair'
+          and log_entry.mod not in accounts_to_ignore
+          and log_entry.target_fullname is not None
+          and log_entry.target_fullname.startswith('t3_')):
+        # This is a link (submission) flair edit
+        submission_id = log_entry.target_fullname[3:]  # Remove the 't3_' prefix
+        config = get_cached_config(log_entry.subreddit)
+
+        if config is None and is_subreddit_config_loading(log_entry.subreddit):
+            print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Configuration for {disp_subreddit_displayname} is still loading. Buffering flair change on {disp_submission_id}") if debugmode else None
+            buffer_mod_log_entry(reddit, bot_username, log_entry, ingested_at)
+            return
+
+        record_subreddit_activity(log_entry.subreddit)
+
+        if config is not None:
+            post = await reddit.submission(submission_id)
+            flair_guid = getattr(post, 'link_flair_template_id', None)  # Use getattr to safely retrieve the attribute
+
+            if flair_guid is not None:
+                last_flair_data_key = f"{submission_id}_{flair_guid}"
+                #print(f"last_flair_data_key: {last_flair_data_key}") if debugmode else None
+                current_time = clock()
+
+                if last_flair_data_key not in last_flair_data_dict or current_time - last_flair_data_dict[last_flair_data_key] >= config[0]['GeneralConfiguration'].get('ignore_same_flair_seconds', 60):
+                    last_flair_data_dict[last_flair_data_key] = current_time
+
+                    if colored_console_output:
+                        disp_flair_guid = colored(flair_guid, "magenta")
+                    else:
+                        disp_flair_guid = flair_guid
+
+                    flair_details = find_flair_details(config, flair_guid)
+
+                    if flair_details is not None:
+                        actions = get_flair_actions(flair_details)
+                        flair_notes = flair_details.get('notes', 'No description')  # Get the notes, or 'No description' if not available
+
+                        if actions:
+                            insert_actions_to_database(submission_id, actions, log_entry.mod.name, flair_guid, log_entry.subreddit, log_entry.created_utc, ingested_at)
+                            observe_metric('flair_helper_stage_duration_seconds', time.perf_counter() - ingest_started, stage='ingest')
+                            print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Actions for flair GUID {disp_flair_guid} ('{flair_notes}')") if debugmode else None
+                            print(f"                         under submission {disp_submission_id} in {disp_subreddit_displayname} added to the database") if debugmode else None
+                        else:
+                            print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: No actions found for flair GUID {disp_flair_guid}") if debugmode else None
+                    else:
+                        print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Flair GUID {disp_flair_guid} not found in the configuration") if debugmode else None
+                else:
+                    print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Ignoring duplicate flair assignment for submission {submission_id} with flair GUID {flair_guid}") if debugmode else None
+            else:
+                print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Flair GUID not found for submission {submission_id}") if debugmode else None
+        else:
+            print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Configuration not found for /r/{disp_subreddit_displayname}") if debugmode else None
+
 # Primary Mod Log Monitor
 #@reddit_error_handler
 async def monitor_mod_log(reddit, bot_username, max_concurrency=1):
@@ -1976,15 +3710,19 @@ async def monitor_mod_log(reddit, bot_username, max_concurrency=1):
 
     last_startup_time_MonitorModLog = current_time
 
-    accounts_to_ignore = ['AssistantBOT1', 'anyadditionalacctshere', 'thatmayinteractwithflair']
-
     print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Flair Helper 2 has started up successfully!\nBot username: {bot_username}") if verbosemode else None
 
+    if shard_id is not None and shard_count > 1:
+        # A shard needs its exact subreddit list to build the mod log stream
+        subreddit_names = await get_moderated_subreddit_names(reddit)
+    else:
+        # Otherwise the stream starts at once; the list below is informational, from whatever the registry holds so far
+        subreddit_names = [row['display_name'] for row in get_moderated_subreddits(get_account_for_reddit(reddit))]
+
     moderated_subreddits = []
-    async for subreddit in reddit.user.moderator_subreddits():
-        if f"u_{bot_username}" not in subreddit.display_name:
-            #continue  # Skip the bot's own user page
-            moderated_subreddits.append(subreddit.display_name)
+    for subreddit_name in subreddit_names:
+        if f"u_{bot_username}" not in subreddit_name and is_subreddit_in_shard(subreddit_name) and is_subreddit_owned_by(subreddit_name, reddit):
+            moderated_subreddits.append(subreddit_name)
 
     # Sort subreddits alphabetically ignoring case for sorting
     moderated_subreddits = sorted(moderated_subreddits, key=lambda x: x.lower())
@@ -1994,109 +3732,43 @@ async def monitor_mod_log(reddit, bot_username, max_concurrency=1):
 
     await discord_status_notification(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Flair Helper 2 has started up successfully!\nBot username: **{bot_username}**\n\n{bot_username} moderates subreddits:\n   {formatted_subreddits}")
 
+    # A shard only streams the mod log of the subreddits it owns. Its stream pauses after every empty poll (pause_after=0
+    # yields None) so it can be rebuilt when shard events add a subreddit.
+    sharded = shard_id is not None and shard_count > 1
+    account = get_account_for_reddit(reddit)
+    stream_subreddits = shard_mod_log_subreddits[account]
+    if sharded:
+        stream_subreddits.clear()
+        stream_subreddits.update((name.lower(), name) for name in moderated_subreddits)
+    mod_log_subreddit_name = "mod"
+    first_stream = True
+    newest_entry_time, newest_entry_ids = time.time(), set()  # What a rebuilt stream has already handled
+
     while True:
-        subreddit = await reddit.subreddit("mod")
+        if sharded:
+            shard_mod_log_changed.discard(account)
+            if not stream_subreddits:
+                print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Shard {shard_id} owns no subreddits for {bot_username}. Mod log monitoring idle.") if debugmode else None
+                while account not in shard_mod_log_changed:
+                    await asyncio.sleep(shard_event_poll_interval)
+                continue
+            mod_log_subreddit_name = "+".join(sorted(stream_subreddits.values(), key=lambda x: x.lower()))
+        subreddit = await reddit.subreddit(mod_log_subreddit_name)
+        skip_existing, first_stream = first_stream, False
         try:
-            while True:
-                async for log_entry in subreddit.mod.stream.log(skip_existing=True):
-                    print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: New log entry: {log_entry.action}") if verbosemode else None
-
-                    if log_entry.target_fullname is not None:
-                        log_entry_id = log_entry.target_fullname[3:]
-
-                        if colored_console_output:
-                            disp_subreddit_displayname = colored("/r/"+log_entry.subreddit, "cyan", attrs=["underline"])
-                            disp_submission_id = colored(log_entry_id, "yellow")
-                        else:
-                            disp_subreddit_displayname = "/r/"+log_entry.subreddit
-                            disp_submission_id = log_entry_id
-                    else:
-                        disp_subreddit_displayname = log_entry.subreddit
-                        disp_submission_id = "N/A"
+            while account not in shard_mod_log_changed:
+                async for log_entry in subreddit.mod.stream.log(skip_existing=skip_existing, pause_after=0 if sharded else None):
+                    if log_entry is None:
+                        if account in shard_mod_log_changed:
+                            break
+                        continue
+                    if not skip_existing and (log_entry.created_utc < newest_entry_time or log_entry.id in newest_entry_ids):
+                        continue  # A rebuilt stream starts with the latest entries, some already handled
+                    if log_entry.created_utc > newest_entry_time:
+                        newest_entry_time, newest_entry_ids = log_entry.created_utc, set()
+                    newest_entry_ids.add(log_entry.id)
 
-                    if log_entry.action == 'wikirevise':
-                        if 'flair_helper' in log_entry.details:
-                            print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Flair Helper wiki page revised by {log_entry.mod} in {disp_subreddit_displayname}") if debugmode else None
-                            try:
-                                await fetch_and_cache_configs(reddit, bot_username, max_retries=3, retry_delay=5, single_sub=log_entry.subreddit)  # Make sure fetch_and_cache_configs is async
-                            except asyncprawcore.exceptions.NotFound:
-                                print(f"monitor_mod_log: Flair Helper wiki page not found in {disp_subreddit_displayname}") if debugmode else None
-                                errors_logger.error(f"monitor_mod_log: Flair Helper wiki page not found in /r/{log_entry.subreddit}")
-
-                    elif (log_entry.action == 'editflair'
-                          and log_entry.mod not in accounts_to_ignore
-                          and log_entry.target_fullname is not None
-                          and log_entry.target_fullname.startswith('t3_')):
-                        # This is a link (submission) flair edit
-                        submission_id = log_entry.target_fullname[3:]  # Remove the 't3_' prefix
-                        config = get_cached_config(log_entry.subreddit)
-
-                        if config is not None:
-                            post = await reddit.submission(submission_id)
-                            flair_guid = getattr(post, 'link_flair_template_id', None)  # Use getattr to safely retrieve the attribute
-
-                            if flair_guid is not None:
-                                last_flair_data_key = f"{submission_id}_{flair_guid}"
-                                #print(f"last_flair_data_key: {last_flair_data_key}") if debugmode else None
-                                current_time = time.time()
-
-                                if last_flair_data_key not in last_flair_data_dict or current_time - last_flair_data_dict[last_flair_data_key] >= config[0]['GeneralConfiguration'].get('ignore_same_flair_seconds', 60):
-                                    last_flair_data_dict[last_flair_data_key] = current_time
-
-                                    if colored_console_output:
-                                        disp_flair_guid = colored(flair_guid, "magenta")
-                                    else:
-                                        disp_flair_guid = flair_guid
-
-                                    flair_details = next((flair for flair in config[1:] if flair['templateId'] == flair_guid), None)
-
-                                    if flair_details is not None:
-                                        actions = []
-                                        flair_notes = flair_details.get('notes', 'No description')  # Get the notes, or 'No description' if not available
-
-                                        if flair_details.get('approve', False):
-                                            actions.append('approve')
-                                        if flair_details.get('remove', False):
-                                            actions.append('remove')
-                                        if flair_details.get('lock', False):
-                                            actions.append('lock')
-                                        if flair_details.get('spoiler', False):
-                                            actions.append('spoiler')
-                                        if flair_details.get('clearPostFlair', False):
-                                            actions.append('clearPostFlair')
-                                        if flair_details.get('modlogReason', '').strip():
-                                            actions.append('modlogReason')
-                                        if flair_details.get('comment', {}).get('enabled', False):
-                                            actions.append('comment')
-                                        if flair_details.get('nukeUserComments', False):
-                                            actions.append('nukeUserComments')
-                                        if flair_details.get('usernote', {}).get('enabled', False):
-                                            actions.append('usernote')
-                                        if flair_details.get('contributor', {}).get('enabled', False):
-                                            actions.append('contributor')
-                                        if flair_details.get('userFlair', {}).get('enabled', False):
-                                            actions.append('userFlair')
-                                        if flair_details.get('ban', {}).get('enabled', False):
-                                            actions.append('ban')
-                                        if flair_details.get('unban', False):
-                                            actions.append('unban')
-                                        if flair_details.get('sendToWebhook', False):
-                                            actions.append('sendToWebhook')
-
-                                        if actions:
-                                            insert_actions_to_database(submission_id, actions, log_entry.mod.name, flair_guid)
-                                            print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Actions for flair GUID {disp_flair_guid} ('{flair_notes}')") if debugmode else None
-                                            print(f"                         under submission {disp_submission_id} in {disp_subreddit_displayname} added to the database") if debugmode else None
-                                        else:
-                                            print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: No actions found for flair GUID {disp_flair_guid}") if debugmode else None
-                                    else:
-                                        print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Flair GUID {disp_flair_guid} not found in the configuration") if debugmode else None
-                                else:
-                                    print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Ignoring duplicate flair assignment for submission {submission_id} with flair GUID {flair_guid}") if debugmode else None
-                            else:
-                                print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Flair GUID not found for submission {submission_id}") if debugmode else None
-                        else:
-                            print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Configuration not found for /r/{disp_subreddit_displayname}") if debugmode else None
+                    await handle_mod_log_entry(reddit, bot_username, log_entry)
 
         except asyncprawcore.exceptions.RequestException as e:
             print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Error in mod log stream: {str(e)}. Retrying...") if debugmode else None
@@ -2106,22 +3778,34 @@ async def monitor_mod_log(reddit, bot_username, max_concurrency=1):
 
 async def process_flair_actions(reddit, max_concurrency=2, processing_retry_delay=3, retry_delay=15):
     semaphore = asyncio.Semaphore(max_concurrency)
+    inflight_submissions = set()
     retry_tracker = defaultdict(lambda: {"attempts": 0, "last_attempt": None})
+    item_traces = {}  # submission_id -> trace, kept across retries until the submission is done
 
-    async def process_flair_assignment_with_semaphore(submission_id, mod_name):
+    async def process_flair_assignment_with_semaphore(submission_id, mod_name, subreddit_name, created_utc=None, ingested_at=None):
         if colored_console_output:
             disp_submission_id = colored(submission_id, "yellow")
         else:
             disp_submission_id = submission_id
 
         async with semaphore:
+            inflight_submissions.add(submission_id)
+            set_gauge('flair_helper_inflight_submissions', len(inflight_submissions))
+            trace = item_traces.get(submission_id)
+            if trace is None:
+                trace = item_traces[submission_id] = start_trace(submission_id, subreddit_name, mod_name, created_utc, ingested_at)
+            else:
+                current_trace.set(trace)
+            trace['attempts'] += 1
             try:
-                post = await reddit.submission(submission_id)
+                # Route the work to the account that moderates this subreddit
+                account_reddit = get_reddit_for_subreddit(subreddit_name, default=reddit)
+                post = await account_reddit.submission(submission_id)
                 subreddit = post.subreddit
                 config = get_cached_config(subreddit.display_name)
 
                 print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Sending {submission_id} for processing") if debugmode else None
-                await process_flair_assignment(reddit, post, config, subreddit, mod_name)
+                await process_flair_assignment(account_reddit, post, config, subreddit, mod_name)
 
                 if is_submission_completed(submission_id):
                     delete_completed_actions(submission_id)
@@ -2142,6 +3826,13 @@ async def process_flair_actions(reddit, max_concurrency=2, processing_retry_dela
                     retry_tracker.pop(submission_id, None)
                 else:
                     print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Retry {retry_tracker[submission_id]['attempts']} for submission {disp_submission_id}") if debugmode else None
+            finally:
+                inflight_submissions.discard(submission_id)
+                set_gauge('flair_helper_inflight_submissions', len(inflight_submissions))
+                if is_submission_completed(submission_id):
+                    finish_trace(item_traces.pop(submission_id))
+                else:
+                    current_trace.set(None)  # Another attempt follows
 
     while True:
         pending_submission_ids = get_pending_submission_ids_from_database()
@@ -2150,10 +3841,12 @@ async def process_flair_actions(reddit, max_concurrency=2, processing_retry_dela
             print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Found {len(pending_submission_ids)} pending submissions") if debugmode else None
 
             tasks = []
-            for submission_id, mod_name in pending_submission_ids:
+            for submission_id, mod_name, subreddit_name, created_utc, ingested_at in pending_submission_ids:
                 # Check if all actions for the submission are completed
                 if is_submission_completed(submission_id):
                     delete_completed_actions(submission_id)
+                    if submission_id in item_traces:
+                        finish_trace(item_traces.pop(submission_id))
                     print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: All actions for submission {submission_id} completed. Skipping processing.") if debugmode else None
                     continue
 
@@ -2169,7 +3862,7 @@ async def process_flair_actions(reddit, max_concurrency=2, processing_retry_dela
                     disp_modname = mod_name
 
                 print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Pending Actions on Submission {submission_id} actioned by {disp_modname} found in database") if debugmode else None
-                task = asyncio.create_task(process_flair_assignment_with_semaphore(submission_id, mod_name))
+                task = asyncio.create_task(process_flair_assignment_with_semaphore(submission_id, mod_name, subreddit_name, created_utc, ingested_at))
                 tasks.append(task)
 
             if tasks:
@@ -2179,12 +3872,78 @@ async def process_flair_actions(reddit, max_concurrency=2, processing_retry_dela
 
 
 
-@reddit_error_handler
-async def delayed_fetch_and_cache_configs(reddit, bot_username, delay):
-    await asyncio.sleep(delay)  # Wait for the specified delay
-    #print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: fetch_and_cache_configs skipped during testing.") if debugmode else None
-    print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Waited {delay}, Now processing fetch_and_cache_configs.") if debugmode else None
-    await fetch_and_cache_configs(reddit, bot_username)  # Fetch and cache configurations
+# Staged startup: the mod log is streamed straight away and served from the configs already cached in SQLite while
+# the full wiki sweep runs in the background. Entries for subreddits whose config is still loading are buffered.
+startup_state = 'ready'  # 'loading' while bot_main's config sweep runs
+config_sweep_loaded = set()  # Lowercase names of the subreddits the running sweep has finished
+buffered_mod_log_entries = defaultdict(list)  # Lowercase subreddit name -> [(reddit, bot_username, log_entry, ingested_at)]
+
+def is_subreddit_config_loading(subreddit_name):
+    return startup_state != 'ready' and subreddit_name.lower() not in config_sweep_loaded
+
+def buffer_mod_log_entry(reddit, bot_username, log_entry, ingested_at):
+    buffered_mod_log_entries[log_entry.subreddit.lower()].append((reddit, bot_username, log_entry, ingested_at))
+    increment_metric('flair_helper_buffered_mod_log_entries_total')
+    set_gauge('flair_helper_buffered_mod_log_entries', sum(len(entries) for entries in buffered_mod_log_entries.values()))
+
+async def flush_buffered_mod_log_entries(subreddit_name=None):
+    for name in [subreddit_name.lower()] if subreddit_name else list(buffered_mod_log_entries):
+        for reddit, bot_username, log_entry, ingested_at in buffered_mod_log_entries.pop(name, []):
+            # One bad entry must not take down the sweep worker, or the rest of the buffer with it
+            try:
+                await handle_mod_log_entry(reddit, bot_username, log_entry, ingested_at=ingested_at)
+            except Exception as e:
+                await error_handler(f"Error handling buffered mod log entry for {log_entry.target_fullname} in /r/{name}: {str(e)}", notify_discord=True)
+    set_gauge('flair_helper_buffered_mod_log_entries', sum(len(entries) for entries in buffered_mod_log_entries.values()))
+
+async def run_config_sweep(max_retries=3, retry_delay=1, max_retry_delay=60, concurrency=3):
+    # Fetches every owned subreddit's wiki config: subreddits with buffered entries first, then those with no cached
+    # config, then by recorded flair activity
+    global startup_state
+    startup_state = 'loading'
+    config_sweep_loaded.clear()
+    create_configs_database()
+    sweep_started = time.perf_counter()
+
+    try:
+        pending = {}
+        for account, account_reddit in reddit_clients.items():
+            bot_username = account_usernames[account]
+            for subreddit_name in await get_moderated_subreddit_names(account_reddit):
+                if f"u_{bot_username}" in subreddit_name or not is_subreddit_in_shard(subreddit_name) or not is_subreddit_owned_by(subreddit_name, account_reddit):
+                    continue
+                pending.setdefault(subreddit_name.lower(), (account_reddit, bot_username, await get_subreddit(account_reddit, subreddit_name)))
+
+        cached_subreddits = {name.lower() for name in get_stored_subreddits()}
+        activity = get_subreddit_activity()
+
+        def sweep_priority(name):
+            events, last_event = activity.get(name, (0, 0))
+            return (name not in buffered_mod_log_entries, name in cached_subreddits, -events, -(last_event or 0))
+
+        async def sweep_worker():
+            while pending:
+                name = min(pending, key=sweep_priority)
+                account_reddit, bot_username, subreddit = pending.pop(name)
+                try:
+                    await process_subreddit_config(account_reddit, subreddit, bot_username, max_retries, retry_delay, max_retry_delay, 1)
+                except Exception as e:
+                    await error_handler(f"Error loading the configuration for /r/{subreddit.display_name} during the startup sweep: {str(e)}", notify_discord=True)
+                config_sweep_loaded.add(name)
+                await flush_buffered_mod_log_entries(name)
+
+        set_gauge('flair_helper_config_sweep_remaining', len(pending))
+        await asyncio.gather(*(sweep_worker() for _ in range(concurrency)))
+    finally:
+        startup_state = 'ready'
+        await flush_buffered_mod_log_entries()
+
+    set_gauge('flair_helper_config_sweep_seconds', time.perf_counter() - sweep_started)
+    try:
+        await save_compiled_config_snapshot()
+    except Exception as e:
+        await error_handler(f"Error saving the compiled config snapshot: {str(e)}", notify_discord=False)
+    print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Completed checking all Wiki page configuration in {time.perf_counter() - sweep_started:.1f}s.") if debugmode else None
 
 
 # Check for PM's every 60 seconds
@@ -2244,6 +4003,8 @@ async def robust_bot_polling(bot):
     max_retry_delay = 60
     retry_delay = initial_retry_delay
 
+    from telebot.asyncio_helper import ApiTelegramException
+
     while True:
         try:
             print("Starting Telebot polling...") if debugmode or verbosemode else None
@@ -2337,9 +4098,14 @@ async def start_task(task_func, *args, task_name=None):
 telegram_bot_id = None  # initialize as a global variable for Telegram telegram_bot_id
 
 
+def get_account_task_name(task_name, account):
+    # Keep the historical task names when running a single account
+    return task_name if len(reddit_clients) <= 1 else f"{task_name} ({account})"
+
+
 @reddit_error_handler
 async def bot_main():
-    global telegram_bot_id, running_tasks, reddit, bot_username, max_concurrency, max_processing_retries, processing_retry_delay
+    global telegram_bot_id, running_tasks, reddit, bot_username, max_concurrency, max_processing_retries, processing_retry_delay, startup_state
 
     if verbosemode:
         action_type = "[Initialization] "
@@ -2347,6 +4113,10 @@ async def bot_main():
         action_type = "[Initialization] "
 
     create_actions_database()
+    if sync_ban_ledger_state():
+        print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: {action_type}The ban ledger was re-enabled; subreddits will be seeded again from usernotes") if debugmode else None
+    if shard_id is not None:
+        create_shards_database()
 
     global last_startup_time_main
 
@@ -2374,28 +4144,46 @@ async def bot_main():
     '''
 
     print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Flair Helper 2 initializing asyncpraw") if debugmode else None
-    reddit = asyncpraw.Reddit("fh2_login")
+    for account in getattr(config, 'reddit_accounts', ["fh2_login"]):
+        reddit_clients[account] = asyncpraw.Reddit(account, requestor_class=InstrumentedRequestor, requestor_kwargs={'account': account})
 
-    # Fetch the bot's username
-    print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Flair Helper 2 fetching bot_username") if debugmode else None
-    me = await reddit.user.me()
-    bot_username = me.name
-    print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Flair Helper 2 fetched bot username: {bot_username}") if debugmode else None
+        # Fetch the bot's username
+        print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Flair Helper 2 fetching bot_username for {account}") if debugmode else None
+        me = await reddit_clients[account].user.me()
+        account_usernames[account] = me.name
+        print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Flair Helper 2 fetched bot username: {me.name}") if debugmode else None
 
+    # The first account is the primary client, used for anything not tied to a specific subreddit
+    primary_account = next(iter(reddit_clients))
+    reddit = reddit_clients[primary_account]
+    bot_username = account_usernames[primary_account]
 
-    # Check if the database is empty
+    if len(reddit_clients) > 1:
+        await build_subreddit_account_map()
+
+
+    # Serve from the cached configs straight away; the wiki sweep below runs once every task has started
+    create_configs_database()
     if is_config_database_empty():
-        print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Database is empty. Fetching and caching configurations for all moderated subreddits.") if verbosemode else None
-        await fetch_and_cache_configs(reddit, bot_username)
+        print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Database is empty. Configurations for all moderated subreddits will load in the background.") if verbosemode else None
+    else:
+        snapshot_started = time.perf_counter()
+        loaded_configs = load_compiled_config_snapshot()
+        print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Loaded {loaded_configs} compiled configs from the snapshot in {time.perf_counter() - snapshot_started:.3f}s") if debugmode else None
+    startup_state = 'loading'
+    config_sweep_loaded.clear()
 
-    wiki_fetch_delay = 90
+    if mod_log_capture_filename and capture_file is None:
+        start_capture(mod_log_capture_filename)
 
     max_concurrency = 2
     max_processing_retries = 3
     processing_retry_delay = 15
 
     try:
-        if config.telegram_bot_control:
+        if config.telegram_bot_control and is_primary_shard() and not dry_run:
+            if telegram_bot is None:
+                setup_telegram_bot()
             print("Connecting to Telegram servers...") if debugmode or verbosemode else None
             telegram_bot_id = (await telegram_bot.get_me()).id
             await discord_status_notification(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: Successfully connected to Telegram servers. Bot ID: {telegram_bot_id}")
@@ -2405,13 +4193,37 @@ async def bot_main():
         await add_task('Flair Helper - Process Flair Actions', start_task, start_process_flair_actions_task, reddit, max_concurrency, max_processing_retries, processing_retry_delay)
         await discord_status_notification(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: {action_type}Starting Process Flair Actions...")
 
-        await add_task('Reddit - Monitor Mod Log', start_task, start_monitor_mod_log_task, reddit, bot_username)
-        await discord_status_notification(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: {action_type}Starting Monitor Mod Log...")
+        # Every account streams its own mod log and inbox
+        for account, account_reddit in reddit_clients.items():
+            await add_task(get_account_task_name('Reddit - Monitor Mod Log', account), start_task, start_monitor_mod_log_task, account_reddit, account_usernames[account])
+            await discord_status_notification(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: {action_type}Starting Monitor Mod Log for {account_usernames[account]}...")
+
+            # With shards, shard 0 answers the inbox. A dry-run bot shares its account with the production bot, which owns it.
+            if is_primary_shard() and not dry_run:
+                await add_task(get_account_task_name('Reddit - Monitor Private Messages', account), start_task, start_monitor_private_messages_task, account_reddit)
+                await discord_status_notification(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: {action_type}Starting Monitor Private Messages for {account_usernames[account]}...")
+
+        await add_task('Flair Helper - Flush Subreddit Activity', start_task, run_subreddit_activity_flush)
+        await add_task('Reddit - Reconcile Moderated Subreddits', start_task, reconcile_moderated_subreddits)
+        await add_task('Flair Helper - Save Compiled Config Snapshot', start_task, run_compiled_config_snapshot_saver)
+
+        if usernote_compaction_enabled:
+            await add_task('Flair Helper - Usernotes Compaction', start_task, run_usernote_compaction)
 
-        await add_task('Reddit - Monitor Private Messages', start_task, start_monitor_private_messages_task, reddit)
-        await discord_status_notification(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: {action_type}Starting Monitor Private Messages...")
+        if shard_id is not None:
+            await add_task(f'Shard {shard_id} - Heartbeat', start_task, shard_heartbeat)
+            await add_task(f'Shard {shard_id} - Events', start_task, run_shard_events)
 
-        await delayed_fetch_and_cache_configs(reddit, bot_username, wiki_fetch_delay)
+        if metrics_enabled:
+            await add_task('Flair Helper - Metrics Endpoint', start_task, run_metrics_server)
+            await add_task('Flair Helper - Event Loop Lag', start_task, monitor_event_loop_lag)
+
+        if metric_key('flair_helper_startup_seconds', {}) not in metrics_gauges:
+            startup_seconds = time.perf_counter() - import_started
+            set_gauge('flair_helper_startup_seconds', startup_seconds)
+            print(f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}: {action_type}All tasks started {startup_seconds:.2f}s after launch ({import_seconds:.2f}s importing)") if debugmode else None
+
+        await run_config_sweep()
 
         await asyncio.gather(*running_tasks.values())
     except asyncio.CancelledError:
@@ -2423,8 +4235,58 @@ async def bot_main():
         for task in running_tasks.values():
             task.cancel()
         await asyncio.gather(*running_tasks.values(), return_exceptions=True)
+        close_capture()
+
+# Module import time, without the optional integrations that are imported on first use
+import_seconds = time.perf_counter() - import_started
+set_gauge('flair_helper_startup_import_seconds', import_seconds)
 
 def main():
+    global shard_count, mod_log_capture_filename
+
+    parser = argparse.ArgumentParser(description="Flair Helper 2")
+    parser.add_argument('--shards', type=int, default=shard_count, help="Number of shard processes to split moderated subreddits across")
+    parser.add_argument('--shard-id', type=int, default=None, help="Run as a single shard (used by the shard coordinator)")
+    parser.add_argument('--trace-summary', action='store_true', help="Print p50/p95/p99 flair-to-action latency from the trace logs and exit")
+    parser.add_argument('--dry-run', action='store_true', help="Run the whole pipeline but record the actions' Reddit writes instead of sending them")
+    parser.add_argument('--dry-run-summary', action='store_true', help="Print the intended actions and API cost from the dry-run log and exit")
+    parser.add_argument('--record', metavar='CAPTURE_FILE', default=None, help="Capture mod log entries and Reddit responses to a gzip file for bench/replay_capture.py")
+    parser.add_argument('--import-time', action='store_true', help="Print how long importing the bot took and exit")
+    subparsers = parser.add_subparsers(dest='command')
+    explain_parser = subparsers.add_parser('explain', help="Print the action plan for a config and a submission/author snapshot and exit")
+    explain_parser.add_argument('config_file', help="Compiled JSON config or flair_helper wiki page (YAML)")
+    explain_parser.add_argument('snapshot_file', help='JSON with "submission", "author" (null if deleted), "mod" and optionally "now"')
+    args = parser.parse_args()
+
+    if args.import_time:
+        print(json.dumps({'import_seconds': round(import_seconds, 4)}))
+        return
+
+    if args.command == 'explain':
+        print(json.dumps(explain_flair_assignment(args.config_file, args.snapshot_file), indent=4))
+        return
+
+    if args.trace_summary:
+        print(json.dumps(summarize_traces(), indent=4))
+        return
+
+    if args.dry_run_summary:
+        print(json.dumps(summarize_dry_run(), indent=4))
+        return
+
+    if args.dry_run or dry_run:
+        enable_dry_run()
+
+    shard_count = max(args.shards, 1)
+    if args.record:
+        mod_log_capture_filename = args.record
+
+    if args.shard_id is not None:
+        configure_shard(args.shard_id)
+    elif shard_count > 1:
+        run_shard_coordinator(shard_count)
+        return
+
     loop = asyncio.get_event_loop()
     asyncio.ensure_future(bot_main())
     loop.run_forever()
@@ -0,0 +1,344 @@
+# Flair Helper 2 offload functions
+#
+# The zlib/JSON/YAML work flair_helper2_async.py hands to its CPU offload pool (see run_cpu_bound): Toolbox usernotes
+# decoding, lookup, rewriting and compaction, and legacy YAML config conversion. They live in this module, which only needs the
+# standard library (and PyYAML for YAML pages), so spawned pool workers import it instead of the whole bot with asyncpraw,
+# aiohttp, Telegram and config.py. Every function takes and returns plain data. flair_helper2_async.py re-exports them.
+
+import base64
+import codecs
+import json
+import logging
+import re
+import signal
+import time
+import zlib
+
+errors_logger = logging.getLogger('errors')  # Given its handlers by flair_helper2_async.py; pool workers log to stderr
+
+
+def init_offload_worker():
+    # Runs once in each spawned pool worker: Ctrl-C is the bot's to handle, and errors go to stderr
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    errors_logger.addHandler(logging.StreamHandler())
+
+def timed_offload_call(function, args, submitted_at):
+    # The pool's entry point: runs function(*args) and reports how long it queued and ran
+    started = time.time()
+    return function(*args), started - submitted_at, time.time() - started
+
+
+# Legacy YAML configs
+BAN_NOTE_DISALLOWED_CHARACTERS = re.compile(r'[^a-zA-Z0-9\s\-_.,]')
+MODLOG_REASON_DISALLOWED_CHARACTERS = re.compile(r'[^a-zA-Z0-9\s\-_.,/\\]')
+
+def load_yaml(text):
+    import yaml
+    return yaml.load(text, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+def load_yaml_config(wiki_content):
+    return convert_yaml_to_json(load_yaml(wiki_content))
+
+def load_yaml_config_json(wiki_content):
+    # The converted config as JSON text, which is cheaper than the parsed objects to send back from a worker process
+    return json.dumps(load_yaml_config(wiki_content))
+
+def convert_yaml_to_json(yaml_config):
+    # Create the GeneralConfiguration section
+    general_config = {
+        "GeneralConfiguration": {
+            "notes": yaml_config.get('notes', ''),
+            "header": yaml_config.get('header', ''),
+            "footer": yaml_config.get('footer', ''),
+            "usernote_type_name": yaml_config.get('usernote_type_name', ''),
+            "usernote_expire_days": yaml_config.get('usernote_expire_days', 0),
+            "usernote_max_notes": yaml_config.get('usernote_max_notes', 0),
+            "removal_comment_type": yaml_config.get('removal_comment_type', ''),
+            "skip_add_newlines": yaml_config.get('skip_add_newlines', False),
+            "require_config_to_edit": yaml_config.get('require_config_to_edit', False),
+            "ignore_same_flair_seconds": yaml_config.get('ignore_same_flair_seconds', 60),
+            "webhook": yaml_config.get('webhook', ''),
+            "wh_content": yaml_config.get('wh_content', ''),
+            "wh_ping_over_score": yaml_config.get('wh_ping_over_score', None),
+            "wh_ping_over_ping": yaml_config.get('wh_ping_over_ping', ''),
+            "wh_exclude_mod": yaml_config.get('wh_exclude_mod', False),
+            "wh_exclude_reports": yaml_config.get('wh_exclude_reports', False),
+            "wh_exclude_image": yaml_config.get('wh_exclude_image', False),
+            "wh_include_nsfw_images": yaml_config.get('wh_include_nsfw_images', False),
+            "utc_offset": yaml_config.get('utc_offset', 0),
+            "custom_time_format": yaml_config.get('custom_time_format', ''),
+            "maxAgeForComment": yaml_config.get('max_age_for_comment', 175),
+            "maxAgeForBan": yaml_config.get('max_age_for_ban', None)
+        }
+    }
+
+    # Convert the YAML configuration to JSON format
+    json_config = [general_config]
+    for flair_id, flair_details in yaml_config.get('flairs', {}).items():
+        # Remove special characters except dashes, underscores, periods, and commas
+        cleaned_mod_note = BAN_NOTE_DISALLOWED_CHARACTERS.sub('', yaml_config.get('ban_note', {}).get(flair_id, ''))
+
+        # Truncate the mod_note to 250 characters
+        cleaned_mod_note = cleaned_mod_note[:100]
+
+        # Remove special characters except dashes, underscores, periods, and commas
+        cleaned_modlog_reason = MODLOG_REASON_DISALLOWED_CHARACTERS.sub('', yaml_config.get('ban', {}).get(flair_id, ''))
+        cleaned_modlog_reason = cleaned_modlog_reason.replace('\n', ' ')
+        cleaned_modlog_reason = cleaned_modlog_reason.replace('  ', ' ')
+        cleaned_modlog_reason = cleaned_modlog_reason.replace('  ', ', ')
+        cleaned_modlog_reason = cleaned_modlog_reason.strip()
+
+        # Truncate the modlog_reason to 250 characters
+        cleaned_modlog_reason = cleaned_modlog_reason[:250]
+
+        flair_config = {
+            "templateId": flair_id,
+            "notes": flair_details,
+            "approve": flair_id in yaml_config.get('approve', {}),
+            "remove": flair_id in yaml_config.get('remove', {}),
+            "lock": flair_id in yaml_config.get('lock_post', {}),
+            "spoiler": flair_id in yaml_config.get('spoiler_post', {}),
+            "clearPostFlair": flair_id in yaml_config.get('remove_link_flair', {}),
+            "modlogReason": cleaned_modlog_reason,
+            "comment": {
+                "enabled": flair_id in yaml_config.get('comment', {}),
+                "body": flair_details,
+                "lockComment": yaml_config.get('comment_locked', {}).get(flair_id, False),
+                "stickyComment": yaml_config.get('comment_stickied', {}).get(flair_id, False),
+                "distinguish": True,
+                "headerFooter": True
+            },
+            "nukeUserComments": flair_id in yaml_config.get('nukeUserComments', {}),
+            "usernote": {
+                "enabled": flair_id in yaml_config.get('usernote', {}),
+                "note": yaml_config.get('usernote', {}).get(flair_id, '')
+            },
+            "contributor": {
+                "enabled": flair_id in yaml_config.get('add_contributor', {}) or flair_id in yaml_config.get('remove_contributor', {}),
+                "action": "add" if flair_id in yaml_config.get('add_contributor', {}) else "add"
+            },
+            "userFlair": {
+                "enabled": flair_id in yaml_config.get('set_author_flair_text', {}) or
+                           flair_id in yaml_config.get('set_author_flair_css_class', {}) or
+                           flair_id in yaml_config.get('set_author_flair_template_id', {}),
+                "text": yaml_config.get('set_author_flair_text', {}).get(flair_id, ''),
+                "cssClass": yaml_config.get('set_author_flair_css_class', {}).get(flair_id, ''),
+                "templateId": yaml_config.get('set_author_flair_template_id', {}).get(flair_id, '')
+            },
+            "ban": {
+                "enabled": flair_id in yaml_config.get('bans', {}),
+                "duration": "" if yaml_config.get('bans', {}).get(flair_id, 0) is True else yaml_config.get('bans', {}).get(flair_id, 0),
+                "message": yaml_config.get('ban_message', {}).get(flair_id, ''),
+                "modNote": cleaned_mod_note
+            },
+            "unban": flair_id in yaml_config.get('unbans', {}),
+            "sendToWebhook": flair_id in yaml_config.get('send_to_webhook', [])
+        }
+
+        json_config.append(flair_config)
+
+    print(f"YAML to JSON Conversion complete.")
+
+    return json_config
+
+
+# Toolbox Note Handlers
+def decompress_notes(compressed):
+    try:
+        decompressed = zlib.decompress(base64.b64decode(compressed))
+        return json.loads(decompressed.decode('utf-8'))
+    except (zlib.error, base64.binascii.Error, json.JSONDecodeError) as e:
+        errors_logger.error(f"Error decompressing usernotes: {e}")
+        return {}
+
+def compress_notes(notes):
+    compressed = base64.b64encode(zlib.compress(json.dumps(notes).encode('utf-8'))).decode('utf-8')
+    return compressed
+
+USERNOTES_STREAM_CHUNK_SIZE = 64 * 1024  # Base64 characters decoded per step (a multiple of 4)
+USERNOTES_STREAM_MAX_OUTPUT = 256 * 1024  # Most decompressed bytes produced per step
+
+def find_user_notes(compressed, username):
+    # One user's "ns" list from a Toolbox blob, or None if the user has no entry. The blob is inflated and scanned a chunk
+    # at a time, holding only a small window of the decompressed JSON, and reading stops once the user's entry is parsed.
+    # A quoted string followed by ':' can only be a key, and the only keys below the top level are "ns", n, t, m, l and w.
+    key_literal = json.dumps(username)
+    key_pattern = re.compile(re.escape(key_literal) + r'\s*:\s*')
+    decoder = json.JSONDecoder()
+    decompressor = zlib.decompressobj()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    window = ''
+    found = False
+    try:
+        for offset in range(0, len(compressed), USERNOTES_STREAM_CHUNK_SIZE):
+            data = base64.b64decode(compressed[offset:offset + USERNOTES_STREAM_CHUNK_SIZE])
+            while data:
+                window += text_decoder.decode(decompressor.decompress(data, USERNOTES_STREAM_MAX_OUTPUT))
+                data = decompressor.unconsumed_tail
+                if not found:
+                    match = key_pattern.search(window)
+                    if match is None:
+                        window = window[-(len(key_literal) + 16):]  # Enough to catch a key split across chunks
+                        continue
+                    window = window[match.end():]
+                    found = True
+                try:
+                    user_entry, _ = decoder.raw_decode(window.lstrip())  # The key's match can end before the space after ':'
+                except json.JSONDecodeError:
+                    continue  # The entry continues in the next chunk
+                return user_entry.get('ns', []) if isinstance(user_entry, dict) else []
+    except (zlib.error, base64.binascii.Error, UnicodeDecodeError) as e:
+        errors_logger.error(f"Error reading usernotes for {username}: {e}")
+    return None
+
+def add_usernote(notes, author, note_text, link, mod_index, usernote_type_index):
+    if author not in notes:
+        notes[author] = {"ns": []}
+
+    timestamp = int(time.time())
+    submission_id = link.split('/')[-3]
+    new_note = {
+        "n": f"[FH] {note_text}",
+        "t": timestamp,
+        "m": mod_index,
+        "l": f"l,{submission_id}",
+        "w": usernote_type_index
+    }
+    notes[author]["ns"].append(new_note)
+
+
+def read_usernote_ban_values(usernotes_content, username):
+    # The FH-Ban- values of a user's notes on a Toolbox usernotes page, oldest first
+    usernotes_data = json.loads(usernotes_content)
+    if 'blob' not in usernotes_data:
+        return []  # No usernotes exist
+
+    user_notes = find_user_notes(usernotes_data['blob'], username)
+    if user_notes is None:
+        return []  # No notes for this user
+
+    # Convert the notes to the format we need for ban tracking
+    formatted_notes = []
+    for note in user_notes:
+        formatted_notes.extend(get_note_ban_values(note['n']))
+    return formatted_notes
+
+def get_note_ban_values(note_text):
+    # The FH-Ban- values recorded by one note: one for a ban note, every one folded into a history summary, none otherwise
+    if note_text.startswith(USERNOTE_BAN_HISTORY_PREFIX):
+        return parse_ban_history(note_text)
+    if note_text.startswith("[FH] FH-Ban-"):
+        return [note_text.split("FH-Ban-")[1]]
+    return []
+
+def read_all_usernote_ban_values(usernotes_content):
+    # (username, FH-Ban- value, note time, Toolbox link) for every Flair Helper ban recorded on a usernotes page
+    usernotes_data = json.loads(usernotes_content)
+    if not usernotes_data.get('blob'):
+        return []
+    bans = []
+    for username, user_data in decompress_notes(usernotes_data['blob']).items():
+        for note in user_data.get('ns', []):
+            bans += [(username, ban_value, note.get('t', 0), note.get('l', '')) for ban_value in get_note_ban_values(note.get('n', ''))]
+    return bans
+
+def build_updated_usernotes(usernotes_content, author, note_text, link, mod_name, usernote_type_name=None):
+    # The usernotes page content with one note added for author
+    usernotes_data = json.loads(usernotes_content)
+
+    if 'blob' not in usernotes_data:
+        usernotes_data['blob'] = ''
+
+    decompressed_notes = decompress_notes(usernotes_data['blob'])
+
+    if 'constants' not in usernotes_data:
+        usernotes_data['constants'] = {'users': [], 'warnings': []}
+
+    if mod_name not in usernotes_data['constants']['users']:
+        usernotes_data['constants']['users'].append(mod_name)
+
+    mod_index = usernotes_data['constants']['users'].index(mod_name)
+
+    if usernote_type_name:
+        if usernote_type_name not in usernotes_data['constants']['warnings']:
+            usernotes_data['constants']['warnings'].append(usernote_type_name)
+        usernote_type_index = usernotes_data['constants']['warnings'].index(usernote_type_name)
+    else:
+        usernote_type_index = 0  # Use the default index if usernote_type_name is not provided
+
+    add_usernote(decompressed_notes, author, note_text, link, mod_index, usernote_type_index)
+
+    usernotes_data['blob'] = compress_notes(decompressed_notes)
+    return json.dumps(usernotes_data)
+
+# Compaction folds a user's expired FH-Ban- notes (and any earlier summary) into one note, e.g. "[FH] FH-Ban-history: 3,7x2,30"
+# (oldest first, "x2" for a duration repeated), which read_usernote_ban_values expands so escalating bans see every previous one
+USERNOTE_BAN_HISTORY_PREFIX = "[FH] FH-Ban-history: "
+
+def parse_ban_history(note_text):
+    ban_values = []
+    for token in note_text[len(USERNOTE_BAN_HISTORY_PREFIX):].split(','):
+        value, _, count = token.strip().partition('x')
+        if value:
+            ban_values += [value] * (int(count) if count.isdigit() else 1)
+    return ban_values
+
+def format_ban_history(ban_values):
+    tokens = []
+    for value in ban_values:
+        if tokens and tokens[-1][0] == value:
+            tokens[-1][1] += 1
+        else:
+            tokens.append([value, 1])
+    return USERNOTE_BAN_HISTORY_PREFIX + ','.join(value if count == 1 else f"{value}x{count}" for value, count in tokens)
+
+def compact_user_notes(user_notes, expire_before=None, max_notes=0):
+    # One user's "ns" list after compaction, plus the number of notes removed or folded. Only [FH] notes are touched: those
+    # older than expire_before, or beyond the newest max_notes, are dropped, and the FH-Ban- ones among them are summarised.
+    fh_notes = [note for index, note in sorted(((index, note) for index, note in enumerate(user_notes)
+                                                if note['n'].startswith('[FH] ') and not note['n'].startswith(USERNOTE_BAN_HISTORY_PREFIX)),
+                                               key=lambda item: (item[1].get('t', 0), item[0]), reverse=True)]  # Newest first
+    compacted = [note for index, note in enumerate(fh_notes)
+                 if (expire_before is not None and note.get('t', 0) < expire_before) or (max_notes and index >= max_notes)]
+    if not compacted:
+        return user_notes, 0
+
+    summary = next((note for note in user_notes if note['n'].startswith(USERNOTE_BAN_HISTORY_PREFIX)), None)
+    removed_ids = {id(note) for note in compacted + ([summary] if summary else [])}
+    position = next(index for index, note in enumerate(user_notes) if id(note) in removed_ids)  # Where the oldest went
+    ban_notes = [note for note in reversed(compacted) if note['n'].startswith("[FH] FH-Ban-")]  # Oldest first
+    kept_notes = [note for note in user_notes if id(note) not in removed_ids]
+    if ban_notes:
+        ban_values = parse_ban_history(summary['n']) if summary else []
+        ban_values += [note['n'].split("FH-Ban-")[1] for note in ban_notes]
+        latest = ban_notes[-1]
+        summary = dict(latest, n=format_ban_history(ban_values), t=max(latest.get('t', 0), summary.get('t', 0) if summary else 0))
+    if summary is not None:
+        kept_notes.insert(position, summary)  # Keeps the notes, and so read_usernote_ban_values, oldest first
+    return kept_notes, len(compacted)
+
+def compact_usernotes(usernotes_content, expire_before=None, max_notes=0):
+    # The compacted usernotes page content (None if nothing changed) and what was done, including the blob size before and after
+    usernotes_data = json.loads(usernotes_content)
+    blob = usernotes_data.get('blob', '')
+    stats = {'notes': 0, 'users_removed': 0, 'blob_bytes_before': len(blob), 'blob_bytes_after': len(blob)}
+    if not blob:
+        return None, stats
+
+    notes = decompress_notes(blob)
+    for username in list(notes):
+        user_notes, compacted = compact_user_notes(notes[username].get('ns', []), expire_before, max_notes)
+        if not compacted:
+            continue
+        stats['notes'] += compacted
+        if user_notes:
+            notes[username]['ns'] = user_notes
+        else:
+            del notes[username]
+            stats['users_removed'] += 1
+    if not stats['notes']:
+        return None, stats
+
+    usernotes_data['blob'] = compress_notes(notes)
+    stats['blob_bytes_after'] = len(usernotes_data['blob'])
+    return json.dumps(usernotes_data), stats
@@ -0,0 +1,621 @@
+"""Local stand-in for the parts of the Reddit API that Flair Helper 2 uses.
+
+Runs an aiohttp server that asyncpraw can be pointed at through praw.ini overrides
+(see the [fh2_emulator] section), so flair_helper2_async.py can be exercised and
+load tested offline.  Latency, rate-limit headers and 429 responses are configurable,
+and synthetic editflair mod log traffic can be generated at a fixed rate.
+
+    python reddit_emulator.py --port 8080 --subreddits 10 --rate 5
+"""
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import random
+import re
+import time
+import zlib
+from collections import deque
+from urllib.parse import parse_qs
+
+from aiohttp import web
+
+
+BOT_USERNAME = "FlairHelperBot"
+
+# Calls that change state on Reddit. Everything the bot does as an "action" goes through one of these.
+MUTATING_ENDPOINTS = {
+    'api/remove', 'api/approve', 'api/lock', 'api/unlock', 'api/spoiler', 'api/unspoiler', 'api/comment',
+    'api/distinguish', 'api/mod/notes', 'api/compose', 'api/v1/modactions/removal_link_message',
+    'api/v1/modactions/removal_reasons', 'api/friend', 'api/unfriend', 'api/flair', 'api/selectflair', 'api/wiki/edit',
+}
+
+
+def listing(children, after=None):
+    return {"kind": "Listing", "data": {"after": after, "before": None, "dist": len(children), "children": children}}
+
+
+def compress_usernotes(notes):
+    return base64.b64encode(zlib.compress(json.dumps(notes).encode('utf-8'))).decode('utf-8')
+
+
+def make_flair_helper_config(subreddit_name, template_ids, usernotes=True, nuke=False):
+    config = [{
+        "GeneralConfiguration": {
+            "header": "Hi /u/{{author}}, your post in /r/{{subreddit}} was removed:",
+            "footer": "Please read the rules of /r/{{subreddit}} before posting again.",
+            "usernote_type_name": "flair_helper_note",
+            "removal_comment_type": "public_as_subreddit",
+            "ignore_same_flair_seconds": 0,
+            "maxAgeForComment": 175,
+        }
+    }]
+    for index, template_id in enumerate(template_ids):
+        config.append({
+            "templateId": template_id,
+            "notes": f"Rule {index + 1}",
+            "approve": False,
+            "remove": True,
+            "lock": index % 2 == 0,
+            "spoiler": False,
+            "clearPostFlair": False,
+            "modlogReason": f"Rule {index + 1} violation",
+            "comment": {"enabled": True, "body": f"Removed for breaking rule {index + 1}. Posted {{{{created_iso}}}}.", "lockComment": False, "stickyComment": False, "distinguish": True, "headerFooter": True},
+            "nukeUserComments": False,
+            "usernote": {"enabled": usernotes, "note": f"Rule {index + 1} removal by {{{{mod}}}}"},
+            "contributor": {"enabled": False, "action": "add"},
+            "userFlair": {"enabled": False, "text": "", "cssClass": "", "templateId": ""},
+            "ban": {"enabled": False, "duration": 0, "message": "", "modNote": ""},
+            "unban": False,
+            "sendToWebhook": False,
+            "nuke": {"enabled": nuke, "banFromAllListed": False, "removeAllComments": True, "removeAllSubmissions": False, "targetSubreddits": [subreddit_name]},
+        })
+    return config
+
+
+class RedditEmulator:
+
+    def __init__(self, latency=0.0, jitter=0.0, rate_limit_budget=600, rate_limit_window=600, enforce_rate_limit=True, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_budget = rate_limit_budget
+        self.rate_limit_window = rate_limit_window
+        self.enforce_rate_limit = enforce_rate_limit
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+
+        self.ids = itertools.count(1)
+        self.subreddits = {}  # lowercased name -> subreddit state
+        self.submissions = {}  # id36 -> submission data
+        self.comments = {}  # id36 -> comment data
+        self.users = {}  # lowercased name -> user data
+        self.inbox = []
+        self.modlog = []  # all mod log entries in creation order
+
+        self.request_times = deque()
+        self.request_count = 0
+        self.requests_by_endpoint = {}
+        self.action_log = []  # every mutating call, in order
+        self.first_action_time = {}  # submission id -> time of the first mutating call that targeted it
+        self.last_action_time = {}  # submission id -> time of the latest mutating call that targeted it
+        self.flair_events = {}  # submission id -> created_utc of the editflair entry that flaired it
+
+        self.add_user(BOT_USERNAME)
+
+    # --- State helpers ---------------------------------------------------------------------------
+
+    def new_id36(self):
+        value = next(self.ids) + 1000000
+        digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+        encoded = ""
+        while value:
+            value, remainder = divmod(value, 36)
+            encoded = digits[remainder] + encoded
+        return encoded
+
+    def add_user(self, name, suspended=False):
+        self.users[name.lower()] = {"name": name, "id": self.new_id36(), "created_utc": time.time() - 86400 * 365, "comment_karma": 100, "link_karma": 100, "is_suspended": suspended}
+        return self.users[name.lower()]
+
+    def add_subreddit(self, name, config=None, templates=(), moderators=(BOT_USERNAME, "ExampleMod")):
+        subreddit = {
+            "name": name,
+            "id": self.new_id36(),
+            "wiki": {},
+            "templates": [{"id": template_id, "text": f"Template {index}", "mod_only": True} for index, template_id in enumerate(templates)],
+            "moderators": list(moderators),
+            "banned": set(),
+            "contributors": set(),
+            "user_flair": {},
+        }
+        self.subreddits[name.lower()] = subreddit
+        for moderator in moderators:
+            if moderator.lower() not in self.users:
+                self.add_user(moderator)
+        if config is not None:
+            self.set_wiki_page(name, "flair_helper", config if isinstance(config, str) else json.dumps(config, indent=4), author="ExampleMod", log=False)
+        return subreddit
+
+    def set_wiki_page(self, subreddit_name, page, content, author=BOT_USERNAME, log=True, reason=None):
+        subreddit = self.subreddits[subreddit_name.lower()]
+        revision = {"id": f"{self.new_id36()}-rev", "author": author, "timestamp": time.time(), "reason": reason}
+        wiki_page = subreddit["wiki"].setdefault(page, {"revisions": []})
+        wiki_page["content"] = content
+        wiki_page["revisions"].insert(0, revision)
+        if log:
+            # Like Reddit, the entry describes the revision by its edit reason
+            self.add_mod_log_entry(subreddit["name"], "wikirevise", author, details=f"Page {page} edited", description=reason or "")
+        return revision
+
+    def add_submission(self, subreddit_name, author=None, flair_template_id=None, flair_text=None, **fields):
+        subreddit = self.subreddits[subreddit_name.lower()]
+        id36 = self.new_id36()
+        author = author or f"user_{self.random.randrange(1000000)}"
+        if author.lower() not in self.users:
+            self.add_user(author)
+        submission = {
+            "id": id36,
+            "name": f"t3_{id36}",
+            "title": f"Synthetic post {id36}",
+            "selftext": "Synthetic post body",
+            "author": author,
+            "author_fullname": f"t2_{self.users[author.lower()]['id']}",
+            "subreddit": subreddit["name"],
+            "subreddit_id": f"t5_{subreddit['id']}",
+            "subreddit_name_prefixed": f"r/{subreddit['name']}",
+            "permalink": f"/r/{subreddit['name']}/comments/{id36}/synthetic_post/",
+            "url": f"https://www.reddit.com/r/{subreddit['name']}/comments/{id36}/synthetic_post/",
+            "domain": f"self.{subreddit['name']}",
+            "created_utc": time.time() - 3600,
+            "link_flair_template_id": flair_template_id,
+            "link_flair_text": flair_text,
+            "link_flair_css_class": None,
+            "author_flair_text": None,
+            "author_flair_css_class": None,
+            "author_flair_template_id": None,
+            "removed": False,
+            "locked": False,
+            "spoiler": False,
+            "over_18": False,
+            "score": 1,
+            "num_comments": 0,
+            "user_reports": [],
+            "mod_reports": [],
+            "is_self": True,
+        }
+        submission.update(fields)
+        self.submissions[id36] = submission
+        return submission
+
+    def add_mod_log_entry(self, subreddit_name, action, mod, target_fullname=None, details="", description="", created_utc=None):
+        entry = {
+            "id": f"ModAction_{self.new_id36()}",
+            "action": action,
+            "mod": mod,
+            "mod_id36": self.users.get(mod.lower(), {}).get("id", ""),
+            "subreddit": self.subreddits[subreddit_name.lower()]["name"],
+            "subreddit_name_prefixed": f"r/{self.subreddits[subreddit_name.lower()]['name']}",
+            "sr_id36": self.subreddits[subreddit_name.lower()]["id"],
+            "target_fullname": target_fullname,
+            "target_author": None,
+            "target_permalink": None,
+            "details": details,
+            "description": description,
+            "created_utc": created_utc if created_utc is not None else time.time(),
+        }
+        if target_fullname and target_fullname.startswith("t3_") and target_fullname[3:] in self.submissions:
+            submission = self.submissions[target_fullname[3:]]
+            entry["target_author"] = submission["author"]
+            entry["target_permalink"] = submission["permalink"]
+        self.modlog.append(entry)
+        return entry
+
+    def flair_submission(self, subreddit_name, template_id=None, mod="ExampleMod", submission_id=None):
+        # Simulates a moderator applying a link flair: a submission carrying the template plus an editflair entry
+        subreddit = self.subreddits[subreddit_name.lower()]
+        if template_id is None and subreddit["templates"]:
+            template_id = self.random.choice(subreddit["templates"])["id"]
+        if submission_id is None:
+            submission = self.add_submission(subreddit["name"], flair_template_id=template_id, flair_text="Removed")
+        else:
+            submission = self.submissions[submission_id]
+            submission["link_flair_template_id"] = template_id
+        entry = self.add_mod_log_entry(subreddit["name"], "editflair", mod, target_fullname=submission["name"])
+        self.flair_events[submission["id"]] = entry["created_utc"]
+        return entry
+
+    def add_inbox_message(self, author, subject, body, subreddit_name=None):
+        id36 = self.new_id36()
+        message = {"kind": "t4", "data": {
+            "id": id36, "name": f"t4_{id36}", "author": author, "subject": subject, "body": body, "dest": BOT_USERNAME,
+            "subreddit": self.subreddits[subreddit_name.lower()]["name"] if subreddit_name else None,
+            "created_utc": time.time(), "new": True, "was_comment": False, "parent_id": None, "replies": "", "distinguished": None,
+        }}
+        self.inbox.append(message)
+        return message
+
+    def populate(self, num_subreddits=10, templates_per_subreddit=5, usernote_users=0, usernotes=True, nuke=False, prefix="fh_test"):
+        for index in range(num_subreddits):
+            name = f"{prefix}_{index}"
+            template_ids = [f"{name}-tmpl-{template}" for template in range(templates_per_subreddit)]
+            self.add_subreddit(name, make_flair_helper_config(name, template_ids, usernotes=usernotes, nuke=nuke), templates=template_ids)
+            if usernotes or usernote_users:
+                # Toolbox creates the usernotes page as soon as a subreddit uses it, so it always exists here
+                notes = {f"user_{user}": {"ns": [{"n": "Existing note", "t": int(time.time()), "m": 0, "l": "l,abc123", "w": 0}]} for user in range(usernote_users)}
+                usernotes_page = {"ver": 6, "constants": {"users": ["ExampleMod"], "warnings": ["flair_helper_note"]}, "blob": compress_usernotes(notes)}
+                self.set_wiki_page(name, "usernotes", json.dumps(usernotes_page), author="ExampleMod", log=False)
+
+    async def generate_traffic(self, rate, duration=None, subreddit_names=None):
+        # Emits editflair mod log entries at `rate` per second across the given (or all) subreddits
+        subreddit_names = subreddit_names or [subreddit["name"] for subreddit in self.subreddits.values()]
+        started = time.monotonic()
+        emitted = 0
+        while duration is None or time.monotonic() - started < duration:
+            self.flair_submission(self.random.choice(subreddit_names))
+            emitted += 1
+            next_event = started + emitted / rate
+            await asyncio.sleep(max(next_event - time.monotonic(), 0))
+        return emitted
+
+    # --- Serialisation -------------------------------------------------------------------------
+
+    def submission_thing(self, submission):
+        return {"kind": "t3", "data": dict(submission)}
+
+    def comment_thing(self, comment):
+        return {"kind": "t1", "data": dict(comment)}
+
+    def subreddit_thing(self, subreddit):
+        return {"kind": "t5", "data": {
+            "display_name": subreddit["name"], "id": subreddit["id"], "name": f"t5_{subreddit['id']}",
+            "display_name_prefixed": f"r/{subreddit['name']}", "user_is_moderator": True, "subscribers": 1000,
+            "url": f"/r/{subreddit['name']}/",
+        }}
+
+    def user_thing(self, user):
+        if user["is_suspended"]:
+            return {"kind": "t2", "data": {"name": user["name"], "is_suspended": True}}
+        return {"kind": "t2", "data": {key: value for key, value in user.items() if key != "is_suspended"}}
+
+    def new_comment(self, parent_fullname, body, author=BOT_USERNAME):
+        id36 = self.new_id36()
+        link_id = parent_fullname if parent_fullname.startswith("t3_") else self.comments.get(parent_fullname[3:], {}).get("link_id", parent_fullname)
+        submission = self.submissions.get(link_id[3:], {})
+        comment = {
+            "id": id36, "name": f"t1_{id36}", "body": body, "author": author, "parent_id": parent_fullname, "link_id": link_id,
+            "subreddit": submission.get("subreddit", ""), "created_utc": time.time(), "removed": False, "distinguished": None,
+            "stickied": False, "locked": False, "permalink": f"{submission.get('permalink', '/')}{id36}/", "replies": "",
+        }
+        self.comments[id36] = comment
+        return comment
+
+    # --- Request handling ----------------------------------------------------------------------
+
+    def rate_limit_headers(self, now):
+        window_start = now - self.rate_limit_window
+        while self.request_times and self.request_times[0] < window_start:
+            self.request_times.popleft()
+        used = len(self.request_times)
+        reset = int(self.rate_limit_window - (now - self.request_times[0])) if self.request_times else self.rate_limit_window
+        return used, {
+            "x-ratelimit-remaining": str(max(self.rate_limit_budget - used, 0)),
+            "x-ratelimit-used": str(used),
+            "x-ratelimit-reset": str(max(reset, 0)),
+        }
+
+    async def handle(self, request):
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+
+        now = time.time()
+        path = request.path.strip("/")
+        if path.startswith("_emulator/"):
+            return await self.handle_control(request, path)
+        params = dict(request.query)
+        if request.method == "POST":
+            if request.content_type == "application/json":
+                params.update(await request.json())
+            else:
+                body = await request.text()
+                params.update({key: values[-1] for key, values in parse_qs(body).items()})
+
+        if path == "api/v1/access_token":
+            return web.json_response({"access_token": "emulator-token", "token_type": "bearer", "expires_in": 86400, "scope": "*"})
+
+        used, headers = self.rate_limit_headers(now)
+        if (self.enforce_rate_limit and used >= self.rate_limit_budget) or (self.error_rate and self.random.random() < self.error_rate):
+            return web.json_response({"message": "Too Many Requests", "error": 429}, status=429, headers=headers)
+
+        self.request_times.append(now)
+        self.request_count += 1
+        endpoint = re.sub(r"^r/[^/]+/", "", path)
+        self.requests_by_endpoint[endpoint] = self.requests_by_endpoint.get(endpoint, 0) + 1
+        used, headers = self.rate_limit_headers(now)
+
+        try:
+            status, payload = self.route(request.method, path, params, now)
+        except KeyError:
+            status, payload = 404, {"message": "Not Found", "error": 404}
+
+        if status < 400 and request.method == "POST" and (endpoint in MUTATING_ENDPOINTS or path in MUTATING_ENDPOINTS):
+            self.record_action(endpoint, params, now)
+
+        return web.json_response(payload, status=status, headers=headers)
+
+    async def handle_control(self, request, path):
+        # Out-of-band endpoints for load test drivers; never rate limited or counted
+        if path == "_emulator/flair":
+            body = await request.json()
+            subreddit_names = body.get("subreddits") or [subreddit["name"] for subreddit in self.subreddits.values()]
+            entries = [self.flair_submission(self.random.choice(subreddit_names)) for _ in range(int(body.get("count", 1)))]
+            return web.json_response({"submission_ids": [entry["target_fullname"][3:] for entry in entries]})
+        if path == "_emulator/stats":
+            return web.json_response({
+                "request_count": self.request_count,
+                "requests_by_endpoint": self.requests_by_endpoint,
+                "mutating_calls": len(self.action_log),
+                "flair_events": self.flair_events,
+                "first_action_time": self.first_action_time,
+                "last_action_time": self.last_action_time,
+            })
+        return web.json_response({"message": "Not Found", "error": 404}, status=404)
+
+    def record_action(self, endpoint, params, now):
+        target = params.get("id") or params.get("thing_id") or params.get("link") or params.get("parent") or ""
+        if isinstance(target, list):
+            target = target[0]
+        if not target and "item_ids" in params:
+            target = params["item_ids"][0] if isinstance(params["item_ids"], list) else params["item_ids"]
+        if not target and "json" in params:
+            try:
+                target = json.loads(params["json"]).get("item_id", [""])
+                target = target[0] if isinstance(target, list) else target
+            except (ValueError, AttributeError):
+                target = ""
+        self.action_log.append({"time": now, "endpoint": endpoint, "target": target})
+        if target.startswith("t1_") and target[3:] in self.comments:
+            target = self.comments[target[3:]]["link_id"]
+        if target.startswith("t3_"):
+            self.first_action_time.setdefault(target[3:], now)
+            self.last_action_time[target[3:]] = now
+
+    def route(self, method, path, params, now):
+        match = re.fullmatch(r"r/([^/]+)/(.*)", path)
+        if match:
+            return self.route_subreddit(method, match.group(1), match.group(2), params, now)
+
+        if path == "api/v1/me":
+            return 200, self.user_thing(self.users[BOT_USERNAME.lower()])["data"]
+        if path == "subreddits/mine/moderator":
+            return 200, listing([self.subreddit_thing(subreddit) for subreddit in self.subreddits.values()])
+        if path.startswith("comments/"):
+            submission = self.submissions[path.split("/")[1]]
+            return 200, [listing([self.submission_thing(submission)]), listing([
+                self.comment_thing(comment) for comment in self.comments.values() if comment["link_id"] == submission["name"]
+            ])]
+        if path == "api/info":
+            things = []
+            for fullname in params.get("id", "").split(","):
+                if fullname.startswith("t3_") and fullname[3:] in self.submissions:
+                    things.append(self.submission_thing(self.submissions[fullname[3:]]))
+                elif fullname.startswith("t1_") and fullname[3:] in self.comments:
+                    things.append(self.comment_thing(self.comments[fullname[3:]]))
+            return 200, listing(things)
+        match = re.fullmatch(r"user/([^/]+)/(about|comments|submitted)", path)
+        if match:
+            user = self.users[match.group(1).lower()]
+            if match.group(2) == "about":
+                return 200, self.user_thing(user)
+            if match.group(2) == "comments":
+                return 200, listing([self.comment_thing(comment) for comment in self.comments.values() if comment["author"].lower() == user["name"].lower()])
+            return 200, listing([self.submission_thing(submission) for submission in self.submissions.values() if submission["author"].lower() == user["name"].lower()])
+        if path == "message/unread":
+            return 200, listing([message for message in self.inbox if message["data"].get("new", True)])
+        if path == "api/read_message":
+            for message in self.inbox:
+                if message["data"]["name"] in params.get("id", "").split(","):
+                    message["data"]["new"] = False
+            return 200, {}
+
+        if method == "POST":
+            return self.route_post(path, params, now)
+        return 404, {"message": "Not Found", "error": 404}
+
+    def route_post(self, path, params, now):
+        fullname = params.get("id", "")
+        thing = self.submissions.get(fullname[3:]) if fullname.startswith("t3_") else self.comments.get(fullname[3:])
+        simple_flags = {
+            "api/remove": ("removed", True), "api/approve": ("removed", False), "api/lock": ("locked", True),
+            "api/unlock": ("locked", False), "api/spoiler": ("spoiler", True), "api/unspoiler": ("spoiler", False),
+        }
+        if path in simple_flags:
+            if thing is not None:
+                key, value = simple_flags[path]
+                thing[key] = value
+            return 200, {}
+        if path == "api/comment":
+            if params.get("thing_id", "").startswith("t4_"):
+                original = next(message for message in self.inbox if message["data"]["name"] == params["thing_id"])
+                reply = self.add_inbox_message(BOT_USERNAME, f"re: {original['data']['subject']}", params.get("text", ""))
+                self.inbox.remove(reply)
+                return 200, {"json": {"errors": [], "data": {"things": [reply]}}}
+            comment = self.new_comment(params.get("thing_id", ""), params.get("text", ""))
+            return 200, {"json": {"errors": [], "data": {"things": [self.comment_thing(comment)]}}}
+        if path.startswith("api/distinguish"):
+            if thing is not None:
+                thing["distinguished"] = "moderator"
+                thing["stickied"] = params.get("sticky") in ("true", "True", True)
+            return 200, {"json": {"errors": [], "data": {"things": [self.comment_thing(thing)] if thing else []}}}
+        if path == "api/v1/modactions/removal_link_message":
+            data = json.loads(params.get("json", "{}"))
+            item_id = data.get("item_id", [""])
+            item_id = item_id[0] if isinstance(item_id, list) else item_id
+            if data.get("type") in ("public", "public_as_subreddit"):
+                comment = self.new_comment(item_id, data.get("message", ""), author=f"{self.submissions[item_id[3:]]['subreddit']}-ModTeam")
+                comment["distinguished"] = "moderator"
+                return 200, self.comment_thing(comment)
+            return 200, {}
+        if path == "api/mod/notes":
+            return 200, {"created": {"id": f"ModNote_{self.new_id36()}", "type": "NOTE", "user_note_data": {"note": params.get("note", "")}, "created_at": int(now), "operator": BOT_USERNAME, "subreddit": params.get("subreddit", ""), "user": params.get("user", "")}}
+        # Anything else (compose, removal_reasons, ...) is acknowledged without further modelling
+        return 200, {"json": {"errors": []}}
+
+    def route_subreddit(self, method, subreddit_name, rest, params, now):
+        rest = rest.strip("/")
+
+        if rest == "about/log":
+            return 200, self.mod_log_listing(subreddit_name, params)
+
+        subreddit = self.subreddits[subreddit_name.lower()]
+
+        if rest == "about":
+            return 200, self.subreddit_thing(subreddit)
+        if rest == "about/moderators":
+            return 200, {"kind": "UserList", "data": {"children": [
+                {"name": moderator, "id": f"t2_{self.users[moderator.lower()]['id']}", "mod_permissions": ["all"], "date": now} for moderator in subreddit["moderators"]
+            ]}}
+        if rest == "api/link_flair_v2":
+            return 200, [dict(template, css_class="", text_editable=False, type="text") for template in subreddit["templates"]]
+        if rest == "api/flairlist":
+            name = params.get("name")
+            users = [{"user": user, **flair} for user, flair in subreddit["user_flair"].items() if name is None or user.lower() == name.lower()]
+            return 200, {"users": users or ([{"user": name, "flair_text": None, "flair_css_class": None}] if name else []), "next": None, "prev": None}
+        if rest in ("api/flair", "api/selectflair"):
+            if "link" in params and params["link"][3:] in self.submissions:
+                self.submissions[params["link"][3:]].update(link_flair_text=params.get("text") or None, link_flair_css_class=params.get("css_class") or None)
+            elif "name" in params:
+                subreddit["user_flair"][params["name"]] = {"flair_text": params.get("text"), "flair_css_class": params.get("css_class"), "flair_template_id": params.get("flair_template_id")}
+            return 200, {"json": {"errors": []}}
+        if rest in ("api/friend", "api/unfriend"):
+            target = subreddit["banned"] if params.get("type") == "banned" else subreddit["contributors"]
+            (target.add if rest == "api/friend" else target.discard)(params.get("name"))
+            return 200, {"json": {"errors": []}}
+        if rest == "api/accept_moderator_invite":
+            if BOT_USERNAME not in subreddit["moderators"]:
+                subreddit["moderators"].append(BOT_USERNAME)
+            self.add_mod_log_entry(subreddit["name"], "acceptmoderatorinvite", BOT_USERNAME)
+            return 200, {"json": {"errors": []}}
+        if rest == "api/wiki/edit":
+            page = subreddit["wiki"].get(params["page"])
+            if params.get("previous") and page is not None and page["revisions"][0]["id"] != params["previous"]:
+                # Reddit's edit conflict: the page was revised after the revision the editor started from
+                return 409, {"message": "Conflict", "error": 409, "reason": "EDIT_CONFLICT", "newcontent": page["content"], "newrevision": page["revisions"][0]["id"]}
+            self.set_wiki_page(subreddit["name"], params["page"], params.get("content", ""), author=BOT_USERNAME, reason=params.get("reason"))
+            return 200, {}
+
+        match = re.fullmatch(r"wiki/revisions/(.+)", rest)
+        if match:
+            page = subreddit["wiki"].get(match.group(1))
+            if page is None:
+                return 404, {"reason": "PAGE_NOT_CREATED", "message": "Not Found", "error": 404}
+            return 200, listing([{
+                "id": revision["id"], "page": match.group(1), "reason": revision["reason"], "timestamp": revision["timestamp"],
+                "author": self.user_thing(self.users[revision["author"].lower()]) if revision["author"].lower() in self.users else None,
+                "revision_hidden": False,
+            } for revision in page["revisions"]])
+        match = re.fullmatch(r"wiki/(.+)", rest)
+        if match:
+            page = subreddit["wiki"].get(match.group(1))
+            if page is None:
+                return 404, {"reason": "PAGE_NOT_CREATED", "message": "Not Found", "error": 404}
+            latest = page["revisions"][0]
+            return 200, {"kind": "wikipage", "data": {
+                "content_md": page["content"], "content_html": "", "may_revise": True, "reason": latest["reason"],
+                "revision_date": latest["timestamp"], "revision_id": latest["id"],
+                "revision_by": self.user_thing(self.users[latest["author"].lower()]),
+            }}
+
+        return self.route_post(rest, params, now) if method == "POST" else (404, {"message": "Not Found", "error": 404})
+
+    def mod_log_listing(self, subreddit_name, params):
+        if subreddit_name.lower() == "mod":
+            wanted = None
+        else:
+            wanted = {name.lower() for name in subreddit_name.split("+")}
+        entries = [entry for entry in self.modlog if wanted is None or entry["subreddit"].lower() in wanted]
+
+        before = params.get("before")
+        if before:
+            index = next((position for position, entry in enumerate(entries) if entry["id"] == before), None)
+            if index is not None:
+                entries = entries[index + 1:]
+
+        limit = int(params.get("limit", 100))
+        newest_first = list(reversed(entries[-limit:])) if before else list(reversed(entries))[:limit]
+        return listing([{"kind": "modaction", "data": entry} for entry in newest_first])
+
+    # --- Server --------------------------------------------------------------------------------
+
+    def create_app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/{tail:.*}", self.handle)
+        return app
+
+    async def start(self, host="127.0.0.1", port=8080):
+        self.runner = web.AppRunner(self.create_app(), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    def praw_settings(self, host="127.0.0.1"):
+        # Keyword arguments that point asyncpraw at this emulator (the same keys work in a praw.ini section)
+        url = f"http://{host}:{self.port}"
+        return {
+            "client_id": "emulator", "client_secret": "emulator", "refresh_token": "emulator",
+            "user_agent": "FlairHelper2 emulator", "oauth_url": url, "reddit_url": url, "short_url": url,
+            "check_for_updates": False,
+        }
+
+
+async def run_emulator(args):
+    emulator = RedditEmulator(latency=args.latency, jitter=args.jitter, rate_limit_budget=args.budget, rate_limit_window=args.window,
+                              enforce_rate_limit=not args.no_rate_limit, error_rate=args.error_rate, seed=args.seed)
+    emulator.populate(args.subreddits, args.templates, usernote_users=args.usernote_users, usernotes=not args.no_usernotes, nuke=args.nuke)
+    port = await emulator.start(args.host, args.port)
+    print(f"Reddit emulator listening on http://{args.host}:{port} with {args.subreddits} subreddits")
+
+    if args.rate:
+        asyncio.create_task(emulator.generate_traffic(args.rate))
+        print(f"Generating {args.rate} editflair events per second")
+
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(f"{emulator.request_count} requests served, {len(emulator.action_log)} mutating calls, {len(emulator.modlog)} mod log entries")
+    finally:
+        await emulator.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Reddit API stand-in for Flair Helper 2")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--subreddits', type=int, default=10, help="Number of synthetic moderated subreddits")
+    parser.add_argument('--templates', type=int, default=5, help="Flair templates (and config entries) per subreddit")
+    parser.add_argument('--usernote-users', type=int, default=0, help="Users to pre-populate in each subreddit's usernotes page")
+    parser.add_argument('--no-usernotes', action='store_true', help="Generate configs without usernote actions")
+    parser.add_argument('--nuke', action='store_true', help="Generate configs with the nuke action enabled")
+    parser.add_argument('--rate', type=float, default=0, help="Synthetic editflair events per second (0 disables)")
+    parser.add_argument('--latency', type=float, default=0.0, help="Base response latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Extra random latency in seconds")
+    parser.add_argument('--budget', type=int, default=600, help="Requests allowed per rate limit window")
+    parser.add_argument('--window', type=int, default=600, help="Rate limit window in seconds")
+    parser.add_argument('--no-rate-limit', action='store_true', help="Report rate limit headers but never answer 429")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with a 429")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run_emulator(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
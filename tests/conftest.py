@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+# The bot is a set of top-level modules rather than a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # The bot keeps its SQLite files in the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,55 @@
+import sqlite3
+
+import pytest
+
+import flair_helper2_async as fh
+
+
+FIRST, SECOND = object(), object()  # Stand in for each account's asyncpraw.Reddit; only their identity is used
+
+
+@pytest.fixture
+def two_accounts(monkeypatch):
+    monkeypatch.setattr(fh, 'shard_id', None)
+    monkeypatch.setattr(fh, 'reddit_clients', {'fh2_login': FIRST, 'fh2_login_2': SECOND})
+    monkeypatch.setattr(fh, 'subreddit_accounts', {'pics': 'fh2_login', 'videos': 'fh2_login_2'})
+
+
+def test_subreddits_are_routed_to_their_account(two_accounts):
+    assert fh.get_reddit_for_subreddit('Pics') is FIRST
+    assert fh.get_reddit_for_subreddit('videos') is SECOND
+    assert fh.get_reddit_for_subreddit('unknown', default=FIRST) is FIRST
+    assert fh.get_account_for_reddit(SECOND) == 'fh2_login_2'
+
+
+def test_only_the_owning_account_handles_a_subreddit(two_accounts):
+    assert fh.is_subreddit_owned_by('pics', FIRST)
+    assert not fh.is_subreddit_owned_by('pics', SECOND)
+    assert fh.is_subreddit_owned_by('unassigned', SECOND)  # Not mapped yet, so whichever account sees it handles it
+
+
+def test_invite_keeps_the_first_account_that_moderates_a_subreddit(two_accounts, workdir):
+    fh.create_configs_database()
+    fh.register_subreddit_account('Pics', SECOND)
+    fh.register_subreddit_account('NewSub', SECOND)
+    assert fh.subreddit_accounts['pics'] == 'fh2_login'
+    assert fh.subreddit_accounts['newsub'] == 'fh2_login_2'
+
+
+def test_account_task_names_keep_the_single_account_name(monkeypatch):
+    monkeypatch.setattr(fh, 'reddit_clients', {'fh2_login': FIRST})
+    assert fh.get_account_task_name('Reddit - Monitor Mod Log', 'fh2_login') == 'Reddit - Monitor Mod Log'
+    monkeypatch.setattr(fh, 'reddit_clients', {'fh2_login': FIRST, 'fh2_login_2': SECOND})
+    assert fh.get_account_task_name('Reddit - Monitor Mod Log', 'fh2_login_2') == 'Reddit - Monitor Mod Log (fh2_login_2)'
+
+
+def test_actions_database_gains_the_subreddit_column(workdir):
+    conn = sqlite3.connect(fh.actions_db_filename)
+    conn.execute("CREATE TABLE actions (submission_id TEXT, action TEXT, completed INTEGER, mod_name TEXT, flair_guid TEXT)")
+    conn.execute("INSERT INTO actions VALUES ('old1', 'remove', 0, 'somemod', 'guid')")
+    conn.commit()
+    conn.close()
+
+    fh.create_actions_database()
+    fh.insert_actions_to_database('new1', ['lock'], 'somemod', 'guid', 'pics')
+    assert sorted(row[:3] for row in fh.get_pending_submission_ids_from_database()) == [('new1', 'somemod', 'pics'), ('old1', 'somemod', None)]
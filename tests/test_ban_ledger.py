@@ -0,0 +1,91 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import flair_helper2_async as fh
+from flair_helper2_offload import compress_notes
+
+
+def ban_note(duration, timestamp):
+    return {'n': f'[FH] FH-Ban-{duration}', 't': timestamp, 'm': 0, 'l': 'l,abc123', 'w': 0}
+
+
+class FakeSubreddit:
+    # Just the usernotes wiki page, counting how often it is read
+    def __init__(self, notes):
+        self.display_name = 'Pics'
+        self.reads = 0
+        self.failing_reads = 0
+        self.set_notes(notes)
+        self.wiki = SimpleNamespace(get_page=self.get_page)
+
+    def set_notes(self, notes):
+        self.content_md = json.dumps({'ver': 6, 'constants': {'users': [], 'warnings': []}, 'blob': compress_notes(notes)})
+
+    async def get_page(self, name):
+        assert name == 'usernotes'
+        self.reads += 1
+        if self.failing_reads:
+            self.failing_reads -= 1
+            raise RuntimeError('Reddit is down')
+        return SimpleNamespace(content_md=self.content_md)
+
+
+@pytest.fixture
+def ledger(workdir, monkeypatch):
+    monkeypatch.setattr(fh, 'ban_ledger_enabled', True)
+    monkeypatch.setattr(fh, 'ban_ledger_seed_locks', fh.defaultdict(asyncio.Lock))
+    errors = []
+
+    async def error_handler(error_message, notify_discord=False):
+        errors.append(error_message)
+
+    monkeypatch.setattr(fh, 'error_handler', error_handler)
+    fh.create_actions_database()
+    return errors
+
+
+def previous_bans(subreddit, username='SomeUser'):
+    return asyncio.run(fh.get_previous_ban_values(subreddit, username))
+
+
+def test_the_ledger_is_seeded_once_from_usernotes(ledger):
+    subreddit = FakeSubreddit({'SomeUser': {'ns': [ban_note(3, 100), ban_note(7, 200)]}})
+    assert previous_bans(subreddit) == ['3', '7']
+    fh.record_ledger_ban('Pics', 'SomeUser', '30', '/r/pics/comments/def456/')
+    assert previous_bans(subreddit) == ['3', '7', '30']
+    assert previous_bans(subreddit, 'someone_else') == []
+    assert subreddit.reads == 1
+
+
+def test_history_summaries_are_seeded(ledger):
+    summary = dict(ban_note(3, 100), n=fh.USERNOTE_BAN_HISTORY_PREFIX + '3x2,7')
+    assert previous_bans(FakeSubreddit({'SomeUser': {'ns': [summary, ban_note(30, 300)]}})) == ['3', '3', '7', '30']
+
+
+def test_re_enabling_the_ledger_seeds_it_again(ledger, monkeypatch):
+    subreddit = FakeSubreddit({'SomeUser': {'ns': [ban_note(3, 100)]}})
+    assert previous_bans(subreddit) == ['3']
+    assert not fh.sync_ban_ledger_state()
+
+    # A restart with the ledger off: the next ban only reaches usernotes
+    monkeypatch.setattr(fh, 'ban_ledger_enabled', False)
+    assert not fh.sync_ban_ledger_state()
+    subreddit.set_notes({'SomeUser': {'ns': [ban_note(3, 100), ban_note(7, 200)]}})
+    assert previous_bans(subreddit) == ['3', '7']
+
+    # Turned back on, the subreddit is seeded again instead of trusting its stale seed, without duplicating earlier rows
+    monkeypatch.setattr(fh, 'ban_ledger_enabled', True)
+    assert fh.sync_ban_ledger_state()
+    assert not fh.sync_ban_ledger_state()
+    assert previous_bans(subreddit) == ['3', '7']
+
+
+def test_a_failed_seed_falls_back_to_usernotes(ledger):
+    subreddit = FakeSubreddit({'SomeUser': {'ns': [ban_note(3, 100)]}})
+    subreddit.failing_reads = 1
+    assert previous_bans(subreddit) == ['3']
+    assert ledger == ['Error seeding the ban ledger for r/Pics: Reddit is down']
+    assert not fh.is_ban_ledger_seeded('Pics')
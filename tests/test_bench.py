@@ -0,0 +1,23 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench'))
+
+import run_bench
+
+
+def test_compare_reports_the_change_per_scenario(tmp_path, capsys):
+    baseline = tmp_path / 'baseline.json'
+    baseline.write_text(json.dumps({'scenarios': [{'scenario': 'burst_100', 'events_per_second': 50.0, 'latency_p50': 0.0}]}))
+    run_bench.compare_results({'scenarios': [{'scenario': 'burst_100', 'events_per_second': 75.0, 'latency_p50': 1.0},
+                                             {'scenario': 'trickle_10', 'events_per_second': 2.0}]}, str(baseline))
+    report = capsys.readouterr().err.splitlines()
+    assert len(report) == 1  # A zero baseline and scenarios missing from the baseline are skipped
+    assert report[0].startswith('burst_100') and 'events_per_second' in report[0] and report[0].endswith('(+50.0%)')
+
+
+def test_every_scenario_has_a_traffic_shape():
+    for scenario in run_bench.SCENARIOS.values():
+        assert scenario['traffic'] in ('trickle', 'burst')
+        assert scenario['traffic'] == 'burst' or scenario['rate'] > 0
@@ -0,0 +1,80 @@
+import asyncio
+import gzip
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+import flair_helper2_async as fh
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench'))
+
+import replay_capture
+
+
+@pytest.fixture
+def capture(workdir, monkeypatch):
+    monkeypatch.setattr(fh, 'capture_file', None)
+    monkeypatch.setattr(fh, 'mod_log_capture_filename', None)
+    monkeypatch.setattr(fh, 'clock', lambda: 1000.0)
+    fh.create_configs_database()
+    asyncio.run(fh.cache_config('pics', [{'GeneralConfiguration': {}}, {'templateId': 'abc', 'remove': True}]))
+    fh.start_capture(str(workdir / 'capture.ndjson.gz'))
+    yield workdir / 'capture.ndjson.gz'
+    fh.close_capture()
+
+
+def test_capture_starts_with_a_header_and_the_cached_configs(capture):
+    entry = SimpleNamespace(id='ModAction_1', action='editflair', mod='somemod', subreddit='pics', _reddit=object())
+    fh.write_capture_record('modlog', entry=fh.mod_log_entry_to_dict(entry))
+    fh.close_capture()
+
+    records = list(fh.read_capture(str(capture)))
+    assert [record['type'] for record in records] == ['header', 'config', 'modlog']
+    assert records[0]['version'] == fh.capture_format_version
+    assert records[1]['subreddit'] == 'pics' and records[1]['config'][1]['templateId'] == 'abc'
+    assert records[2]['entry'] == {'id': 'ModAction_1', 'action': 'editflair', 'mod': 'somemod', 'subreddit': 'pics'}
+    assert all(record['t'] == 1000.0 for record in records)
+
+
+def test_a_capture_cut_off_mid_write_is_read_up_to_the_last_whole_record(capture):
+    fh.close_capture()
+    data = gzip.decompress(capture.read_bytes()) + b'{"type": "modlog", "t": 1'
+    capture.write_bytes(gzip.compress(data)[:-6])
+    assert [record['type'] for record in fh.read_capture(str(capture))] == ['header', 'config']
+
+
+def test_action_plans_compare_mutating_calls_per_submission():
+    def response(method, path, submission_id, **data):
+        return {'type': 'response', 'method': method, 'path': path, 'params': {}, 'data': data, 'submission_id': submission_id}
+
+    recorded = replay_capture.action_plans([
+        response('GET', '/comments/abc', 'abc'),
+        response('POST', '/api/remove/', 'abc', id='t3_abc', spam='False', reason='free text'),
+        response('POST', '/api/lock', 'abc', id='t3_abc'),
+        response('POST', '/api/lock', 'def', id='t3_def'),
+        response('POST', '/api/lock', None, id='t3_ghi'),
+    ])
+    assert recorded == {'abc': ['POST /api/lock id=t3_abc', 'POST /api/remove id=t3_abc spam=False'], 'def': ['POST /api/lock id=t3_def']}
+
+    replayed = {'abc': recorded['abc'], 'xyz': ['POST /api/lock id=t3_xyz']}
+    assert replay_capture.compare_plans(recorded, replayed) == {
+        'matching': 1, 'different': [], 'missing_in_replay': ['def'], 'extra_in_replay': ['xyz'],
+    }
+
+
+def test_replay_server_answers_repeats_with_the_last_captured_response():
+    server = replay_capture.ReplayServer([
+        {'type': 'response', 'method': 'GET', 'path': '/r/pics/about/log/', 'params': {'limit': 100}, 'status': 200, 'body': 'first'},
+        {'type': 'response', 'method': 'GET', 'path': '/r/pics/about/log', 'params': {'limit': '100'}, 'status': 200, 'body': 'second'},
+    ])
+    queue = server.responses[server.key('get', '/r/pics/about/log', {'limit': '100'})]
+    assert list(queue) == [(200, 'first'), (200, 'second')]
+
+
+def test_virtual_clock_at_max_speed_jumps_to_each_entry():
+    clock = replay_capture.VirtualClock(100.0, None)
+    asyncio.run(clock.wait_until(150.0))
+    asyncio.run(clock.wait_until(120.0))  # Never goes backwards
+    assert clock() == 150.0
@@ -0,0 +1,103 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import flair_helper2_async as fh
+from flair_helper2_async import get_config_extends, merge_base_config
+
+
+def base_config():
+    return [
+        {'GeneralConfiguration': {'header': 'Base header', 'footer': 'Base footer', 'usernote_type_name': 'flair_helper_note'}},
+        {'templateId': 't1', 'approve': True, 'remove': False, 'ban': {'enabled': True, 'duration': 3, 'message': 'Base message'}},
+        {'templateId': 't2', 'approve': False, 'remove': True, 'comment': {'enabled': True, 'body': 'Base comment'}},
+    ]
+
+
+def test_general_configuration_overrides():
+    config = [{'GeneralConfiguration': {'extends': 'r/Templates', 'header': 'Own header'}}]
+    merged = merge_base_config(base_config(), config)
+    assert merged[0]['GeneralConfiguration'] == {'header': 'Own header', 'footer': 'Base footer', 'usernote_type_name': 'flair_helper_note'}
+
+
+def test_partial_flair_override():
+    config = [{'GeneralConfiguration': {'extends': 'r/Templates'}},
+              {'templateId': 't1', 'remove': True, 'ban': {'duration': 7}}]
+    merged = merge_base_config(base_config(), config)
+    assert merged[1] == {'templateId': 't1', 'approve': True, 'remove': True,
+                         'ban': {'enabled': True, 'duration': 7, 'message': 'Base message'}}
+    assert merged[2] == base_config()[2]  # Untouched entries are inherited as they are
+
+
+def test_new_flair_entries_are_added():
+    new_flair = {'templateId': 't3', 'lock': True}
+    merged = merge_base_config(base_config(), [{'GeneralConfiguration': {}}, new_flair])
+    assert [flair['templateId'] for flair in merged[1:]] == ['t1', 't2', 't3']
+    assert merged[3] == new_flair
+
+
+def test_base_is_not_modified():
+    base = base_config()
+    merge_base_config(base, [{'GeneralConfiguration': {'header': 'Own'}}, {'templateId': 't1', 'ban': {'duration': 30}}])
+    assert base == base_config()
+
+
+@pytest.mark.parametrize('config, extends', [
+    ([{'GeneralConfiguration': {'extends': ' r/Templates '}}], 'r/Templates'),
+    ([{'GeneralConfiguration': {'header': 'No base'}}], None),
+    ([{'GeneralConfiguration': {'extends': ['r/Templates']}}], None),
+    ([{'GeneralConfiguration': None}], None),
+    ([{'templateId': 't1'}], None),
+    (['not a mapping'], None),
+    ([], None),
+    ({'GeneralConfiguration': {'extends': 'r/Templates'}}, None),
+])
+def test_extends_is_only_read_from_a_general_configuration_mapping(config, extends):
+    assert get_config_extends(config) == extends
+
+
+def test_a_base_without_general_configuration_is_reported(monkeypatch):
+    errors = []
+
+    async def error_handler(error_message, notify_discord=False):
+        errors.append(error_message)
+
+    async def get_subreddit(reddit, subreddit_name):
+        async def get_page(page):
+            return SimpleNamespace(content_md='[{"templateId": "t1"}]')
+        return SimpleNamespace(wiki=SimpleNamespace(get_page=get_page))
+
+    monkeypatch.setattr(fh, 'base_configs', {})
+    monkeypatch.setattr(fh, 'error_handler', error_handler)
+    monkeypatch.setattr(fh, 'get_subreddit', get_subreddit)
+    assert asyncio.run(fh.load_base_config(None, SimpleNamespace(display_name='pics'), 'r/Templates')) is None
+    assert 'has no GeneralConfiguration' in errors[0]
+    assert not fh.base_configs
+
+
+def test_a_base_revision_reaches_dependants_in_other_shards(workdir, monkeypatch):
+    monkeypatch.setattr(fh, 'shard_count', 2)
+    monkeypatch.setattr(fh, 'shard_map', {'templates': 0, 'pics': 1})
+    monkeypatch.setattr(fh, 'reddit_clients', {'fh2_login': object()})
+    monkeypatch.setattr(fh, 'account_usernames', {'fh2_login': 'FlairHelperBot'})
+    monkeypatch.setattr(fh, 'base_configs', {'r/templates/wiki/flair_helper': {}})
+    requested = []
+    monkeypatch.setattr(fh, 'request_config_reload', lambda reddit, bot_username, subreddit_name, reason='wikirevise': requested.append(subreddit_name))
+    fh.create_shards_database()
+
+    # Shard 0 streams r/Templates and sees the revision; it has no dependants of its own
+    monkeypatch.setattr(fh, 'shard_id', 0)
+    monkeypatch.setattr(fh, 'configs_db_filename', 'configs_shard0.db')
+    fh.create_configs_database()
+    fh.reload_configs_extending(None, 'FlairHelperBot', SimpleNamespace(subreddit='Templates', details='Page flair_helper edited'))
+    assert not requested
+
+    # Shard 1 keeps the config of r/pics, which extends it
+    monkeypatch.setattr(fh, 'shard_id', 1)
+    monkeypatch.setattr(fh, 'configs_db_filename', 'configs_shard1.db')
+    fh.create_configs_database()
+    asyncio.run(fh.cache_config('pics', [{'GeneralConfiguration': {}}], base='r/templates/wiki/flair_helper'))
+    asyncio.run(fh.process_shard_events(0))
+    assert requested == ['pics']
+    assert not fh.base_configs
@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+import pytest
+
+import flair_helper2_async as fh
+
+
+@pytest.fixture
+def reloads(monkeypatch):
+    monkeypatch.setattr(fh, 'pending_config_reloads', {})
+    monkeypatch.setattr(fh, 'config_reloader_task', None)
+    monkeypatch.setattr(fh, 'config_reload_debounce_seconds', 0.05)
+    monkeypatch.setattr(fh, 'config_reload_max_delay', 0.2)
+    fetched = []
+
+    async def fetch_and_cache_configs(reddit, bot_username, max_retries=3, retry_delay=5, single_sub=None):
+        fetched.append((single_sub, time.monotonic()))
+
+    monkeypatch.setattr(fh, 'fetch_and_cache_configs', fetch_and_cache_configs)
+    return fetched
+
+
+async def revise(subreddit_name, times, interval):
+    for _ in range(times):
+        fh.request_config_reload(None, 'FlairHelperBot', subreddit_name)
+        await asyncio.sleep(interval)
+    await fh.config_reloader_task
+
+
+def test_a_burst_of_revisions_is_fetched_once(reloads):
+    asyncio.run(revise('Pics', 4, 0.01))
+    assert [name for name, _ in reloads] == ['Pics']
+    assert not fh.pending_config_reloads
+
+
+def test_subreddits_are_debounced_separately(reloads):
+    async def run():
+        fh.request_config_reload(None, 'FlairHelperBot', 'Pics')
+        fh.request_config_reload(None, 'FlairHelperBot', 'videos')
+        fh.request_config_reload(None, 'FlairHelperBot', 'pics')
+        await fh.config_reloader_task
+
+    asyncio.run(run())
+    assert sorted(name for name, _ in reloads) == ['Pics', 'videos']
+
+
+def test_continuous_revisions_reload_by_the_max_delay(reloads):
+    started = time.monotonic()
+    # Revisions every 30ms never leave the page quiet for 50ms, so only config_reload_max_delay lets a reload through
+    asyncio.run(revise('Pics', 20, 0.03))
+    assert len(reloads) >= 2
+    assert reloads[0][1] - started < fh.config_reload_max_delay + 0.15
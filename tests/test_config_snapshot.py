@@ -0,0 +1,61 @@
+import asyncio
+import pickle
+
+import pytest
+
+import flair_helper2_async as fh
+from reddit_emulator import make_flair_helper_config
+
+
+@pytest.fixture
+def snapshot(workdir, monkeypatch):
+    monkeypatch.setattr(fh, 'compiled_configs', {})
+    monkeypatch.setattr(fh, 'compiled_config_snapshot_dirty', False)
+    fh.create_configs_database()
+    return workdir / fh.get_compiled_config_snapshot_filename()
+
+
+def test_snapshot_round_trip_rebuilds_the_compiled_configs(snapshot):
+    pics, videos = make_flair_helper_config('pics', ['a', 'b']), make_flair_helper_config('videos', ['c'])
+    asyncio.run(fh.cache_config('pics', pics))
+    asyncio.run(fh.cache_config('videos', videos))
+    fh.get_cached_config('pics')  # One compiled in memory, the other only in config_store
+    assert fh.compiled_config_snapshot_dirty
+    asyncio.run(fh.save_compiled_config_snapshot())
+    assert not fh.compiled_config_snapshot_dirty
+
+    fh.compiled_configs.clear()
+    assert fh.load_compiled_config_snapshot() == 2
+    compiled = fh.compiled_configs[fh.get_config_hash(videos)]
+    assert isinstance(compiled, fh.CompiledConfig) and compiled == videos
+    assert fh.find_flair_details(compiled, 'c') == videos[1]
+    assert fh.get_cached_config('pics') == pics
+
+
+def test_the_snapshot_pickles_plain_lists(snapshot):
+    asyncio.run(fh.cache_config('pics', make_flair_helper_config('pics', ['a'])))
+    fh.get_cached_config('pics')
+    asyncio.run(fh.save_compiled_config_snapshot())
+    with open(snapshot, 'rb') as f:
+        pickle.load(f)
+        configs = pickle.load(f)
+    assert all(type(config) is list for config in configs.values())
+
+
+def test_a_stale_snapshot_is_ignored(snapshot):
+    asyncio.run(fh.cache_config('pics', make_flair_helper_config('pics', ['a'])))
+    with open(snapshot, 'wb') as f:
+        pickle.dump({'version': fh.COMPILED_CONFIG_SNAPSHOT_VERSION - 1}, f)
+        pickle.dump({}, f)
+    assert fh.load_compiled_config_snapshot() == 0
+    assert not fh.compiled_configs
+
+
+def test_configs_replaced_since_the_snapshot_are_dropped(snapshot):
+    old_config, new_config = make_flair_helper_config('pics', ['a']), make_flair_helper_config('pics', ['b'])
+    asyncio.run(fh.cache_config('pics', old_config))
+    asyncio.run(fh.save_compiled_config_snapshot())
+    asyncio.run(fh.cache_config('pics', new_config))
+    fh.compiled_configs.clear()
+    assert fh.load_compiled_config_snapshot() == 0
+    assert fh.get_cached_config('pics') == new_config
@@ -0,0 +1,86 @@
+import asyncio
+import json
+import sqlite3
+
+import asyncpraw
+import pytest
+
+import flair_helper2_async as fh
+from reddit_emulator import BOT_USERNAME, RedditEmulator, make_flair_helper_config
+
+
+@pytest.fixture
+def store(workdir, monkeypatch):
+    monkeypatch.setattr(fh, 'compiled_configs', {})
+    fh.create_configs_database()
+
+
+def stored_hashes():
+    conn = sqlite3.connect(fh.configs_db_filename)
+    hashes = {row[0] for row in conn.execute("SELECT config_hash FROM config_store")}
+    conn.close()
+    return hashes
+
+
+def test_identical_configs_share_one_blob_and_one_compiled_object(store):
+    config = make_flair_helper_config('pics', ['a', 'b'])
+    for name in ['pics', 'videos']:
+        asyncio.run(fh.cache_config(name, config))
+    assert stored_hashes() == {fh.get_config_hash(config)}
+    assert fh.get_cached_config('pics') is fh.get_cached_config('videos')
+    assert fh.get_cached_config('pics') == config
+
+
+def test_replacing_a_config_prunes_the_unreferenced_blob(store):
+    old_config = make_flair_helper_config('pics', ['a'])
+    new_config = make_flair_helper_config('pics', ['b'])
+    asyncio.run(fh.cache_config('pics', old_config))
+    fh.get_cached_config('pics')
+    asyncio.run(fh.cache_config('pics', new_config))
+    assert stored_hashes() == {fh.get_config_hash(new_config)}
+    assert set(fh.compiled_configs) <= {fh.get_config_hash(new_config)}
+
+
+def test_old_databases_are_migrated_to_the_store(workdir, monkeypatch):
+    monkeypatch.setattr(fh, 'compiled_configs', {})
+    config = make_flair_helper_config('pics', ['a'])
+    conn = sqlite3.connect(fh.configs_db_filename)
+    conn.execute("CREATE TABLE configs (subreddit TEXT PRIMARY KEY, config TEXT)")
+    conn.execute("INSERT INTO configs VALUES (?, ?), (?, ?)", ('pics', json.dumps(config), 'broken', '{not json'))
+    conn.commit()
+    conn.close()
+
+    fh.create_configs_database()
+    assert fh.get_cached_config('pics') == config
+    assert fh.get_cached_config('broken') is None
+    assert fh.get_cached_source_hash('pics') is None  # Parsed again on the next sweep
+
+
+def test_the_template_index_matches_the_linear_lookup(store):
+    config = make_flair_helper_config('pics', ['a', 'b', 'c'])
+    asyncio.run(fh.cache_config('pics', config))
+    compiled = fh.get_cached_config('pics')
+    for template_id in ['a', 'b', 'c', 'missing']:
+        assert fh.find_flair_details(compiled, template_id) == fh.find_flair_details(list(config), template_id)
+
+
+def test_an_unchanged_page_is_not_parsed_again(store):
+    emulator = RedditEmulator(seed=1, rate_limit_window=1)
+    emulator.add_subreddit('pics', make_flair_helper_config('pics', ['tmpl']), templates=['tmpl'])
+    source_hit = fh.metric_key('flair_helper_cache_requests_total', {'cache': 'config_source', 'result': 'hit'})
+    hits_before = fh.metrics_counters[source_hit]
+
+    async def run():
+        await emulator.start(port=0)
+        reddit = asyncpraw.Reddit(**emulator.praw_settings())
+        try:
+            subreddit = await reddit.subreddit('pics')
+            for _ in range(2):
+                await fh.process_subreddit_config(reddit, subreddit, BOT_USERNAME, 1, 0, 0, 0, force=True)
+        finally:
+            await reddit.close()
+            await emulator.stop()
+
+    asyncio.run(run())
+    assert fh.metrics_counters[source_hit] - hits_before == 1
+    assert fh.get_cached_source_hash('pics') == fh.get_source_hash(emulator.subreddits['pics']['wiki']['flair_helper']['content'].strip())
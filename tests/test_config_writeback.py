@@ -0,0 +1,60 @@
+import asyncio
+from types import SimpleNamespace
+
+import asyncpraw
+import pytest
+
+import flair_helper2_async as fh
+from reddit_emulator import BOT_USERNAME, RedditEmulator, make_flair_helper_config
+
+
+def load_config(emulator):
+    async def run():
+        fh.create_configs_database()
+        await emulator.start(port=0)
+        reddit = asyncpraw.Reddit(**emulator.praw_settings())
+        try:
+            subreddit = await reddit.subreddit('pics')
+            await fh.process_subreddit_config(reddit, subreddit, BOT_USERNAME, 1, 0, 0, 0, force=True)
+        finally:
+            await reddit.close()
+            await emulator.stop()
+
+    asyncio.run(run())
+    return emulator.subreddits['pics']['wiki']['flair_helper']['revisions']
+
+
+def test_a_valid_page_is_not_written_back(workdir):
+    emulator = RedditEmulator(seed=1, rate_limit_window=1)
+    emulator.add_subreddit('pics', make_flair_helper_config('pics', ['tmpl']), templates=['tmpl'])
+    assert len(load_config(emulator)) == 1
+    assert fh.get_cached_config('pics') is not None
+
+
+def test_a_corrected_page_is_written_back_with_the_write_back_reason(workdir):
+    config = make_flair_helper_config('pics', ['tmpl'])
+    config[1]['notes'] = 'first line\\nsecond line'  # An escaped newline, which correct_config turns into a real one
+    emulator = RedditEmulator(seed=1, rate_limit_window=1)
+    emulator.add_subreddit('pics', config, templates=['tmpl'])
+    revisions = load_config(emulator)
+    assert len(revisions) == 2
+    assert (revisions[0]['author'], revisions[0]['reason']) == (BOT_USERNAME, fh.CONFIG_WRITE_BACK_REASON)
+    assert fh.get_cached_config('pics')[1]['notes'] == 'first line\nsecond line'
+
+
+def wikirevise(mod, description):
+    return SimpleNamespace(id='x', action='wikirevise', subreddit='pics', mod=mod, details='Page flair_helper edited', description=description,
+                           target_fullname=None, target_author=None, created_utc=1.0)
+
+
+@pytest.mark.parametrize('mod, description, reloaded', [
+    (BOT_USERNAME, fh.CONFIG_WRITE_BACK_REASON, False),
+    ('ExampleMod', fh.CONFIG_WRITE_BACK_REASON, True),  # Only the bot's own write-back is skipped
+    (BOT_USERNAME, 'some other edit', True),
+])
+def test_only_the_bots_write_back_skips_the_reload(workdir, monkeypatch, mod, description, reloaded):
+    fh.create_configs_database()
+    requested = []
+    monkeypatch.setattr(fh, 'request_config_reload', lambda reddit, bot_username, subreddit_name, reason='wikirevise': requested.append(subreddit_name))
+    asyncio.run(fh.handle_mod_log_entry(None, BOT_USERNAME, wikirevise(mod, description)))
+    assert requested == (['pics'] if reloaded else [])
@@ -0,0 +1,55 @@
+import asyncio
+import json
+import logging
+
+import pytest
+
+import flair_helper2_async as fh
+
+
+@pytest.fixture
+def dry_run(workdir, monkeypatch):
+    for name in ('dry_run', 'configs_db_filename', 'actions_db_filename', 'shards_db_filename'):
+        monkeypatch.setattr(fh, name, getattr(fh, name))
+    monkeypatch.setattr(fh, 'dry_run_filename', str(workdir / 'dry_run.ndjson'))
+    monkeypatch.setattr(fh, 'dry_run_logger', logging.getLogger('dry_run_under_test'))
+    fh.dry_run_logger.propagate = False
+    fh.enable_dry_run()
+    yield workdir / 'dry_run.ndjson'
+    for handler in fh.dry_run_logger.handlers[:]:
+        handler.close()
+        fh.dry_run_logger.removeHandler(handler)
+
+
+def test_dry_run_uses_its_own_databases(dry_run):
+    assert fh.dry_run
+    assert fh.configs_db_filename == 'flair_helper_configs_dryrun.db'
+    assert fh.actions_db_filename == 'flair_helper_actions_dryrun.db'
+    assert fh.shards_db_filename == 'flair_helper_shards_dryrun.db'
+
+
+def test_writes_are_recorded_instead_of_sent(dry_run):
+    sent = []
+
+    async def remove(**kwargs):
+        sent.append(kwargs)
+
+    async def process():
+        fh.start_trace('abc123', 'pics', 'somemod')
+        return await fh.reddit_write('remove', 'api/remove', 't3_abc123', remove, spam=False, reason='x' * 600, api_calls=2)
+
+    assert asyncio.run(process()) is None
+    assert sent == []
+    record = json.loads(dry_run.read_text())
+    assert (record['submission_id'], record['subreddit'], record['action'], record['endpoint'], record['target']) == ('abc123', 'pics', 'remove', 'api/remove', 't3_abc123')
+    assert record['api_calls'] == 2
+    assert record['kwargs'] == {'spam': False, 'reason': '<600 characters>'}
+
+
+def test_writes_are_sent_outside_dry_run(workdir, monkeypatch):
+    monkeypatch.setattr(fh, 'dry_run', False)
+
+    async def lock(*args):
+        return ('locked',) + args
+
+    assert asyncio.run(fh.reddit_write('lock', 'api/lock', 't3_abc123', lock, 'now')) == ('locked', 'now')
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import yaml
+
+import flair_helper2_async as fh
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench'))
+
+import micro_bench
+
+
+def test_placeholders_are_replaced_in_double_braces():
+    text = "Hi {{author}}, your post in {{subreddit}} was removed. {{author}} {{missing}} {author}"
+    assert fh.replace_placeholders(text, {'author': 'someone', 'subreddit': 'pics', 'score': 3}) == \
+        "Hi someone, your post in pics was removed. someone {{missing}} {author}"
+    assert fh.replace_placeholders("Score: {{score}}", {'score': 3}) == "Score: 3"
+
+
+def test_find_flair_details_skips_the_general_configuration():
+    config = [{'GeneralConfiguration': {'templateId': 'abc'}}, {'templateId': 'abc', 'remove': True}, {'templateId': 'def'}]
+    assert fh.find_flair_details(config, 'abc') == {'templateId': 'abc', 'remove': True}
+    assert fh.find_flair_details(config, 'missing') is None
+
+
+def test_next_ban_duration_escalates_past_the_highest_previous_ban():
+    durations = fh.parse_ban_duration_list("3,7,30,x")
+    assert durations == [3, 7, 30, 0]
+    assert fh.select_next_ban_duration([], [3, 7, 30]) == 3
+    assert fh.select_next_ban_duration(['3'], [3, 7, 30]) == 7
+    assert fh.select_next_ban_duration(['7', '3'], [3, 7, 30]) == 30
+    assert fh.select_next_ban_duration(['30'], [3, 7, 30]) == 30  # Stays at the longest
+    assert fh.select_next_ban_duration(['3', 'permanent'], [3, 7, 30]) == 0  # 0 is a permanent ban
+
+
+def test_generated_benchmark_config_converts_to_the_json_layout(capsys):
+    yaml_text, flair_ids = micro_bench.make_yaml_config(20)
+    config = fh.convert_yaml_to_json(yaml.safe_load(yaml_text))
+    assert 'GeneralConfiguration' in config[0]
+    assert sorted(flair['templateId'] for flair in config[1:]) == sorted(flair_ids)
+    assert fh.find_flair_details(config, flair_ids[1])['remove']
@@ -0,0 +1,63 @@
+import asyncio
+import re
+from collections import defaultdict
+
+import pytest
+
+import flair_helper2_async as fh
+
+
+@pytest.fixture(autouse=True)
+def empty_metrics(monkeypatch):
+    monkeypatch.setattr(fh, 'metrics_counters', defaultdict(float))
+    monkeypatch.setattr(fh, 'metrics_gauges', {})
+    monkeypatch.setattr(fh, 'metrics_histograms', {})
+
+
+def test_counters_are_keyed_by_sorted_labels():
+    fh.increment_metric('flair_helper_actions_total', action='lock', result='success')
+    fh.increment_metric('flair_helper_actions_total', result='success', action='lock')
+    assert fh.metrics_counters == {('flair_helper_actions_total', (('action', 'lock'), ('result', 'success'))): 2}
+
+
+def test_histogram_buckets_are_cumulative():
+    fh.observe_metric('flair_helper_action_duration_seconds', 0.02, action='lock')
+    fh.observe_metric('flair_helper_action_duration_seconds', 3, action='lock')
+    rendered = fh.render_prometheus_metrics()
+    assert 'flair_helper_action_duration_seconds_bucket{action="lock",le="0.01"} 0' in rendered
+    assert 'flair_helper_action_duration_seconds_bucket{action="lock",le="0.025"} 1' in rendered
+    assert 'flair_helper_action_duration_seconds_bucket{action="lock",le="5"} 2' in rendered
+    assert 'flair_helper_action_duration_seconds_bucket{action="lock",le="+Inf"} 2' in rendered
+    assert 'flair_helper_action_duration_seconds_sum{action="lock"} 3.02' in rendered
+    assert 'flair_helper_action_duration_seconds_count{action="lock"} 2' in rendered
+
+
+def test_rendering_describes_each_metric_once_and_escapes_labels():
+    fh.increment_metric('flair_helper_mod_log_entries_total', action='editflair')
+    fh.increment_metric('flair_helper_mod_log_entries_total', action='say "hi"\n')
+    fh.set_gauge('flair_helper_pending_actions', 4)
+    lines = fh.render_prometheus_metrics().splitlines()
+    assert lines.count('# TYPE flair_helper_mod_log_entries_total counter') == 1
+    assert '# TYPE flair_helper_pending_actions gauge' in lines
+    assert 'flair_helper_mod_log_entries_total{action="say \\"hi\\"\\n"} 1.0' in lines
+    assert 'flair_helper_pending_actions 4' in lines
+
+
+def test_every_recorded_metric_is_described():
+    # Names passed to increment_metric/set_gauge/observe_metric anywhere in the bot must have a HELP/TYPE entry
+    with open(fh.__file__) as source_file:
+        source = source_file.read()
+    used = set(re.findall(r"(?:increment_metric|set_gauge|observe_metric)\('([a-z_]+)'", source))
+    assert used and used <= set(fh.metrics_descriptions)
+
+
+def test_a_handler_that_raises_is_counted_as_a_failure(monkeypatch):
+    monkeypatch.setattr(fh, 'is_action_completed', lambda submission_id, action: True)
+
+    async def failing_handler():
+        raise RuntimeError("Reddit said no")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(fh.run_action_handler('lock', 'abc123', failing_handler()))
+    assert fh.metrics_counters[fh.metric_key('flair_helper_actions_total', {'action': 'lock', 'result': 'failure'})] == 1
+    assert fh.metrics_histograms[fh.metric_key('flair_helper_action_duration_seconds', {'action': 'lock'})][2] == 1
@@ -0,0 +1,69 @@
+import asyncio
+import sqlite3
+from types import SimpleNamespace
+
+import asyncprawcore
+import pytest
+
+import flair_helper2_async as fh
+
+
+@pytest.fixture
+def configs_db(workdir):
+    fh.create_configs_database()
+
+
+class FakeSubreddit:
+    # A subreddit whose flair_helper wiki page raises the given exception, counting the fetches
+    def __init__(self, display_name, error):
+        self.display_name = display_name
+        self.fetches = 0
+        self.error = error
+        self.wiki = SimpleNamespace(get_page=self.get_page)
+
+    async def get_page(self, page_name):
+        self.fetches += 1
+        raise self.error
+
+
+def not_found():
+    return asyncprawcore.exceptions.NotFound(SimpleNamespace(status=404))
+
+
+def test_missing_config_is_cached_until_the_ttl_expires(configs_db, monkeypatch):
+    fh.record_missing_config('Pics', 'no page')
+    assert fh.get_missing_config_reason('pics') == 'no page'
+
+    conn = sqlite3.connect(fh.configs_db_filename)
+    conn.execute("UPDATE missing_configs SET checked_at = checked_at - ?", (fh.missing_config_ttl + 1,))
+    conn.commit()
+    conn.close()
+    assert fh.get_missing_config_reason('pics') is None
+
+
+def test_caching_a_config_clears_the_missing_entry(configs_db):
+    fh.record_missing_config('Pics', 'blank page')
+    asyncio.run(fh.cache_config('Pics', [{'GeneralConfiguration': {}}]))
+    assert fh.get_missing_config_reason('Pics') is None
+
+
+def test_sweeps_skip_a_missing_page_but_forced_reloads_fetch_it(configs_db):
+    subreddit = FakeSubreddit('Pics', not_found())
+    asyncio.run(fh.process_subreddit_config(None, subreddit, 'FlairHelperBot', 3, 0, 0, 0))
+    assert fh.get_missing_config_reason('Pics') == 'no page'
+
+    asyncio.run(fh.process_subreddit_config(None, subreddit, 'FlairHelperBot', 3, 0, 0, 0))
+    assert subreddit.fetches == 1
+
+    asyncio.run(fh.process_subreddit_config(None, subreddit, 'FlairHelperBot', 3, 0, 0, 0, force=True))
+    assert subreddit.fetches == 2
+
+
+def test_transient_errors_are_not_cached(configs_db, monkeypatch):
+    async def error_handler(error_message, notify_discord=False):
+        pass
+
+    monkeypatch.setattr(fh, 'error_handler', error_handler)
+    subreddit = FakeSubreddit('Pics', RuntimeError('connection reset'))
+    asyncio.run(fh.process_subreddit_config(None, subreddit, 'FlairHelperBot', 3, 0, 0, 0))
+    assert fh.get_missing_config_reason('Pics') is None
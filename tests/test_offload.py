@@ -0,0 +1,78 @@
+import asyncio
+import concurrent.futures
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import flair_helper2_async as fh
+
+LINK = 'https://www.reddit.com/r/pics/comments/abc123/title/'
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(fh, 'cpu_offload_executor', None)
+    monkeypatch.setattr(fh, 'cpu_offload_inflight', 0)
+    monkeypatch.setattr(fh, 'cpu_offload_threshold_bytes', 10)
+    monkeypatch.setattr(fh, 'cpu_offload_pool', 'thread')
+    yield
+    if fh.cpu_offload_executor is not None:
+        fh.cpu_offload_executor.shutdown()
+
+
+def calls(pool_name, kind='test'):
+    return fh.metrics_counters[fh.metric_key('flair_helper_cpu_offload_calls_total', {'kind': kind, 'pool': pool_name})]
+
+
+def fallbacks(kind='test'):
+    return fh.metrics_counters[fh.metric_key('flair_helper_cpu_offload_fallbacks_total', {'kind': kind})]
+
+
+def test_small_payloads_run_on_the_event_loop(pool):
+    before = calls('inline')
+    assert asyncio.run(fh.run_cpu_bound('test', lambda: threading.current_thread().name, size=9)) == 'MainThread'
+    assert calls('inline') - before == 1
+    assert fh.cpu_offload_executor is None  # Never started
+
+
+def test_large_payloads_run_in_the_pool(pool):
+    before = calls('thread')
+    assert asyncio.run(fh.run_cpu_bound('test', lambda: threading.current_thread().name, size=10)).startswith('fh2-offload')
+    assert calls('thread') - before == 1
+    assert fh.cpu_offload_inflight == 0
+
+
+def test_a_broken_pool_is_replaced_and_the_call_runs_in_a_thread(pool):
+    broken = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    broken.submit(lambda: None).result()
+    broken._broken = 'A worker died'  # What a failed ProcessPoolExecutor looks like to run_in_executor
+    fh.cpu_offload_executor = broken
+    before = fallbacks()
+    assert asyncio.run(fh.run_cpu_bound('test', lambda: threading.current_thread().name, size=10)).startswith('asyncio')  # The loop's default executor
+    assert fallbacks() - before == 1
+    assert fh.cpu_offload_executor is None  # A new pool is started for the next call
+    assert fh.cpu_offload_inflight == 0
+
+
+def test_the_process_pool_round_trips_usernotes(pool, monkeypatch):
+    monkeypatch.setattr(fh, 'cpu_offload_pool', 'process')
+    monkeypatch.setattr(fh, 'cpu_offload_workers', 1)
+    content = json.dumps({'ver': 6, 'constants': {'users': [], 'warnings': []}, 'blob': ''})
+
+    async def run():
+        updated = await fh.run_cpu_bound('usernotes_write', fh.build_updated_usernotes, content, 'someone', 'FH-Ban-7', LINK, 'ExampleMod', size=10)
+        return await fh.run_cpu_bound('usernotes_read', fh.read_usernote_ban_values, updated, 'someone', size=10)
+
+    assert asyncio.run(run()) == ['7']
+    assert isinstance(fh.cpu_offload_executor, concurrent.futures.ProcessPoolExecutor)
+
+
+def test_the_offload_module_does_not_import_the_bot():
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = "import sys, flair_helper2_offload; print(sorted({'asyncpraw', 'aiohttp', 'config', 'flair_helper2_async'} & set(sys.modules)))"
+    output = subprocess.run([sys.executable, '-c', script], cwd=repo, capture_output=True, text=True, check=True).stdout
+    assert output.strip() == '[]'
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import logging
+from datetime import datetime
+
+import asyncpraw
+import pytest
+
+import flair_helper2_async as fh
+from reddit_emulator import RedditEmulator, compress_usernotes, make_flair_helper_config
+
+
+def flair(**overrides):
+    details = make_flair_helper_config('pics', ['tmpl'])[1]
+    details.update(overrides)
+    return details
+
+
+def test_deleted_author_only_removes_and_locks():
+    decisions = fh.decide_flair_actions(flair(spoiler=True, ban={'enabled': True, 'duration': 3}), 'deleted', allow_nuke=True)
+    assert decisions[:2] == [('remove', None), ('lock', None)]
+    assert {action for action, reason in decisions[2:]} == {'modlogReason', 'spoiler', 'comment', 'usernote', 'ban'}
+    assert all(reason == 'author deleted' for action, reason in decisions[2:])
+
+
+def test_suspended_author_skips_the_author_actions():
+    decisions = dict(fh.decide_flair_actions(flair(ban={'enabled': True, 'duration': 3}), 'suspended', allow_nuke=True))
+    assert decisions['remove'] is None and decisions['lock'] is None
+    assert decisions['comment'] == decisions['ban'] == decisions['usernote'] == 'author suspended'
+
+
+def test_modlog_reason_rides_on_the_removal_and_nuke_needs_permission():
+    assert 'modlogReason' not in dict(fh.decide_flair_actions(flair(), 'active', allow_nuke=False))
+    assert dict(fh.decide_flair_actions(flair(remove=False), 'active', allow_nuke=False))['modlogReason'] is None
+    assert dict(fh.decide_flair_actions(flair(nuke={'enabled': True}), 'active', allow_nuke=False))['nuke'] == 'allow_ban_and_nuke is disabled'
+
+
+def test_ban_kinds():
+    assert fh.get_ban_kind('1,3,7') == 'escalating'
+    assert fh.get_ban_kind('') == fh.get_ban_kind(True) == 'permanent'
+    assert fh.get_ban_kind(7) == 'temporary'
+    assert fh.get_ban_kind(0) is None and fh.get_ban_kind('seven') is None
+
+
+def test_comment_is_skipped_on_old_posts_and_empty_bodies():
+    general_config = {'maxAgeForComment': 30}
+    now = datetime(2024, 6, 1)
+    created_utc = datetime(2024, 4, 1).timestamp()
+    assert fh.get_comment_skip_reason(general_config, flair(), created_utc, now).startswith('post is ')
+    assert fh.get_comment_skip_reason(general_config, flair(comment={'body': ' '}), now.timestamp(), now) == 'empty comment body'
+    assert fh.get_comment_skip_reason(general_config, flair(), now.timestamp(), now) is None
+
+
+@pytest.fixture
+def dry_run_log(workdir, monkeypatch):
+    for name in ('dry_run', 'configs_db_filename', 'actions_db_filename', 'shards_db_filename'):
+        monkeypatch.setattr(fh, name, getattr(fh, name))
+    monkeypatch.setattr(fh, 'dry_run_filename', str(workdir / 'dry_run.ndjson'))
+    monkeypatch.setattr(fh, 'dry_run_logger', logging.getLogger('planner_dry_run_under_test'))
+    fh.dry_run_logger.propagate = False
+    fh.enable_dry_run()
+    yield workdir / 'dry_run.ndjson'
+    for handler in fh.dry_run_logger.handlers[:]:
+        handler.close()
+        fh.dry_run_logger.removeHandler(handler)
+
+
+@pytest.mark.parametrize('overrides', [
+    {},
+    {'remove': False, 'lock': True, 'spoiler': True, 'comment': {'enabled': True, 'body': 'Locked.', 'lockComment': True, 'stickyComment': True}},
+    {'ban': {'enabled': True, 'duration': 7, 'message': 'Banned in {{subreddit}}', 'modNote': 'rule 1'},
+     'userFlair': {'enabled': True, 'text': 'Warned', 'cssClass': 'warn', 'templateId': ''},
+     'contributor': {'enabled': True, 'action': 'add'}},
+])
+def test_plan_matches_the_writes_process_flair_assignment_makes(dry_run_log, overrides):
+    # The bot runs against the emulator in dry run, so every Reddit write it would make is recorded; the planner must
+    # predict the same writes from a snapshot of the same submission
+    emulator = RedditEmulator(seed=1, rate_limit_window=1)  # A short window keeps asyncpraw from pacing its requests
+    config = make_flair_helper_config('pics', ['tmpl'])
+    config[1].update(overrides)
+    emulator.add_subreddit('pics', config, templates=['tmpl'])
+    emulator.set_wiki_page('pics', 'usernotes', json.dumps({'ver': 6, 'constants': {'users': [], 'warnings': []}, 'blob': compress_usernotes({})}), log=False)
+    submission_id = emulator.flair_submission('pics', 'tmpl')['target_fullname'][3:]
+
+    async def run():
+        fh.create_configs_database()
+        fh.create_actions_database()
+        await fh.cache_config('pics', config)
+        await emulator.start(port=0)
+        reddit = asyncpraw.Reddit(**emulator.praw_settings())
+        try:
+            post = await reddit.submission(submission_id)
+            author = {'name': post.author.name, 'id': None, 'is_suspended': False, 'previous_ban_durations': []}
+            plan = fh.plan_flair_actions(config, fh.submission_snapshot(post), author, 'ExampleMod')
+            await fh.process_flair_assignment(reddit, post, config, post.subreddit, 'ExampleMod')
+            return plan
+        finally:
+            await reddit.close()
+            await emulator.stop()
+
+    plan = asyncio.run(run())
+    written = [json.loads(line) for line in dry_run_log.read_text().splitlines()]
+    assert [(call['action'], call['endpoint'], call['target']) for call in written] == [(step['action'], step['endpoint'], step['target']) for step in plan['steps']]
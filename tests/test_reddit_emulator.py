@@ -0,0 +1,103 @@
+import asyncio
+
+import aiohttp
+import asyncpraw
+import asyncprawcore
+import pytest
+
+from reddit_emulator import BOT_USERNAME, RedditEmulator
+
+
+def run_with_reddit(emulator, scenario):
+    async def run():
+        await emulator.start(port=0)
+        reddit = asyncpraw.Reddit(**emulator.praw_settings())
+        try:
+            return await scenario(reddit)
+        finally:
+            await reddit.close()
+            await emulator.stop()
+    return asyncio.run(run())
+
+
+def test_asyncpraw_sees_the_emulated_account_and_mod_log():
+    emulator = RedditEmulator(seed=1)
+    emulator.populate(num_subreddits=2, templates_per_subreddit=1)
+    entry = emulator.flair_submission('fh_test_1')
+
+    async def scenario(reddit):
+        me = await reddit.user.me()
+        moderated = [subreddit.display_name async for subreddit in reddit.user.moderator_subreddits()]
+        subreddit = await reddit.subreddit('fh_test_1')
+        log = [log_entry async for log_entry in subreddit.mod.log(limit=10)]
+        return me.name, moderated, log
+
+    name, moderated, log = run_with_reddit(emulator, scenario)
+    assert name == BOT_USERNAME
+    assert moderated == ['fh_test_0', 'fh_test_1']
+    assert [(log_entry.action, log_entry.target_fullname) for log_entry in log] == [('editflair', entry['target_fullname'])]
+
+
+def test_mutating_calls_are_recorded_per_submission():
+    emulator = RedditEmulator(seed=1)
+    emulator.populate(num_subreddits=1, templates_per_subreddit=1)
+    submission_id = emulator.flair_submission('fh_test_0')['target_fullname'][3:]
+
+    async def scenario(reddit):
+        submission = await reddit.submission(submission_id)
+        await submission.mod.remove()
+        await submission.mod.lock()
+
+    run_with_reddit(emulator, scenario)
+    assert [action['endpoint'] for action in emulator.action_log] == ['api/remove', 'api/lock']
+    assert emulator.submissions[submission_id]['removed'] and emulator.submissions[submission_id]['locked']
+    assert submission_id in emulator.first_action_time
+
+
+def test_a_wiki_edit_from_a_stale_revision_is_a_conflict():
+    emulator = RedditEmulator(seed=1)
+    emulator.populate(num_subreddits=1, templates_per_subreddit=1)
+    emulator.set_wiki_page('fh_test_0', 'usernotes', '{"ver": 6}', log=False)
+
+    async def scenario(reddit):
+        subreddit = await reddit.subreddit('fh_test_0')
+        stale = await subreddit.wiki.get_page('usernotes')
+        await stale.edit(content='{"ver": 6, "blob": "toolbox"}', previous=stale.revision_id)
+        with pytest.raises(asyncprawcore.exceptions.Conflict):
+            await stale.edit(content='{"ver": 6, "blob": "bot"}', previous=stale.revision_id)
+
+    run_with_reddit(emulator, scenario)
+    assert emulator.subreddits['fh_test_0']['wiki']['usernotes']['content'] == '{"ver": 6, "blob": "toolbox"}'
+
+
+def test_rate_limit_headers_count_down_the_budget():
+    emulator = RedditEmulator(rate_limit_budget=5, rate_limit_window=600)
+    emulator.request_times.extend([100.0, 101.0])
+    used, headers = emulator.rate_limit_headers(110.0)
+    assert used == 2
+    assert headers == {'x-ratelimit-remaining': '3', 'x-ratelimit-used': '2', 'x-ratelimit-reset': '590'}
+    used, headers = emulator.rate_limit_headers(1000.0)  # The window has moved past both requests
+    assert used == 0 and headers['x-ratelimit-remaining'] == '5'
+
+
+def test_control_endpoints_flair_posts_and_report_stats():
+    emulator = RedditEmulator(seed=1)
+    emulator.populate(num_subreddits=2, templates_per_subreddit=1)
+
+    async def run():
+        port = await emulator.start(port=0)
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(f'http://127.0.0.1:{port}/_emulator/flair', json={'count': 3, 'subreddits': ['fh_test_0']}) as response:
+                    flaired = await response.json()
+                async with session.get(f'http://127.0.0.1:{port}/_emulator/stats') as response:
+                    stats = await response.json()
+        finally:
+            await emulator.stop()
+        return flaired, stats
+
+    flaired, stats = asyncio.run(run())
+    assert len(flaired['submission_ids']) == 3
+    assert sorted(stats['flair_events']) == sorted(flaired['submission_ids'])
+    assert stats['request_count'] == 0  # Control calls don't use the emulated rate budget
+    assert {emulator.submissions[submission_id]['subreddit'] for submission_id in flaired['submission_ids']} == {'fh_test_0'}
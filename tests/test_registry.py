@@ -0,0 +1,78 @@
+import asyncio
+from collections import defaultdict
+from types import SimpleNamespace
+
+import pytest
+
+import flair_helper2_async as fh
+
+
+class FakeReddit:
+    # Counts full moderator_subreddits() enumerations
+    def __init__(self, subreddit_names):
+        self.subreddit_names = subreddit_names
+        self.enumerations = 0
+        self.user = SimpleNamespace(moderator_subreddits=self.moderator_subreddits)
+
+    async def moderator_subreddits(self):
+        self.enumerations += 1
+        for name in self.subreddit_names:
+            yield SimpleNamespace(display_name=name, name=f't5_{name.lower()}', mod_permissions=['all'])
+
+
+@pytest.fixture
+def registry(workdir, monkeypatch):
+    reddit = FakeReddit(['Pics', 'videos', 'u_FlairHelperBot'])
+    monkeypatch.setattr(fh, 'shard_id', None)
+    monkeypatch.setattr(fh, 'reddit_clients', {'fh2_login': reddit})
+    monkeypatch.setattr(fh, 'account_usernames', {'fh2_login': 'FlairHelperBot'})
+    monkeypatch.setattr(fh, 'subreddit_accounts', {})
+    monkeypatch.setattr(fh, 'shard_mod_log_subreddits', defaultdict(dict))
+    monkeypatch.setattr(fh, 'shard_mod_log_changed', set())
+    fh.create_configs_database()
+    return reddit
+
+
+def test_only_the_first_lookup_enumerates_reddit(registry):
+    assert asyncio.run(fh.get_moderated_subreddit_names(registry)) == ['Pics', 'videos']
+    assert asyncio.run(fh.get_moderated_subreddit_names(registry)) == ['Pics', 'videos']
+    assert registry.enumerations == 1
+    assert fh.get_moderated_subreddits('fh2_login')[0] == {'display_name': 'Pics', 'id': 't5_pics', 'permissions': ['all'], 'has_config': False}
+
+
+def test_reconcile_reports_added_and_removed_subreddits(registry):
+    asyncio.run(fh.sync_moderated_subreddits(registry))
+    registry.subreddit_names = ['Pics', 'NewSub']
+    assert asyncio.run(fh.sync_moderated_subreddits(registry)) == (['NewSub'], ['videos'])
+    assert [row['display_name'] for row in fh.get_moderated_subreddits('fh2_login')] == ['NewSub', 'Pics']
+
+
+def test_has_config_follows_the_config_cache(registry):
+    fh.register_subreddit_account('Pics', registry)
+    asyncio.run(fh.cache_config('Pics', [{'GeneralConfiguration': {}}]))
+    assert fh.get_moderated_subreddits('fh2_login')[0]['has_config']
+    fh.set_subreddit_has_config('pics', False)
+    assert not fh.get_moderated_subreddits('fh2_login')[0]['has_config']
+
+
+def test_removal_drops_the_subreddit_from_the_shard_stream(registry, monkeypatch):
+    monkeypatch.setattr(fh, 'shard_count', 2)
+    monkeypatch.setattr(fh, 'shard_map', {'pics': 1})
+    monkeypatch.setattr(fh, 'shard_id', 1)
+    fh.register_subreddit_account('Pics', registry)
+    assert fh.shard_mod_log_subreddits['fh2_login'] == {'pics': 'Pics'}
+
+    fh.shard_mod_log_changed.clear()
+    fh.unregister_subreddit_account('Pics', registry)
+    assert fh.subreddit_accounts == {}
+    assert not fh.get_moderated_subreddits('fh2_login')
+    assert not fh.shard_mod_log_subreddits['fh2_login']
+    assert fh.shard_mod_log_changed == {'fh2_login'}
+
+
+def test_mod_log_removal_of_the_bot_unregisters_the_subreddit(registry):
+    fh.register_subreddit_account('Pics', registry)
+    entry = SimpleNamespace(id='x', action='removemoderator', subreddit='Pics', mod='someadmin', target_fullname=None,
+                            target_author='FlairHelperBot', details=None, description=None, created_utc=1.0)
+    asyncio.run(fh.handle_mod_log_entry(registry, 'FlairHelperBot', entry))
+    assert not fh.get_moderated_subreddits('fh2_login')
@@ -0,0 +1,142 @@
+import asyncio
+import time
+import zlib
+from collections import defaultdict
+from types import SimpleNamespace
+
+import pytest
+
+import flair_helper2_async as fh
+
+
+@pytest.fixture
+def two_shards(workdir, monkeypatch):
+    monkeypatch.setattr(fh, 'shard_count', 2)
+    monkeypatch.setattr(fh, 'shard_map', {'ownedbyone': 1, 'ownedbyzero': 0})
+    monkeypatch.setattr(fh, 'shard_id', 0)
+    monkeypatch.setattr(fh, 'shard_mod_log_subreddits', defaultdict(dict))
+    monkeypatch.setattr(fh, 'shard_mod_log_changed', set())
+    monkeypatch.setattr(fh, 'subreddit_accounts', {})
+    monkeypatch.setattr(fh, 'reddit_clients', {'fh2_login': ACCOUNT_REDDIT})
+    fh.create_shards_database()
+    fh.create_configs_database()
+
+
+ACCOUNT_REDDIT = object()  # Stands in for the account's asyncpraw.Reddit; only its identity is used
+
+
+def test_shard_assignment_is_crc32_of_the_lowercase_name(monkeypatch):
+    monkeypatch.setattr(fh, 'shard_count', 4)
+    monkeypatch.setattr(fh, 'shard_map', {})
+    for name in ['AskReddit', 'pics', 'some_small_sub']:
+        assert fh.get_shard_for_subreddit(name) == zlib.crc32(name.lower().encode('utf-8')) % 4
+    assert fh.get_shard_for_subreddit('ASKREDDIT') == fh.get_shard_for_subreddit('askreddit')
+
+
+def test_shard_map_overrides_the_hash_modulo_shard_count(monkeypatch):
+    monkeypatch.setattr(fh, 'shard_count', 4)
+    monkeypatch.setattr(fh, 'shard_map', {'pics': 1, 'videos': 6})
+    assert fh.get_shard_for_subreddit('Pics') == 1
+    assert fh.get_shard_for_subreddit('videos') == 2
+
+
+def test_every_subreddit_is_in_an_unsharded_bot(monkeypatch):
+    monkeypatch.setattr(fh, 'shard_id', None)
+    monkeypatch.setattr(fh, 'shard_count', 4)
+    assert fh.is_subreddit_in_shard('pics')
+    assert fh.is_primary_shard()
+
+
+def test_only_shard_zero_is_primary(monkeypatch):
+    monkeypatch.setattr(fh, 'shard_count', 2)
+    monkeypatch.setattr(fh, 'shard_id', 0)
+    assert fh.is_primary_shard()
+    monkeypatch.setattr(fh, 'shard_id', 1)
+    assert not fh.is_primary_shard()
+
+
+def test_invite_is_routed_to_the_owning_shard(two_shards, monkeypatch):
+    # Shard 0 accepts the invite; only shard 1, which owns the subreddit, adds it to its account's mod log stream
+    fh.register_subreddit_account('OwnedByOne', ACCOUNT_REDDIT)
+    assert asyncio.run(fh.process_shard_events(0)) == 0
+    assert fh.subreddit_accounts == {}
+    assert not fh.shard_mod_log_subreddits['fh2_login']
+
+    monkeypatch.setattr(fh, 'shard_id', 1)
+    assert asyncio.run(fh.process_shard_events(0)) == 1
+    assert fh.subreddit_accounts == {'ownedbyone': 'fh2_login'}
+    assert fh.shard_mod_log_subreddits['fh2_login'] == {'ownedbyone': 'OwnedByOne'}
+    assert fh.shard_mod_log_changed == {'fh2_login'}
+
+    fh.shard_mod_log_changed.clear()
+    assert asyncio.run(fh.process_shard_events(1)) == 1  # Each event is applied once
+    assert not fh.shard_mod_log_changed
+
+
+def test_invite_for_shard_zero_stays_in_shard_zero(two_shards):
+    fh.register_subreddit_account('OwnedByZero', ACCOUNT_REDDIT)
+    assert asyncio.run(fh.process_shard_events(0)) == 0
+    assert fh.shard_mod_log_subreddits['fh2_login'] == {'ownedbyzero': 'OwnedByZero'}
+
+
+def test_unsharded_invite_only_records_the_account(workdir, monkeypatch):
+    monkeypatch.setattr(fh, 'shard_id', None)
+    monkeypatch.setattr(fh, 'subreddit_accounts', {})
+    monkeypatch.setattr(fh, 'shard_mod_log_changed', set())
+    monkeypatch.setattr(fh, 'reddit_clients', {'fh2_login': ACCOUNT_REDDIT})
+    fh.create_configs_database()
+    fh.register_subreddit_account('pics', ACCOUNT_REDDIT)  # r/mod already covers it; there is no shards database to write to
+    assert fh.subreddit_accounts == {'pics': 'fh2_login'}
+    assert not fh.shard_mod_log_changed
+
+
+class FakeReddit:
+    # Just enough of asyncpraw for monitor_mod_log: moderator_subreddits() and per-stream mod log entries
+    def __init__(self, subreddit_names, entries_by_stream):
+        self.subreddit_names = subreddit_names
+        self.entries_by_stream = entries_by_stream
+        self.streams = []
+        self.user = SimpleNamespace(moderator_subreddits=self.moderator_subreddits)
+
+    async def moderator_subreddits(self):
+        for name in self.subreddit_names:
+            yield SimpleNamespace(display_name=name)
+
+    async def subreddit(self, name):
+        async def log(skip_existing, pause_after=None):
+            self.streams.append((name, skip_existing))
+            for entry in self.entries_by_stream.get(name, []):
+                yield entry
+            while True:
+                await asyncio.sleep(0.01)
+                yield None
+        return SimpleNamespace(mod=SimpleNamespace(stream=SimpleNamespace(log=log)))
+
+
+def editflair(entry_id, subreddit, created_utc):
+    return SimpleNamespace(id=entry_id, action='editflair', subreddit=subreddit, created_utc=created_utc, mod='somemod',
+                           target_fullname=f't3_{entry_id}', target_author='someone', details=None, description=None)
+
+
+def test_stream_is_rebuilt_when_a_subreddit_joins_the_shard(two_shards, monkeypatch):
+    monkeypatch.setattr(fh, 'shard_id', 1)
+    monkeypatch.setattr(fh, 'shard_map', {'alpha': 1, 'beta': 1})
+    monkeypatch.setattr(fh, 'last_startup_time_MonitorModLog', None)
+    handled = []
+    monkeypatch.setattr(fh, 'get_cached_config', lambda subreddit_name: handled.append(subreddit_name))
+    reddit = FakeReddit(['alpha'], {'alpha+beta': [editflair('old', 'alpha', 1.0), editflair('new', 'beta', time.time() + 5)]})
+    monkeypatch.setattr(fh, 'reddit_clients', {'fh2_login': reddit})
+
+    async def run():
+        monitor = asyncio.create_task(fh.monitor_mod_log(reddit, 'FlairHelperBot'))
+        while not reddit.streams:
+            await asyncio.sleep(0.01)
+        fh.register_subreddit_account('beta', reddit)
+        while len(reddit.streams) < 2 or not handled:
+            await asyncio.sleep(0.01)
+        monitor.cancel()
+
+    asyncio.run(asyncio.wait_for(run(), 10))
+    # The rebuilt stream reads the latest entries again, so it skips the ones from before it started
+    assert reddit.streams == [('alpha', True), ('alpha+beta', False)]
+    assert handled == ['beta']
@@ -0,0 +1,17 @@
+import json
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_optional_integrations_are_not_imported_with_the_bot(tmp_path):
+    # A fresh interpreter, since other tests import these modules themselves
+    script = ("import sys, json; sys.path.insert(0, sys.argv[1]); import flair_helper2_async as fh; "
+              "print(json.dumps({'modules': sorted(name for name in ('yaml', 'discord_webhook', 'telebot', 'psutil') if name in sys.modules), "
+              "'import_seconds': fh.import_seconds}))")
+    output = subprocess.run([sys.executable, '-c', script, REPO_DIR], cwd=tmp_path, capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.splitlines()[-1])
+    assert result['modules'] == []
+    assert 0 < result['import_seconds'] < 60
@@ -0,0 +1,110 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import flair_helper2_async as fh
+
+
+@pytest.fixture
+def sweep_state(workdir, monkeypatch):
+    monkeypatch.setattr(fh, 'shard_id', None)
+    monkeypatch.setattr(fh, 'subreddit_accounts', {})
+    monkeypatch.setattr(fh, 'pending_subreddit_activity', {})
+    monkeypatch.setattr(fh, 'buffered_mod_log_entries', fh.defaultdict(list))
+    monkeypatch.setattr(fh, 'config_sweep_loaded', set())
+    monkeypatch.setattr(fh, 'startup_state', 'ready')
+    errors = []
+
+    async def error_handler(error_message, notify_discord=False):
+        errors.append(error_message)
+
+    monkeypatch.setattr(fh, 'error_handler', error_handler)
+    fh.create_configs_database()
+    return errors
+
+
+def editflair(entry_id, subreddit):
+    return SimpleNamespace(id=entry_id, action='editflair', subreddit=subreddit, created_utc=1.0, mod='somemod',
+                           target_fullname=f't3_{entry_id}', target_author='someone', details=None, description=None)
+
+
+def test_activity_is_counted_in_memory_and_written_in_one_batch(sweep_state):
+    for name in ['Pics', 'pics', 'videos']:
+        fh.record_subreddit_activity(name)
+    assert {name: events for name, (events, _) in fh.pending_subreddit_activity.items()} == {'pics': 2, 'videos': 1}
+
+    fh.flush_subreddit_activity()
+    assert not fh.pending_subreddit_activity
+    fh.record_subreddit_activity('pics')
+    # Reading the activity saves whatever is still pending first, adding to the stored counts
+    assert {name: events for name, (events, _) in fh.get_subreddit_activity().items()} == {'pics': 3, 'videos': 1}
+
+
+def test_flair_edit_is_buffered_while_its_config_loads(sweep_state, monkeypatch):
+    monkeypatch.setattr(fh, 'startup_state', 'loading')
+    monkeypatch.setattr(fh, 'get_cached_config', lambda subreddit_name: None)
+    reddit = object()
+
+    asyncio.run(fh.handle_mod_log_entry(reddit, 'FlairHelperBot', editflair('abc', 'Pics')))
+    assert [entry.id for _, _, entry, _ in fh.buffered_mod_log_entries['pics']] == ['abc']
+    assert not fh.pending_subreddit_activity  # Counted once the buffered entry is handled
+
+    fh.config_sweep_loaded.add('pics')
+    asyncio.run(fh.handle_mod_log_entry(reddit, 'FlairHelperBot', editflair('def', 'Pics')))
+    assert len(fh.buffered_mod_log_entries['pics']) == 1
+
+
+def test_a_failing_buffered_entry_does_not_drop_the_rest(sweep_state, monkeypatch):
+    handled = []
+
+    async def handle_mod_log_entry(reddit, bot_username, log_entry, ingested_at=None):
+        if log_entry.id == 'bad':
+            raise ValueError('boom')
+        handled.append((log_entry.id, ingested_at))
+
+    monkeypatch.setattr(fh, 'handle_mod_log_entry', handle_mod_log_entry)
+    for entry_id, ingested_at in [('bad', 1.0), ('good', 2.0)]:
+        fh.buffer_mod_log_entry(None, 'FlairHelperBot', editflair(entry_id, 'pics'), ingested_at)
+
+    asyncio.run(fh.flush_buffered_mod_log_entries('Pics'))
+    assert handled == [('good', 2.0)]  # Handled with its original ingest time
+    assert len(sweep_state) == 1 and 'boom' in sweep_state[0]
+    assert not fh.buffered_mod_log_entries
+
+
+class FakeReddit:
+    def __init__(self, subreddit_names):
+        self.subreddit_names = subreddit_names
+        self.user = SimpleNamespace(moderator_subreddits=self.moderator_subreddits)
+
+    async def moderator_subreddits(self):
+        for name in self.subreddit_names:
+            yield SimpleNamespace(display_name=name)
+
+    async def subreddit(self, name):
+        return SimpleNamespace(display_name=name)
+
+
+def test_sweep_loads_buffered_then_uncached_then_by_activity(sweep_state, monkeypatch):
+    reddit = FakeReddit(['alpha', 'beta', 'gamma', 'zeta', 'u_FlairHelperBot'])
+    monkeypatch.setattr(fh, 'reddit_clients', {'fh2_login': reddit})
+    monkeypatch.setattr(fh, 'account_usernames', {'fh2_login': 'FlairHelperBot'})
+    monkeypatch.setattr(fh, 'get_stored_subreddits', lambda: ['alpha'])
+    order = []
+
+    async def process_subreddit_config(account_reddit, subreddit, bot_username, *args):
+        order.append(subreddit.display_name)
+
+    async def handle_mod_log_entry(reddit, bot_username, log_entry, ingested_at=None):
+        order.append(f'handled {log_entry.id}')
+
+    monkeypatch.setattr(fh, 'process_subreddit_config', process_subreddit_config)
+    monkeypatch.setattr(fh, 'handle_mod_log_entry', handle_mod_log_entry)
+    fh.record_subreddit_activity('gamma')
+    fh.record_subreddit_activity('gamma')
+    fh.buffer_mod_log_entry(reddit, 'FlairHelperBot', editflair('waiting', 'zeta'), 1.0)
+
+    asyncio.run(fh.run_config_sweep(concurrency=1))
+    assert order == ['zeta', 'handled waiting', 'gamma', 'beta', 'alpha']
+    assert fh.startup_state == 'ready'
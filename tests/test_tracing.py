@@ -0,0 +1,66 @@
+import asyncio
+import json
+import logging
+
+import pytest
+
+import flair_helper2_async as fh
+
+
+@pytest.fixture
+def trace_file(workdir, monkeypatch):
+    monkeypatch.setattr(fh, 'tracing_enabled', True)
+    monkeypatch.setattr(fh, 'traces_filename', str(workdir / 'traces.ndjson'))
+    monkeypatch.setattr(fh, 'traces_logger', logging.getLogger('traces_under_test'))
+    fh.traces_logger.propagate = False
+    yield workdir / 'traces.ndjson'
+    for handler in fh.traces_logger.handlers[:]:
+        handler.close()
+        fh.traces_logger.removeHandler(handler)
+
+
+def test_trace_records_queue_wait_and_handler_times(trace_file, monkeypatch):
+    monkeypatch.setattr(fh, 'is_action_completed', lambda submission_id, action: True)
+
+    async def handler():
+        pass
+
+    async def process():
+        trace = fh.start_trace('abc123', 'pics', 'somemod', created_utc=1000.0, ingested_at=1001.0)
+        trace['attempts'] += 1
+        await fh.run_action_handler('lock', 'abc123', handler())
+        fh.finish_trace(trace)
+
+    asyncio.run(process())
+    trace = json.loads(trace_file.read_text())
+    assert trace['submission_id'] == 'abc123' and trace['attempts'] == 1
+    assert trace['queue_wait'] == trace['picked_up_at'] - 1001.0
+    assert [handler['action'] for handler in trace['handlers']] == ['lock']
+    assert trace['handlers'][0]['start'] <= trace['handlers'][0]['end']
+    assert trace['end_to_end'] == trace['completed_at'] - 1000.0
+    assert fh.current_trace.get() is None
+
+
+def test_nothing_is_written_with_tracing_disabled(trace_file, monkeypatch):
+    monkeypatch.setattr(fh, 'tracing_enabled', False)
+    fh.finish_trace(fh.start_trace('abc123', 'pics', 'somemod'))
+    assert not trace_file.exists()
+
+
+def test_summary_reports_percentiles_per_subreddit_and_action(workdir):
+    shard_file = workdir / 'traces_shard1.ndjson'
+    lines = [json.dumps({'subreddit': 'pics', 'created_utc': 100.0, 'handlers': [{'action': 'lock', 'start': 100.5, 'end': 100.0 + latency}]})
+             for latency in range(1, 101)]
+    lines.append('not json')
+    lines.append(json.dumps({'subreddit': 'pics', 'created_utc': None, 'handlers': [{'action': 'lock', 'end': 5.0}]}))
+    shard_file.write_text("\n".join(lines) + "\n")
+
+    summary = fh.summarize_traces([str(shard_file), str(workdir / 'missing.ndjson')])
+    assert summary['subreddits']['pics'] == {'count': 100, 'p50': 50.0, 'p95': 95.0, 'p99': 99.0}
+    assert summary['actions']['lock']['count'] == 100
+
+
+def test_percentile_uses_nearest_rank():
+    assert fh.percentile([], 0.5) is None
+    assert fh.percentile([1, 2, 3, 4], 0.5) == 2
+    assert fh.percentile([1, 2, 3, 4], 0.99) == 4
@@ -0,0 +1,247 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import asyncprawcore
+import pytest
+
+import flair_helper2_async as fh
+import flair_helper2_offload as offload
+from flair_helper2_offload import (
+    USERNOTE_BAN_HISTORY_PREFIX,
+    compact_user_notes,
+    compact_usernotes,
+    compress_notes,
+    decompress_notes,
+    find_user_notes,
+    format_ban_history,
+    parse_ban_history,
+    read_usernote_ban_values,
+)
+
+
+LINK = 'https://www.reddit.com/r/pics/comments/abc123/title/'
+
+
+def note(text, timestamp, link='l,abc123'):
+    return {'n': text, 't': timestamp, 'm': 0, 'l': link, 'w': 0}
+
+
+def usernotes_page(notes):
+    return json.dumps({'ver': 6, 'constants': {'users': ['mod'], 'warnings': ['flair_helper_note']}, 'blob': compress_notes(notes)})
+
+
+# Ban history summaries
+
+@pytest.mark.parametrize('ban_values', [
+    ['3'],
+    ['3', '7', '30'],
+    ['3', '3', '7', '30', '30', '30', 'permanent'],
+    ['7', '3', '7'],
+])
+def test_ban_history_round_trip(ban_values):
+    assert parse_ban_history(format_ban_history(ban_values)) == ban_values
+
+
+def test_ban_history_counts_repeats():
+    assert format_ban_history(['3', '7', '7', '30']) == USERNOTE_BAN_HISTORY_PREFIX + '3,7x2,30'
+    assert parse_ban_history(USERNOTE_BAN_HISTORY_PREFIX + '3, 7x2,30') == ['3', '7', '7', '30']
+
+
+# compact_user_notes
+
+def test_compact_leaves_recent_notes_alone():
+    user_notes = [note('[FH] FH-Ban-3', 100), note('[FH] FH-Ban-7', 200)]
+    assert compact_user_notes(user_notes, expire_before=50, max_notes=5) == (user_notes, 0)
+
+
+def test_compact_folds_expired_bans_into_a_summary():
+    human = note('spam in modmail', 10)
+    user_notes = [note('[FH] FH-Ban-3', 100), human, note('[FH] FH-Ban-7', 200), note('[FH] FH-Ban-30', 300)]
+    kept, compacted = compact_user_notes(user_notes, expire_before=250)
+    assert compacted == 2
+    assert kept[1:] == [human, user_notes[3]]  # Human notes are never touched
+    assert kept[0]['n'] == USERNOTE_BAN_HISTORY_PREFIX + '3,7'  # In place of the oldest note it folds
+    assert kept[0]['t'] == 200
+
+
+def test_compact_expiry_and_max_notes_together():
+    user_notes = [note('[FH] FH-Ban-3', 100), note('[FH] FH-Ban-7', 200), note('[FH] Flair removed', 300),
+                  note('[FH] FH-Ban-30', 400), note('[FH] FH-Ban-30', 500)]
+    # Expiry takes the note at 100; max_notes=2 keeps the two newest, so the ones at 200 and 300 go too
+    kept, compacted = compact_user_notes(user_notes, expire_before=150, max_notes=2)
+    assert compacted == 3
+    assert [n['n'] for n in kept] == [USERNOTE_BAN_HISTORY_PREFIX + '3,7', '[FH] FH-Ban-30', '[FH] FH-Ban-30']
+
+
+def test_compact_extends_an_existing_summary():
+    user_notes = [note(USERNOTE_BAN_HISTORY_PREFIX + '3x2', 50), note('[FH] FH-Ban-7', 100), note('[FH] FH-Ban-30', 200)]
+    kept, compacted = compact_user_notes(user_notes, max_notes=1)
+    assert compacted == 1
+    assert [n['n'] for n in kept] == [USERNOTE_BAN_HISTORY_PREFIX + '3x2,7', '[FH] FH-Ban-30']
+
+
+def test_compact_keeps_every_ban_value():
+    user_notes = [note(f'[FH] FH-Ban-{value}', t) for t, value in enumerate(['3', '7', '7', '30', 'permanent'], 1)]
+    page = usernotes_page({'someuser': {'ns': user_notes}})
+    compacted_page, stats = compact_usernotes(page, max_notes=1)
+    assert stats['notes'] == 4
+    assert read_usernote_ban_values(compacted_page, 'someuser') == read_usernote_ban_values(page, 'someuser')
+
+
+# compact_usernotes
+
+def test_compact_usernotes_removes_users_left_without_notes():
+    page = usernotes_page({
+        'gone': {'ns': [note('[FH] Flair removed', 100)]},
+        'kept': {'ns': [note('[FH] FH-Ban-3', 100), note('human note', 100)]},
+    })
+    compacted_page, stats = compact_usernotes(page, expire_before=200)
+    assert stats['notes'] == 2
+    assert stats['users_removed'] == 1
+    assert stats['blob_bytes_after'] == len(json.loads(compacted_page)['blob'])
+    notes = decompress_notes(json.loads(compacted_page)['blob'])
+    assert 'gone' not in notes
+    assert [n['n'] for n in notes['kept']['ns']] == [USERNOTE_BAN_HISTORY_PREFIX + '3', 'human note']
+
+
+def test_compact_usernotes_unchanged_page():
+    page = usernotes_page({'someuser': {'ns': [note('[FH] FH-Ban-3', 100)]}})
+    assert compact_usernotes(page, expire_before=50)[0] is None
+    assert compact_usernotes(json.dumps({'ver': 6}))[0] is None
+
+
+# find_user_notes
+
+def many_users_notes(count=500):
+    return {f'user{i}': {'ns': [note(f'[FH] FH-Ban-{i}', i), note('note "with" quotes, and é', i)]} for i in range(count)}
+
+
+def test_find_user_notes_matches_full_decode():
+    notes = many_users_notes()
+    blob = compress_notes(notes)
+    for username in ['user0', 'user1', 'user250', 'user499']:
+        assert find_user_notes(blob, username) == notes[username]['ns']
+    assert find_user_notes(blob, 'user5000') is None
+    assert find_user_notes(blob, 'FH-Ban-3') is None  # Note text is never mistaken for a key
+
+
+@pytest.mark.parametrize('chunk_size', [4, 8, 12, 64])
+def test_find_user_notes_key_split_across_chunks(monkeypatch, chunk_size):
+    # Chunks this small split every key, and every multi-byte character, across decode steps
+    monkeypatch.setattr(offload, 'USERNOTES_STREAM_CHUNK_SIZE', chunk_size)
+    monkeypatch.setattr(offload, 'USERNOTES_STREAM_MAX_OUTPUT', 7)
+    notes = many_users_notes(50)
+    blob = compress_notes(notes)
+    for username in ['user0', 'user17', 'user49']:
+        assert find_user_notes(blob, username) == notes[username]['ns']
+    assert find_user_notes(blob, 'user50') is None
+
+
+def test_find_user_notes_bad_blob():
+    assert find_user_notes('not base64!', 'someuser') is None
+
+
+# read_usernote_ban_values
+
+def test_read_usernote_ban_values_oldest_first():
+    page = usernotes_page({'someuser': {'ns': [note('[FH] FH-Ban-3', 100), note('human note', 150), note('[FH] FH-Ban-permanent', 200)]},
+                           'other': {'ns': [note('[FH] FH-Ban-30', 100)]}})
+    assert read_usernote_ban_values(page, 'someuser') == ['3', 'permanent']
+    assert read_usernote_ban_values(page, 'nobody') == []
+    assert read_usernote_ban_values(json.dumps({'ver': 6}), 'someuser') == []
+
+
+# Fake usernotes wiki page
+
+class FakeWikiPage:
+    # Each read returns a snapshot of the page, like asyncpraw's WikiPage; a save from a stale revision is a 409 Conflict
+    def __init__(self, content_md):
+        self.content_md = content_md
+        self.revision = 0
+        self.edits = []
+        self.interleaved_saves = []  # Pages another editor (Toolbox) saves just after a read
+
+    async def read(self):
+        snapshot = SimpleNamespace(content_md=self.content_md, revision_id=f'rev{self.revision}', edit=self.edit)
+        if self.interleaved_saves:
+            self.save(self.interleaved_saves.pop(0))
+        return snapshot
+
+    def save(self, content):
+        self.content_md = content
+        self.revision += 1
+
+    async def edit(self, content, reason=None, previous=None):
+        if previous is not None and previous != f'rev{self.revision}':
+            raise asyncprawcore.exceptions.Conflict(SimpleNamespace(status=409))
+        self.edits.append((content, reason))
+        self.save(content)
+
+
+def fake_subreddit(page):
+    async def get_page(name):
+        assert name == 'usernotes'
+        return await page.read()
+    return SimpleNamespace(display_name='pics', wiki=SimpleNamespace(get_page=get_page))
+
+
+# Compacting a subreddit's usernotes page
+
+@pytest.mark.parametrize('general_configuration, policy', [
+    ({'usernote_expire_days': 365, 'usernote_max_notes': '10'}, (365, 10)),
+    ({'usernote_expire_days': -5}, (0, 0)),
+    ({'usernote_max_notes': 'lots'}, (0, 0)),
+    ({}, (0, 0)),
+])
+def test_the_compaction_policy_comes_from_the_general_configuration(general_configuration, policy):
+    assert fh.get_usernote_compaction_policy([{'GeneralConfiguration': general_configuration}]) == policy
+    assert fh.get_usernote_compaction_policy(None) == (0, 0)
+
+
+def test_a_subreddits_usernotes_are_compacted_and_written_back():
+    old, recent = time.time() - 400 * 86400, time.time()
+    page = FakeWikiPage(usernotes_page({'someuser': {'ns': [note('[FH] FH-Ban-3', old), note('[FH] FH-Ban-7', recent)]}}))
+    stats = asyncio.run(fh.compact_subreddit_usernotes(fake_subreddit(page), 365, 0))
+    assert stats['notes'] == 1
+    [(content, reason)] = page.edits
+    assert reason == '1 Flair Helper notes compacted via flair_helper2'
+    assert read_usernote_ban_values(content, 'someuser') == ['3', '7']
+
+    asyncio.run(fh.compact_subreddit_usernotes(fake_subreddit(page), 365, 0))
+    assert len(page.edits) == 1  # Nothing left to compact, so the page is not edited again
+
+
+def test_a_compaction_that_conflicts_leaves_the_page_alone():
+    page = FakeWikiPage(usernotes_page({'someuser': {'ns': [note('[FH] FH-Ban-3', 100), note('[FH] FH-Ban-7', 200)]}}))
+    toolbox_page = usernotes_page({'someuser': {'ns': [note('[FH] FH-Ban-3', 100), note('[FH] FH-Ban-7', 200), note('toolbox note', 300)]}})
+    page.interleaved_saves.append(toolbox_page)
+    assert asyncio.run(fh.compact_subreddit_usernotes(fake_subreddit(page), 0, 1)) is None
+    assert not page.edits and page.content_md == toolbox_page
+
+
+# Adding a note when the page is saved concurrently
+
+def writes(result):
+    return fh.metrics_counters[fh.metric_key('flair_helper_usernotes_writes_total', {'result': result})]
+
+
+def test_a_conflicting_save_is_retried_on_the_newer_page_after_a_random_wait(monkeypatch):
+    sleeps = []
+
+    async def sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(fh.asyncio, 'sleep', sleep)
+    page = FakeWikiPage(usernotes_page({'someuser': {'ns': [note('[FH] FH-Ban-3', 100)]}}))
+    page.interleaved_saves += [usernotes_page({'someuser': {'ns': [note('[FH] FH-Ban-3', 100), note(f'toolbox note {i}', 200 + i)]}})
+                               for i in range(2)]
+    before = {result: writes(result) for result in ('written', 'conflict')}
+
+    asyncio.run(fh.update_usernotes(fake_subreddit(page), 'someuser', 'FH-Ban-7', LINK, 'ExampleMod', 'flair_helper_note'))
+    assert {result: writes(result) - before[result] for result in before} == {'written': 1, 'conflict': 2}
+    assert len(sleeps) == 2 and all(fh.USERNOTES_CONFLICT_RETRY_DELAY[0] <= delay <= fh.USERNOTES_CONFLICT_RETRY_DELAY[1] for delay in sleeps)
+    [(content, _)] = page.edits
+    notes = decompress_notes(json.loads(content)['blob'])['someuser']['ns']
+    assert [n['n'] for n in notes] == ['[FH] FH-Ban-3', 'toolbox note 1', '[FH] FH-Ban-7']  # The last Toolbox save survives
@@ -0,0 +1,61 @@
+import asyncio
+from collections import OrderedDict
+
+import pytest
+import yaml
+
+import flair_helper2_async as fh
+
+YAML_CONFIG = """
+header: Hello
+flairs:
+  abc123: Rule 1
+remove:
+  abc123: true
+ban:
+  abc123: 'Banned: rule 1!'
+"""
+
+
+@pytest.fixture
+def conversions(monkeypatch):
+    monkeypatch.setattr(fh, 'yaml_conversion_cache', OrderedDict())
+    converted = []
+    load_yaml_config_json = fh.load_yaml_config_json
+
+    def counting_load_yaml_config_json(wiki_content):
+        converted.append(wiki_content)
+        return load_yaml_config_json(wiki_content)
+
+    monkeypatch.setattr(fh, 'load_yaml_config_json', counting_load_yaml_config_json)
+    return converted
+
+
+def test_the_bots_loader_matches_safe_load():
+    assert fh.load_yaml(YAML_CONFIG) == yaml.safe_load(YAML_CONFIG)
+
+
+def test_the_same_page_is_converted_once_and_returned_as_a_copy(conversions):
+    first = asyncio.run(fh.parse_yaml_config(YAML_CONFIG))
+    first[0]['GeneralConfiguration']['header'] = 'Changed by the caller'
+    second = asyncio.run(fh.parse_yaml_config(YAML_CONFIG))
+    assert len(conversions) == 1
+    assert second == fh.convert_yaml_to_json(yaml.safe_load(YAML_CONFIG))
+
+
+def test_the_least_recently_used_page_is_evicted(conversions, monkeypatch):
+    monkeypatch.setattr(fh, 'yaml_conversion_cache_size', 2)
+    pages = [YAML_CONFIG.replace('Hello', greeting) for greeting in ['One', 'Two', 'Three']]
+    for page in [pages[0], pages[1], pages[0], pages[2]]:  # pages[1] is now the least recently used
+        asyncio.run(fh.parse_yaml_config(page))
+    asyncio.run(fh.parse_yaml_config(pages[0]))
+    assert len(conversions) == 3
+    asyncio.run(fh.parse_yaml_config(pages[1]))
+    assert len(conversions) == 4
+
+
+def test_invalid_yaml_raises_and_is_not_cached(conversions):
+    for _ in range(2):
+        with pytest.raises(yaml.YAMLError):
+            asyncio.run(fh.parse_yaml_config('flairs: [unclosed'))
+    assert not fh.yaml_conversion_cache